@@ -5,6 +5,7 @@
 from . import frontend, backend, ir, passes, library, _mlir
 from .customize import customize, Partition
 from .backend.llvm import invoke_mlir_parser, LLVMModule
+from .backend.cpp import CPPModule
 from .backend.hls import HLSModule
 from .backend.ip import IPModule
 from .dsl import *
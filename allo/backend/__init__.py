@@ -1,10 +1,11 @@
 # Copyright Allo authors. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 import os
-from . import ai_engine, llvm, hls, ip
+from . import ai_engine, llvm, cpp, hls, ip
 
 try:
     from . import experimental
-    from .experimental import AIE_MLIRModule
+    from .experimental import AIE_MLIRModule, AIE_MLIRPipeline
 except ImportError:
     AIE_MLIRModule = None
+    AIE_MLIRPipeline = None
@@ -27,6 +27,7 @@ from ..utils import get_dtype_and_shape_from_type
 from .utils import format_str, format_code
 from .vitis import ctype_map
 from ..passes import analyze_read_write_patterns
+from ..memory import get_dma_bds
 
 
 host_header = """
@@ -539,100 +540,6 @@ def get_memref_type_str(ele_type, shape):
     return f"memref<{'x'.join(map(str, shape))}x{ele_type}>"
 
 
-def calculate_tensor_access(shape, partition, device_mesh):
-    """
-    Calculate the size and stride for tensor access based on shape and partition method.
-    Layout visualization tool:
-    https://andreroesti.com/data-layout-viz/data_layout.html
-
-    Parameters:
-    -----------
-    shape : tuple
-        The shape of the tensor (1D or 2D)
-    partition : tuple(str, int)
-        The partition method for each dimension:
-        - 'S': Sharded (distributed across devices)
-        - 'R': Replicated (copied to each device)
-    device_mesh : tuple, optional
-        The mesh of devices (default: (2, 2))
-
-    Returns:
-    --------
-    tuple
-        A tuple containing three lists: (device_dims, size, stride)
-        device_dims stands for the device dimension in the size list.
-        For example, in the 2x2 GEMM case, the device_dims for 2x2x4x4 will be [0, 1].
-    """
-    # Handle 1D tensor case
-    partition_str = "".join([p[0] for p in partition])
-    if len(shape) == 1:
-        if partition_str == "S":
-            # For 1D tensor with "S", shard across all devices
-            total_devices = device_mesh[0]
-            shard_size = shape[0] // total_devices
-            device_dims = [2]
-            size = [1, 1, total_devices, shard_size]
-            stride = [0, 0, shard_size, 1]
-        elif partition_str == "R":
-            # For 1D tensor with "R", replicate across all devices
-            total_devices = device_mesh[0]
-            device_dims = []
-            size = [1, 1, 1, shape[0]]
-            stride = [0, 0, 0, 1]
-        else:
-            raise ValueError(f"Unsupported partition {partition_str} for 1D tensor.")
-
-        return device_dims, size, stride
-
-    # Handle 2D tensor case
-    if len(shape) == 2:
-        m, n = shape
-        if len(device_mesh) == 1:
-            a, b = 1, device_mesh[0]
-        elif len(device_mesh) == 2:
-            if partition[0][0] == "S":
-                partition[1] = (partition[1][0], 1 - partition[0][1])
-            elif partition[1][0] == "S":  # partition[0][0] == "R"
-                partition[0] = (partition[0][0], 1 - partition[1][1])
-            else:
-                partition[0] = (partition[0], 1)
-                partition[1] = (partition[1], 0)
-            a, b = device_mesh[-partition[0][1] - 1], device_mesh[-partition[1][1] - 1]
-        else:
-            a, b = device_mesh[-partition[0][1] - 1], device_mesh[-partition[1][1] - 1]
-
-        if partition_str == "SS":
-            # Both dimensions sharded
-            device_dims = [0, 1]
-            size = [a, b, m // a, n // b]
-            stride = [(m // a) * n, n // b, n, 1]
-
-        elif partition_str == "SR":
-            # First dim sharded across all devices, second replicated
-            total_devices = a * b
-            device_dims = [1]
-            size = [1, total_devices, m // total_devices, n]
-            stride = [0, (m // total_devices) * n, n, 1]
-
-        elif partition_str == "RS":
-            # First dim replicated, second sharded across second dim of mesh
-            device_dims = [1]
-            size = [1, b, m, n // b]
-            stride = [(m * n) // (a * b), n // b, n, 1]
-
-        elif partition_str == "RR":
-            # Both dimensions replicated
-            total_devices = a * b
-            device_dims = []
-            size = [1, 1, m, n]
-            stride = [0, 0, n, 1]
-        else:
-            raise ValueError(f"Unsupported partition {partition_str} for 2D tensor.")
-
-        return device_dims, size, stride
-    raise ValueError(f"Unsupported shape {shape} or partition {partition}.")
-
-
 def extract_numbers(input_string):
     parts = input_string.split("_")
     numbers = []
@@ -642,152 +549,258 @@ def extract_numbers(input_string):
     return tuple(numbers)
 
 
-def map_kernels_to_device_mesh(kernel_shapes, device_shape):
+def get_kernel_footprints(kernel_shape, device_shape):
+    """
+    Enumerates the ways to lay out the instances of a kernel on the device mesh.
+
+    An N-D kernel shape is flattened into every 2D grid (rows, cols) by splitting its
+    dimensions into two groups, and each grid is placed either as is or rotated.
+    The instances are numbered in row-major order of the kernel shape, and the
+    unrotated grid that keeps the first dimension as rows comes first.
+
+    Args:
+        kernel_shape (list): The shape of the kernel mapping.
+        device_shape (list): The shape of the device mesh [rows, cols].
+
+    Returns:
+        list: Each footprint is a tuple of (row, col) offsets, one per instance.
+    """
+    footprints = []
+    for split in list(range(1, len(kernel_shape) + 1)) + [0]:
+        rows = int(np.prod(kernel_shape[:split]))
+        cols = int(np.prod(kernel_shape[split:]))
+        num = rows * cols
+        for footprint in (
+            tuple((k // cols, k % cols) for k in range(num)),
+            tuple((k % cols, k // cols) for k in range(num)),
+        ):
+            height = max(r for r, _ in footprint) + 1
+            width = max(c for _, c in footprint) + 1
+            if (
+                height <= device_shape[0]
+                and width <= device_shape[1]
+                and footprint not in footprints
+            ):
+                footprints.append(footprint)
+    return footprints
+
+
+def get_placement_cost(placement, streams=None, io_loads=None):
+    """
+    Computes the cost of a kernel placement.
+
+    Args:
+        placement (dict): A dictionary mapping instance names to device indices.
+        streams (list): (producer, consumer) instance names of each stream.
+        io_loads (dict): The number of global I/O FIFOs of each instance.
+
+    Returns:
+        dict: The stream hop distance (Manhattan distance between the producer and the
+              consumer of every stream), the I/O contention (the largest number of global
+              I/O FIFOs that go through one column of the mesh), and their sum.
+    """
+    hops = 0
+    for src, dst in streams or []:
+        if src in placement and dst in placement:
+            hops += abs(placement[src][0] - placement[dst][0]) + abs(
+                placement[src][1] - placement[dst][1]
+            )
+    column_loads = defaultdict(int)
+    for name, load in (io_loads or {}).items():
+        if name in placement:
+            column_loads[placement[name][0]] += load
+    contention = max(column_loads.values(), default=0)
+    return {
+        "stream_hops": hops,
+        "io_contention": contention,
+        "total": hops + contention,
+    }
+
+
+def map_kernels_to_device_mesh(
+    kernel_shapes,
+    device_shape,
+    instances=None,
+    streams=None,
+    io_loads=None,
+    max_nodes=20000,
+):
     """
     Maps multiple kernels to a device mesh without overlapping.
 
+    The placement is searched with branch-and-bound over all the flattenings and rotations
+    of every kernel (see `get_kernel_footprints`), minimizing `get_placement_cost`.
+    The greedy placement, which puts each kernel at its cheapest position, gives the initial
+    bound and is kept if the search exceeds `max_nodes` without finding a better placement.
+
     Args:
         kernel_shapes (dict): A dictionary mapping kernel names to their shapes.
                              For 3D kernels: [dim1, dim2, dim3]
                              For 2D kernels: [rows, cols]
                              For 1D kernels: [length]
         device_shape (list): The shape of the device mesh [rows, cols].
+        instances (dict): A dictionary mapping kernel names to the names of their instances,
+                          which are used by `streams` and `io_loads`.
+                          Defaults to "{kernel}_{index}".
+        streams (list): (producer, consumer) instance names of the streams between kernels.
+        io_loads (dict): The number of global I/O FIFOs of each instance.
+        max_nodes (int): The maximum number of search nodes.
 
     Returns:
-        dict: A dictionary mapping kernel names to their occupied device indices.
+        tuple: A dictionary mapping kernel names to their occupied device indices,
+               and the cost of the placement.
     """
-    # Initialize the device mesh with 0s (unoccupied)
     rows, cols = device_shape
-    device_mesh = [[0 for _ in range(cols)] for _ in range(rows)]
-
-    # Dictionary to store the mapping of kernels to device indices
-    kernel_to_indices = {}
-
-    # Process each kernel
-    for kernel_name, kernel_shape in kernel_shapes.items():
-        # If kernel shape is 3D (e.g., [2, 2, 2])
-        if len(kernel_shape) == 3:
-            # Try both flattening options (e.g., 2x2x2 -> 4x2 or 2x4)
-            option1 = [
-                kernel_shape[0],
-                kernel_shape[1] * kernel_shape[2],
-            ]  # dim1 x (dim2*dim3)
-            option2 = [
-                kernel_shape[0] * kernel_shape[1],
-                kernel_shape[2],
-            ]  # (dim1*dim2) x dim3
-
-            flattening_options = [option1, option2]
-
-            # Try each flattening option
-            placed = False
-            for flat_kernel in flattening_options:
-                kernel_rows, kernel_cols = flat_kernel
-
-                # Skip if kernel doesn't fit in the mesh with this flattening
-                if kernel_rows > rows or kernel_cols > cols:
-                    continue
+    if instances is None:
+        instances = {
+            name: [f"{name}_{k}" for k in range(int(np.prod(shape)))]
+            for name, shape in kernel_shapes.items()
+        }
+    neighbors = defaultdict(list)
+    for src, dst in streams or []:
+        neighbors[src].append(dst)
+        neighbors[dst].append(src)
+    io_loads = io_loads or {}
+    # Place large kernels first, which prunes the search the most
+    names = sorted(kernel_shapes, key=lambda name: -int(np.prod(kernel_shapes[name])))
+    candidates = {}
+    for name in names:
+        candidates[name] = []
+        for footprint in get_kernel_footprints(kernel_shapes[name], device_shape):
+            height = max(r for r, _ in footprint) + 1
+            width = max(c for _, c in footprint) + 1
+            for i in range(rows - height + 1):
+                for j in range(cols - width + 1):
+                    candidates[name].append(
+                        tuple((i + di, j + dj) for di, dj in footprint)
+                    )
+        if len(candidates[name]) == 0:
+            raise RuntimeError(
+                f"Kernel {name} with shape {kernel_shapes[name]} does not fit in the device mesh {device_shape}"
+            )
 
-                # Try to place the flattened kernel
-                for i in range(rows - kernel_rows + 1):
-                    for j in range(cols - kernel_cols + 1):
-                        # Check if the region is available
-                        available = True
-                        for di in range(kernel_rows):
-                            for dj in range(kernel_cols):
-                                if device_mesh[i + di][j + dj] == 1:
-                                    available = False
-                                    break
-                            if not available:
-                                break
-
-                        if available:
-                            # Place the kernel
-                            indices = []
-                            for di in range(kernel_rows):
-                                for dj in range(kernel_cols):
-                                    device_mesh[i + di][j + dj] = 1  # Mark as occupied
-                                    indices.append((i + di, j + dj))
-                            kernel_to_indices[kernel_name] = indices
-                            placed = True
-                            break
-                    if placed:
-                        break
-
-                if placed:
-                    break
-
-        # If kernel shape is 1D (e.g., [4])
-        elif len(kernel_shape) == 1:
-            kernel_length = kernel_shape[0]
-
-            # Skip if kernel doesn't fit in the mesh
-            if kernel_length > rows:
+    occupied = set()
+    positions = {}
+    column_loads = defaultdict(int)
+
+    def place(name, indices):
+        # Returns the cost added by placing the kernel
+        hops = 0
+        old_max = max(column_loads.values(), default=0)
+        for inst, idx in zip(instances[name], indices):
+            for other in neighbors[inst]:
+                if other in positions:
+                    hops += abs(idx[0] - positions[other][0]) + abs(
+                        idx[1] - positions[other][1]
+                    )
+            column_loads[idx[0]] += io_loads.get(inst, 0)
+        for inst, idx in zip(instances[name], indices):
+            occupied.add(idx)
+            positions[inst] = idx
+        return hops + max(column_loads.values(), default=0) - old_max
+
+    def unplace(name, indices):
+        for inst, idx in zip(instances[name], indices):
+            occupied.discard(idx)
+            del positions[inst]
+            column_loads[idx[0]] -= io_loads.get(inst, 0)
+
+    def fits(indices):
+        return all(idx not in occupied for idx in indices)
+
+    # Greedy placement as the initial solution
+    best_cost, best = None, None
+    greedy, cost = {}, 0
+    for name in names:
+        best_delta, best_indices = None, None
+        for indices in candidates[name]:
+            if not fits(indices):
                 continue
-
-            # Try to place it as a column
-            placed = False
-            for j in range(cols):
-                if all(device_mesh[i][j] == 0 for i in range(kernel_length)):
-                    # Place kernel as a column
-                    indices = []
-                    for i in range(kernel_length):
-                        device_mesh[i][j] = 1  # Mark as occupied
-                        indices.append((i, j))
-                    kernel_to_indices[kernel_name] = indices
-                    placed = True
-                    break
-
-        # If kernel shape is 2D (e.g., [2, 2])
-        elif len(kernel_shape) == 2:
-            kernel_rows, kernel_cols = kernel_shape
-
-            # Skip if kernel doesn't fit in the mesh
-            if kernel_rows > rows or kernel_cols > cols:
+            delta = place(name, indices)
+            unplace(name, indices)
+            if best_delta is None or delta < best_delta:
+                best_delta, best_indices = delta, indices
+        if best_indices is None:
+            break
+        cost += place(name, best_indices)
+        greedy[name] = best_indices
+    for name, indices in greedy.items():
+        unplace(name, indices)
+    if len(greedy) == len(names):
+        best_cost, best = cost, dict(greedy)
+
+    # Branch-and-bound: the partial cost never decreases, so it is a lower bound
+    num_nodes = 0
+    current = {}
+
+    def search(depth, cost):
+        nonlocal best_cost, best, num_nodes
+        if best_cost is not None and cost >= best_cost:
+            return
+        if depth == len(names):
+            best_cost, best = cost, dict(current)
+            return
+        name = names[depth]
+        for indices in candidates[name]:
+            if num_nodes >= max_nodes:
+                return
+            if not fits(indices):
                 continue
+            num_nodes += 1
+            delta = place(name, indices)
+            current[name] = indices
+            search(depth + 1, cost + delta)
+            del current[name]
+            unplace(name, indices)
+
+    search(0, 0)
+    if best is None:
+        raise RuntimeError(
+            f"Failed to place kernels {kernel_shapes} on the device mesh {device_shape}"
+        )
+    kernel_to_indices = {name: list(best[name]) for name in kernel_shapes}
+    placement = {
+        inst: idx
+        for name, indices in kernel_to_indices.items()
+        for inst, idx in zip(instances[name], indices)
+    }
+    return kernel_to_indices, get_placement_cost(placement, streams, io_loads)
+
+
+# Columns of the memory tiles and of the shim tiles with DMAs on each device
+AIEDevice = namedtuple("AIEDevice", "mem_cols shim_cols")
+AIE_DEVICES = {
+    "npu1_4col": AIEDevice([0, 1, 2, 3], [0, 1, 2, 3]),
+    "npu1": AIEDevice([0, 1, 2, 3, 4], [1, 2, 3, 4]),
+}
+
+DMAPart = namedtuple(
+    "DMAPart", "part_id shim_id mem_id tensor_tiles offset size stride num_bytes"
+)
+
 
-            # Try to place the kernel
-            placed = False
-            for i in range(rows - kernel_rows + 1):
-                for j in range(cols - kernel_cols + 1):
-                    # Check if the region is available
-                    available = True
-                    for di in range(kernel_rows):
-                        for dj in range(kernel_cols):
-                            if device_mesh[i + di][j + dj] == 1:
-                                available = False
-                                break
-                        if not available:
-                            break
-
-                    if available:
-                        # Place the kernel
-                        indices = []
-                        for di in range(kernel_rows):
-                            for dj in range(kernel_cols):
-                                device_mesh[i + di][j + dj] = 1  # Mark as occupied
-                                indices.append((i + di, j + dj))
-                        kernel_to_indices[kernel_name] = indices
-                        placed = True
-                        break
-                if placed:
-                    break
-
-    return kernel_to_indices
-
-
-def allocate_mem_tiles_with_dtensors(inputs, outputs):
+def allocate_global_io(
+    inputs,
+    outputs,
+    device="npu1_4col",
+    max_send=6,
+    max_recv=6,
+    shim_channels=2,
+):
     """
-    TODO: make use of the fifth mem tile
-    TODO: The current mapping scheme requires the matrices to be completely
-    partitioned without remaining elements (shape should be divided by tile num).
+    Allocate (shim-tile, memory-tile) pairs for every DTensor that crosses the
+    NPU boundary, balancing the bytes moved per iteration over all the tiles.
 
-    Allocate (shim-tile, mem-tile) pairs for every DTensor that crosses the
-    NPU boundary, while respecting the per-mem-tile ObjectFIFO limits.
+    Each DTensor is transferred in one or more parts. A part is a range of rows of
+    its tensor tiles (tiles that share the index of the outermost sharded dimension),
+    which is sent through one shim DMA channel and one memory tile, and fans out to
+    (or gathers from) one ObjectFIFO per tensor tile. The rows are split as evenly as
+    possible, so the number of rows does not need to be divisible by the number of parts.
 
-    The algorithm tries to pack as much traffic as possible into the fewest
-    number of memory tiles, only falling back to splitting (called "parts")
-    when the requested number of FIFOs would exceed the quota per memory tile.
+    The parts are assigned to the memory tiles, largest first, on the least loaded tile
+    that has enough DMA channels left, and to the least loaded shim tile in the same way.
+    Tensors on the busiest memory tile are split further as long as it lowers the
+    peak load and the DMA channels suffice.
 
     Parameters
     ----------
@@ -797,135 +810,350 @@ def allocate_mem_tiles_with_dtensors(inputs, outputs):
     outputs: Dict[str, List[DTensor]]
         A dictionary mapping function names to lists of DTensor objects as outputs.
 
+    device: str
+        The target device in `AIE_DEVICES`.
+
+    max_send: int
+        The number of MM2S channels of a memory tile.
+
+    max_recv: int
+        The number of S2MM channels of a memory tile.
+
+    shim_channels: int
+        The number of MM2S (and S2MM) channels of a shim tile.
+
     Returns
     -------
     Tuple of two elements:
         - tile_map:
-            A dictionary mapping tensor names to a list of Part objects.
-            Every DTensor may be split into several Part instances when necessary.
-            Each Part records which memory tile it resides on and which 8-by-8 tensor tiles it contains.
+            A dictionary mapping tensor names to a list of DMAPart objects,
+            whose shim_id and mem_id are the columns of the tiles.
 
-        - num_pairs:
-            The total number of distinct (shim, memory) tile pairs that are allocated.
-            This value determines how many off-chip DMA channels will be generated.
+        - load:
+            The load of every used tile, i.e., {"mem": {col: {"send", "recv", "bytes"}},
+            "shim": {col: {"mm2s", "s2mm", "bytes"}}}, see `format_io_load`.
     """
-    MAX_MEM_TILES = 4  # Maximum number of memory tiles allowed
-    MAX_SEND = 6  # Maximum number of producer FIFOs per memory tile (DMA limits)
-    MAX_RECV = 6  # Maximum number of consumer FIFOs per memory tile (DMA limits)
-
-    # Running FIFO usage counters for every allocated memory tile
-    mem_send_cnt = []
-    mem_recv_cnt = []
-    Part = namedtuple("Part", "part_id shim_id mem_id tensor_tiles offset size stride")
-
-    # ------------------------------------------------------------------
-    # Internal helper: choose an existing or new memory tile that satisfies
-    #                  the requested number of SEND and RECV FIFOs.
-    # ------------------------------------------------------------------
-    def alloc_mem_tile(send_need, recv_need):
-        # 1. Attempt to allocate a new memory tile
-        if (
-            len(mem_send_cnt) < MAX_MEM_TILES
-            and send_need <= MAX_SEND
-            and recv_need <= MAX_RECV
-        ):
-            mem_send_cnt.append(send_need)
-            mem_recv_cnt.append(recv_need)
-            return True, len(mem_send_cnt) - 1  # Index of the newly added tile
+    mem_cols, shim_cols = AIE_DEVICES[device]
 
-        # 2. Otherwise, try to pack into an existing tile
-        for i, _ in enumerate(mem_send_cnt):
-            if (
-                mem_send_cnt[i] + send_need <= MAX_SEND
-                and mem_recv_cnt[i] + recv_need <= MAX_RECV
-            ):
-                mem_send_cnt[i] += send_need
-                mem_recv_cnt[i] += recv_need
-                return True, i  # Reuse tile at index i
-
-        # 3. If no tile fits, raise an error
-        return False, -1
-
-    # ------------------------------------------------------------------
-    # Internal helper: split a DTensor into Part instances so each Part fits
-    #                  on some memory tile with respect to FIFO limits.
-    # ------------------------------------------------------------------
-    def make_parts_for_dtensor(dtensor, is_input):
-        placement = dtensor.layout.get_placement(dtensor.mapping)
-        tensor_tiles = list(placement.keys())
-        device_dims, size, stride = calculate_tensor_access(
-            dtensor.shape, dtensor.layout.placement, dtensor.mapping
+    tensors = []
+    for io_lst, is_input in ((inputs, True), (outputs, False)):
+        for f_name, sub in io_lst.items():
+            if f_name == "_global":
+                continue
+            for dtensor in sub["_global"]:
+                if all(dtensor is not other for other, _ in tensors):
+                    tensors.append((dtensor, is_input))
+
+    # Rows of tensor tiles of each DTensor
+    rows_info = []
+    for dtensor, is_input in tensors:
+        device_dims, size, _ = dtensor.get_access_pattern()
+        tensor_tiles = sorted(
+            dtensor.global_placement.keys(),
+            key=lambda label: (len(label), label),
         )
-        base_offset = [0, 0, 0, 0]
-        if len(device_dims) <= 1:
-            factor = 1
-        else:
-            factor = size[device_dims[0]]
-
-        # Attempt to place the entire tensor in one go
-        send_need = len(tensor_tiles) if is_input else 1
-        recv_need = 1 if is_input else len(tensor_tiles)
-        success, mem_id = alloc_mem_tile(send_need, recv_need)
-        if success:
-            return [Part(0, mem_id, mem_id, tensor_tiles, base_offset, size, stride)]
-        # Must split if single allocation fails
-        # Greedy splitting strategy
+        row_size = int(np.prod([size[dim] for dim in device_dims[1:]]))
+        max_fanout = max_send if is_input else max_recv
+        if row_size > max_fanout:
+            raise RuntimeError(
+                f"Failed to allocate memory tiles for {dtensor.name}: "
+                f"{row_size} tensor tiles in a row exceed the DMA channel limit."
+            )
+        num_rows = len(tensor_tiles) // row_size
+        tile_bytes = int(np.prod(dtensor.get_local_shape())) * (
+            (getattr(dtensor.dtype, "bits", 32) + 7) // 8
+        )
+        rows_info.append((tensor_tiles, row_size, num_rows, tile_bytes, max_fanout))
+
+    def make_parts(idx, num_parts):
+        dtensor, _ = tensors[idx]
+        tensor_tiles, row_size, num_rows, tile_bytes, _ = rows_info[idx]
+        device_dims, size, stride = dtensor.get_access_pattern()
         parts = []
-        part_id = 0
-        remaining = tensor_tiles[:]
-        start_idx = 0
-        while remaining:
-            offset = base_offset[:]
-            chunk = remaining  # Take as many as capacity allows
-            # Shrink the chunk until it fits in FIFO limits
-            while chunk:
-                send_need = len(chunk) if is_input else 1
-                recv_need = 1 if is_input else len(chunk)
-                success, mem_id = alloc_mem_tile(send_need, recv_need)
-                if success:
-                    break
-                chunk = chunk[: (len(chunk) - factor)]  # Reduce size and retry
-            if not chunk:
-                raise RuntimeError(
-                    "Failed to allocate (shim, memory) tile: per-tile FIFO limit "
-                    "exceeded or no more available tiles."
+        start = 0
+        for part_id in range(num_parts):
+            rows = num_rows // num_parts + (1 if part_id < num_rows % num_parts else 0)
+            offset, part_size = [0] * len(size), list(size)
+            if len(device_dims) > 0:
+                offset[device_dims[0]] = start
+                part_size[device_dims[0]] = rows
+            chunk = tensor_tiles[start * row_size : (start + rows) * row_size]
+            parts.append(
+                DMAPart(
+                    part_id,
+                    None,
+                    None,
+                    chunk,
+                    offset,
+                    part_size,
+                    list(stride),
+                    len(chunk) * tile_bytes,
                 )
-            if len(device_dims) == 1:
-                offset[device_dims[0]] = start_idx
-                size[device_dims[0]] = len(chunk)
-            else:
-                offset[device_dims[1]] = start_idx // factor
-                size[device_dims[1]] = len(chunk) // factor
-            parts.append(Part(part_id, mem_id, mem_id, chunk, offset, size, stride))
-            part_id += 1
-            remaining = remaining[len(chunk) :]
-            start_idx += len(chunk)
+            )
+            start += rows
         return parts
 
-    # ------------------------------------------------------------------
-    # Build the final mapping from tensor name to a list of Part instances
-    # ------------------------------------------------------------------
-    tile_map = defaultdict(list)
-
-    # Inputs use SEND quotas since memory tiles act as producers
-    for f_name, sub in inputs.items():
-        if f_name == "_global":
-            continue
-        for dtensor in sub["_global"]:
-            tile_map[dtensor.name].extend(
-                make_parts_for_dtensor(dtensor, is_input=True)
+    def assign(num_parts):
+        # Returns (tile_map, load), or None if the parts do not fit
+        mem_load = {col: {"send": 0, "recv": 0, "bytes": 0} for col in mem_cols}
+        shim_load = {col: {"mm2s": 0, "s2mm": 0, "bytes": 0} for col in shim_cols}
+        all_parts = []
+        for idx, num in enumerate(num_parts):
+            all_parts += [(idx, part) for part in make_parts(idx, num)]
+        all_parts.sort(key=lambda item: -item[1].num_bytes)
+        tile_map = defaultdict(list)
+        for idx, part in all_parts:
+            dtensor, is_input = tensors[idx]
+            fanout = len(part.tensor_tiles)
+            send_need = fanout if is_input else 1
+            recv_need = 1 if is_input else fanout
+            mem_candidates = [
+                col
+                for col in mem_cols
+                if mem_load[col]["send"] + send_need <= max_send
+                and mem_load[col]["recv"] + recv_need <= max_recv
+            ]
+            channel = "mm2s" if is_input else "s2mm"
+            shim_candidates = [
+                col for col in shim_cols if shim_load[col][channel] < shim_channels
+            ]
+            if len(mem_candidates) == 0 or len(shim_candidates) == 0:
+                return None
+            mem_id = min(mem_candidates, key=lambda col: mem_load[col]["bytes"])
+            # prefer the shim tile in the same column on ties
+            shim_id = min(
+                shim_candidates,
+                key=lambda col: (shim_load[col]["bytes"], abs(col - mem_id)),
             )
+            mem_load[mem_id]["send"] += send_need
+            mem_load[mem_id]["recv"] += recv_need
+            mem_load[mem_id]["bytes"] += part.num_bytes
+            shim_load[shim_id][channel] += 1
+            shim_load[shim_id]["bytes"] += part.num_bytes
+            tile_map[dtensor.name].append(part._replace(shim_id=shim_id, mem_id=mem_id))
+        for parts in tile_map.values():
+            parts.sort(key=lambda part: part.part_id)
+        load = {
+            "mem": {
+                col: usage
+                for col, usage in mem_load.items()
+                if usage["send"] + usage["recv"] > 0
+            },
+            "shim": {
+                col: usage
+                for col, usage in shim_load.items()
+                if usage["mm2s"] + usage["s2mm"] > 0
+            },
+        }
+        return tile_map, load
+
+    # Start from the fewest parts that respect the fan-out limits
+    num_parts = [
+        -(-num_rows // (max_fanout // row_size))
+        for _, row_size, num_rows, _, max_fanout in rows_info
+    ]
+    best = assign(num_parts)
+    if best is None:
+        raise RuntimeError(
+            "Failed to allocate (shim, memory) tile: per-tile FIFO limit "
+            "exceeded or no more available tiles."
+        )
+
+    def get_loads(load):
+        # the loads from the busiest tile down, compared lexicographically
+        loads = [usage["bytes"] for usage in load["mem"].values()]
+        loads += [0] * (len(mem_cols) - len(loads))
+        return sorted(loads, reverse=True)
+
+    # Split a tensor on the busiest memory tile while it lowers the loads
+    while True:
+        tile_map, load = best
+        busiest = max(load["mem"], key=lambda col: load["mem"][col]["bytes"])
+        candidates = sorted(
+            {
+                (part.num_bytes, idx)
+                for idx, (dtensor, _) in enumerate(tensors)
+                for part in tile_map[dtensor.name]
+                if part.mem_id == busiest and len(part.tensor_tiles) > rows_info[idx][1]
+            },
+            reverse=True,
+        )
+        for _, idx in candidates:
+            new_parts = list(num_parts)
+            new_parts[idx] += 1
+            result = assign(new_parts)
+            if result is not None and get_loads(result[1]) < get_loads(load):
+                num_parts, best = new_parts, result
+                break
+        else:
+            break
+    return best
+
+
+def format_io_load(load):
+    """Returns the lines that report the load of each memory and shim tile."""
+    lines = []
+    for col, usage in sorted(load["mem"].items()):
+        lines.append(
+            f"mem tile {col}: {usage['bytes']} bytes/iter, "
+            f"send {usage['send']}, recv {usage['recv']}"
+        )
+    for col, usage in sorted(load["shim"].items()):
+        lines.append(
+            f"shim tile {col}: {usage['bytes']} bytes/iter, "
+            f"mm2s {usage['mm2s']}, s2mm {usage['s2mm']}"
+        )
+    return lines
+
+
+# Data memory of a compute tile in bytes
+LOCAL_MEMORY = 64 * 1024
+
+
+def get_type_bytes(shape, dtype):
+    """Returns the bytes of a buffer, where `dtype` is an MLIR type string, e.g., i32."""
+    bits = int(re.search(r"\d+", str(dtype)).group(0))
+    return int(np.prod(shape)) * ((bits + 7) // 8)
+
+
+# Width of the vector registers of a compute tile in bits
+AIE_VECTOR_BITS = 512
+# Element types that the vector units of the compute tiles support
+AIE_VECTOR_TYPES = {"i8", "i16", "i32", "bf16", "f32"}
+
+
+def get_vector_lanes(func, vector_bits=AIE_VECTOR_BITS):
+    """
+    Returns the number of vector lanes for the loops of a core function, given by
+    the widest element type that it loads or stores. Returns 0 if the function
+    should stay scalar, i.e., it accesses an element type without vector support
+    or divides, which the vector units of the compute tiles cannot do.
+    """
+    bits = 0
+
+    def visit(op):
+        nonlocal bits
+        name = op.operation.name
+        if name.startswith(("arith.div", "arith.rem", "arith.ceildiv", "math.")):
+            return False
+        if name in {"affine.load", "memref.load"}:
+            memref = op.operands[0]
+        elif name in {"affine.store", "memref.store"}:
+            memref = op.operands[1]
+        else:
+            memref = None
+        if memref is not None:
+            dtype = str(MemRefType(memref.type).element_type)
+            if dtype not in AIE_VECTOR_TYPES:
+                return False
+            bits = max(bits, int(re.search(r"\d+", dtype).group(0)))
+        for region in op.regions:
+            for block in region.blocks:
+                for inner_op in block.operations:
+                    if not visit(inner_op):
+                        return False
+        return True
+
+    if not visit(func) or bits == 0:
+        return 0
+    return vector_bits // bits
+
+
+def get_fifo_depths(fifos, configs=None, local_usage=None):
+    """
+    Chooses the depth of each ObjectFIFO.
+
+    Parameters
+    ----------
+    fifos: List[Tuple[str, int, List[str], int]]
+        (key, bytes of one object, compute tiles that buffer the objects, default depth)
+        of each ObjectFIFO. The FIFOs of the same DTensor or stream share the key.
+
+    configs: dict
+        - ``fifo_depth``: the depth of all the FIFOs, or a dict mapping keys (DTensor or
+          stream names) to depths. ``"auto"`` starts from the default depth, e.g., the
+          depth of a ``df.pipe``, shrinks the FIFOs until the buffers of every compute
+          tile fit in its local memory, and then deepens them one step at a time as
+          long as they still fit.
+        - ``fifo_acquire``: the number of objects acquired at a time from all the
+          FIFOs, or a dict mapping keys to counts. Only 1 is supported, since a core
+          acquires one object of each DTensor per invocation and one object per
+          access of a stream.
+        - ``local_memory``: bytes of data memory of a compute tile (64 KB)
+        - ``max_fifo_depth``: the largest depth ``"auto"`` grows a FIFO to (4), which
+          does not lower a deeper default depth
+
+    local_usage: Dict[str, int]
+        The bytes of the local buffers of each compute tile.
 
-    # Outputs use RECV quotas since memory tiles act as consumers
-    for f_name, sub in outputs.items():
-        if f_name == "_global":
+    Returns
+    -------
+    Dict[str, int]: The depth of each key.
+    """
+    configs = {} if configs is None else configs
+    setting = configs.get("fifo_depth", None)
+    acquire = configs.get("fifo_acquire", 1)
+    budget = configs.get("local_memory", LOCAL_MEMORY)
+    max_depth = configs.get("max_fifo_depth", 4)
+    depths = {}
+    auto = {}
+    for key, num_bytes, _, default in fifos:
+        if key in depths:
             continue
-        for dtensor in sub["_global"]:
-            tile_map[dtensor.name].extend(
-                make_parts_for_dtensor(dtensor, is_input=False)
+        count = acquire.get(key, 1) if isinstance(acquire, dict) else acquire
+        if not isinstance(count, int) or count < 1:
+            raise ValueError(f"Invalid FIFO acquire count {count} of {key}")
+        if count > 1:
+            raise ValueError(
+                f"Acquiring {count} objects of {key} at a time is not supported, "
+                "as a core only uses one object per acquire."
             )
-
-    return tile_map, len(mem_send_cnt)
+        if isinstance(setting, dict):
+            depth = setting.get(key, default)
+        else:
+            depth = default if setting is None else setting
+        if depth == "auto":
+            # (bytes of one object, largest depth to grow to)
+            auto[key] = (num_bytes, max(default, max_depth))
+            depths[key] = default
+        elif isinstance(depth, int) and depth >= 1:
+            depths[key] = depth
+        else:
+            raise ValueError(f"Invalid FIFO depth {depth} of {key}")
+
+    def get_overflows():
+        # Returns the compute tiles whose buffers exceed the local memory
+        used = defaultdict(int, local_usage or {})
+        for key, num_bytes, tiles, _ in fifos:
+            for tile in tiles:
+                used[tile] += depths[key] * num_bytes
+        return {tile for tile, value in used.items() if value > budget}
+
+    # shrink the largest objects on the overflowing tiles first
+    overflows = get_overflows()
+    while len(overflows) > 0:
+        shrinkable = [
+            key
+            for key, _, tiles, _ in fifos
+            if key in auto and depths[key] > 1 and not overflows.isdisjoint(tiles)
+        ]
+        if len(shrinkable) == 0:
+            break
+        depths[max(shrinkable, key=lambda key: auto[key][0])] -= 1
+        overflows = get_overflows()
+
+    grown = len(overflows) == 0
+    while grown:
+        grown = False
+        for key, (_, limit) in auto.items():
+            if depths[key] >= limit:
+                continue
+            depths[key] += 1
+            if len(get_overflows()) == 0:
+                grown = True
+            else:
+                depths[key] -= 1
+    return depths
 
 
 def codegen_aie_mlir(
@@ -936,6 +1164,7 @@ def codegen_aie_mlir(
     kernel_buf_dicts,
     external_kernels,
     stream_info,
+    configs=None,
 ):
     """
     Generates MLIR-AIE code with MLIR module and extra information for multiple kernel functions
@@ -972,12 +1201,16 @@ def codegen_aie_mlir(
         The input and output stream of each kernel.
         The key is the name of the kernel, and the value is a list of tuples.
         The first element in the tuple is the name of the stream, the second element is either 'in' or 'out'.
+
+    configs: dict
+        The ObjectFIFO depths, see `get_fifo_depths`.
     """
     code = format_str("module {", indent=0)
-    tile_map, mem_tile_size = allocate_mem_tiles_with_dtensors(inputs, outputs)
-    shim_tile_size = mem_tile_size
     device = "npu1_4col"
+    tile_map, io_load = allocate_global_io(inputs, outputs, device)
     code += format_str(f"aie.device({device}) {{", indent=2)
+    for line in format_io_load(io_load):
+        code += format_str(f"// {line}")
 
     # Add external functions
     for func in mod.body.operations:
@@ -1000,14 +1233,62 @@ def codegen_aie_mlir(
     # | South | 6 | 4 |
     # | FIFO  | 2 | 2 |
     # | Trace | 1 | 0 |
-    for shim_id in range(shim_tile_size):
+    for shim_id in sorted(io_load["shim"]):
         code += format_str(f"%tile_shim{shim_id} = aie.tile({shim_id}, 0)")
-    for mem_id in range(mem_tile_size):
+    for mem_id in sorted(io_load["mem"]):
         code += format_str(f"%tile_mem{mem_id} = aie.tile({mem_id}, 1)")
 
     # Get top function and all other functions
     top_func, all_funcs = get_public_funcs(mod)
 
+    # Choose the depth of the object FIFOs
+    stream_in_out = get_stream_in_out(stream_info)
+    stream_types = {}
+    for op in top_func.entry_block.operations:
+        if isinstance(op, allo_d.StreamConstructOp):
+            stream_name = op.attributes["name"].value
+            if stream_name in stream_in_out:
+                stream_type_str = str(op.results.types[0])
+                start = stream_type_str.find("<") + 1
+                end = stream_type_str.rfind(">")
+                type_str, depth_str = stream_type_str[start:end].split(",")
+                type_str = type_str.strip()
+                if not type_str.startswith("memref"):
+                    type_str = f"memref<{type_str}>"
+                stream_types[stream_name] = (type_str, int(depth_str.strip()))
+    fifos = []
+    for arg_lst in (inputs, outputs):
+        for func_name, sub_func_lst in arg_lst.items():
+            if func_name == "_global":
+                continue
+            for dtensor in sub_func_lst["_global"]:
+                num_bytes = get_type_bytes(dtensor.get_local_shape(), dtensor.dtype)
+                placement = dtensor.global_placement
+                for pe_tiles in placement.values():
+                    tiles = [
+                        f"{func_name}_{'_'.join(map(str, tile))}"
+                        for tile in pe_tiles
+                        if dtensor in sub_func_lst[tile]
+                    ]
+                    fifos.append((dtensor.name, num_bytes, tiles, 2))
+    for stream_name, (type_str, depth) in stream_types.items():
+        dims = type_str[len("memref<") : -1].split("x")
+        fifos.append(
+            (
+                stream_name,
+                get_type_bytes([int(dim) for dim in dims[:-1]], dims[-1]),
+                [tile for tile in stream_in_out[stream_name] if tile is not None],
+                depth,
+            )
+        )
+    local_usage = {
+        func_name_w_id: sum(
+            get_type_bytes(shape, ele_type) for ele_type, shape in buf_dict.values()
+        )
+        for func_name_w_id, buf_dict in kernel_buf_dicts.items()
+    }
+    fifo_depths = get_fifo_depths(fifos, configs, local_usage)
+
     # Track vertical position for tile placement
     aie_mesh = (5, 4)
     y_offset = 2
@@ -1019,7 +1300,30 @@ def codegen_aie_mlir(
             mappings[func_name] = inputs[func_name]["_global"][0].mapping
         else:
             mappings[func_name] = outputs[func_name]["_global"][0].mapping
-    for func_name, tile_ids in map_kernels_to_device_mesh(mappings, aie_mesh).items():
+    instances = {}
+    io_loads = {}
+    for func_name, funcs in func_groups.items():
+        instances[func_name] = []
+        for func in funcs:
+            func_name_w_id = func.attributes["sym_name"].value
+            func_id = extract_numbers(func_name_w_id[len(func_name) :])
+            instances[func_name].append(func_name_w_id)
+            io_loads[func_name_w_id] = len(inputs[func_name].get(func_id, [])) + len(
+                outputs[func_name].get(func_id, [])
+            )
+    streams = [
+        (src, dst)
+        for src, dst in get_stream_in_out(stream_info).values()
+        if src is not None and dst is not None
+    ]
+    placement, cost = map_kernels_to_device_mesh(
+        mappings, aie_mesh, instances, streams, io_loads
+    )
+    code += format_str(
+        f"// placement cost: {cost['total']} (stream hops: {cost['stream_hops']}, "
+        f"I/O contention: {cost['io_contention']})"
+    )
+    for func_name, tile_ids in placement.items():
         for idx, func in zip(tile_ids, func_groups[func_name]):
             func_full_name = func.attributes["sym_name"].value
             code += format_str(
@@ -1056,15 +1360,16 @@ def codegen_aie_mlir(
         func_strs.append(func_str)
 
     # Create object FIFOs for each kernel
-    tile2fifo = {}
+    code += format_str(
+        "// object FIFO depths: "
+        + ", ".join(f"{key}={depth}" for key, depth in fifo_depths.items())
+    )
     for io, arg_lst in (("in", inputs), ("out", outputs)):
         for func_name, sub_func_lst in arg_lst.items():
             if func_name == "_global":
                 continue
             for idx, dtensor in enumerate(sub_func_lst["_global"]):
-                mapping = dtensor.mapping
-                spec = dtensor.layout
-                placement = spec.get_placement(mapping)
+                placement = dtensor.global_placement
                 # shim to mem tile
                 for part in tile_map[dtensor.name]:
                     memref_type = get_memref_type_str(dtensor.dtype, part.size)
@@ -1074,13 +1379,13 @@ def codegen_aie_mlir(
                     if io == "in":
                         code += format_str(
                             f"aie.objectfifo @in_shim_{dtensor.name}{suffix}"
-                            f"(%tile_shim{part.shim_id}, {{%tile_mem{part.mem_id}}}, 2 : i32)"
+                            f"(%tile_shim{part.shim_id}, {{%tile_mem{part.mem_id}}}, {fifo_depths[dtensor.name]} : i32)"
                             f" : !aie.objectfifo<{memref_type}>"
                         )
                     else:
                         code += format_str(
                             f"aie.objectfifo @out_shim_{dtensor.name}{suffix}"
-                            f"(%tile_mem{part.mem_id}, {{%tile_shim{part.shim_id}}}, 2 : i32)"
+                            f"(%tile_mem{part.mem_id}, {{%tile_shim{part.shim_id}}}, {fifo_depths[dtensor.name]} : i32)"
                             f" : !aie.objectfifo<{memref_type}>"
                         )
                 # mem to comp tile
@@ -1099,9 +1404,7 @@ def codegen_aie_mlir(
                             if dtensor not in sub_func_lst[tile]:
                                 continue
                             idx_str = "_".join(map(str, tile))
-                            core_name = f"%tile_comp_{func_name}_{idx_str}"
-                            tile2fifo.setdefault(core_name, []).append(mem_strs[-1])
-                            tile_strs.append(core_name)
+                            tile_strs.append(f"%tile_comp_{func_name}_{idx_str}")
                         tile_str = ", ".join(tile_strs)
                         local_mtype = get_memref_type_str(
                             dtensor.dtype, dtensor.get_local_shape()
@@ -1109,13 +1412,13 @@ def codegen_aie_mlir(
                         if io == "in":  # mem -> comp
                             code += format_str(
                                 f"aie.objectfifo {mem_strs[-1]}"
-                                f"(%tile_mem{part.mem_id}, {{{tile_str}}}, 2 : i32)"
+                                f"(%tile_mem{part.mem_id}, {{{tile_str}}}, {fifo_depths[dtensor.name]} : i32)"
                                 f" : !aie.objectfifo<{local_mtype}>"
                             )
                         else:  # comp -> mem
                             code += format_str(
                                 f"aie.objectfifo {mem_strs[-1]}"
-                                f"({tile_str}, {{%tile_mem{part.mem_id}}}, 2 : i32)"
+                                f"({tile_str}, {{%tile_mem{part.mem_id}}}, {fifo_depths[dtensor.name]} : i32)"
                                 f" : !aie.objectfifo<{local_mtype}>"
                             )
                         mem_stride.append(
@@ -1139,25 +1442,13 @@ def codegen_aie_mlir(
 
     # Create stream object FIFOs from top_func
     stream_ele_types = {}
-    stream_in_out = get_stream_in_out(stream_info)
-    for op in top_func.entry_block.operations:
-        if isinstance(op, allo_d.StreamConstructOp):
-            stream_name = op.attributes["name"].value
-            if stream_name in stream_in_out:
-                in_out = stream_in_out[stream_name]
-                stream_type_str = str(op.results.types[0])
-                start = stream_type_str.find("<") + 1
-                end = stream_type_str.rfind(">")
-                type_str, depth_str = stream_type_str[start:end].split(",")
-                type_str = type_str.strip()
-                if not type_str.startswith("memref"):
-                    type_str = f"memref<{type_str}>"
-                depth = int(depth_str.strip())
-                # Create the stream object FIFO between the two kernels
-                code += format_str(
-                    f"aie.objectfifo @{stream_name}(%tile_comp_{in_out[0]}, {{%tile_comp_{in_out[1]}}}, {depth} : i32) : !aie.objectfifo<{type_str}>"
-                )
-                stream_ele_types[stream_name] = type_str
+    for stream_name, (type_str, _) in stream_types.items():
+        in_out = stream_in_out[stream_name]
+        # Create the stream object FIFO between the two kernels
+        code += format_str(
+            f"aie.objectfifo @{stream_name}(%tile_comp_{in_out[0]}, {{%tile_comp_{in_out[1]}}}, {fifo_depths[stream_name]} : i32) : !aie.objectfifo<{type_str}>"
+        )
+        stream_ele_types[stream_name] = type_str
 
     # Create core computation for each kernel function
     for func_gid, (func, func_str) in enumerate(zip(all_funcs, func_strs)):
@@ -1193,12 +1484,11 @@ def codegen_aie_mlir(
                     arg_offset = 0 if is_input else len(inputs[func_name][func_id])
 
                     for arg_id, tensor in enumerate(tensors):
-                        # Calculate fifo index and get fifo name
-                        if is_input:
-                            fifo_name = tile2fifo[f"%{core_name}"][arg_id]
-                        else:
-                            n_inputs = len(inputs[func_name][func_id])
-                            fifo_name = tile2fifo[f"%{core_name}"][n_inputs + arg_id]
+                        # the FIFO of the tensor tile held by this PE
+                        label = tensor.global_placement.get_label(func_id)
+                        fifo_name = (
+                            f"@{'in' if is_input else 'out'}_mem_{tensor.name}_{label}"
+                        )
 
                         if is_acquire:
                             # Acquire FIFO and access subview
@@ -1276,9 +1566,10 @@ def codegen_aie_mlir(
     )
 
     with format_code(indent=6):
+        bd_cnt = 0
 
         def process_dma_operations(tensor_lst, is_input):
-            nonlocal code
+            nonlocal code, bd_cnt
             prefix = "in" if is_input else "out"
             start_idx = 0 if is_input else global_idx
             for idx, dtensor in enumerate(tensor_lst, start=start_idx):
@@ -1287,15 +1578,19 @@ def codegen_aie_mlir(
                         f"_{part.part_id}" if len(tile_map[dtensor.name]) > 1 else ""
                     )
                     memref_type = get_memref_type_str(dtensor.dtype, dtensor.shape)
-                    dma_attr = (
-                        f"id = {idx} : i64, "
-                        f"{'issue_token = true, ' if is_input else ''}"
-                        f"metadata = @{prefix}_shim_{dtensor.name}{suffix}"
-                    )
-                    code += format_str(
-                        f"aiex.npu.dma_memcpy_nd(0, 0, %arg{idx}{part.offset}{part.size}{part.stride})"
-                        f" {{{dma_attr}}} : {memref_type}"
-                    )
+                    bds = get_dma_bds(part.offset, part.size, part.stride)
+                    for bd_idx, (offset, size, stride) in enumerate(bds):
+                        # wait for the last BD of the transfer
+                        dma_attr = (
+                            f"id = {bd_cnt} : i64, "
+                            f"{'issue_token = true, ' if bd_idx == len(bds) - 1 else ''}"
+                            f"metadata = @{prefix}_shim_{dtensor.name}{suffix}"
+                        )
+                        code += format_str(
+                            f"aiex.npu.dma_memcpy_nd(0, 0, %arg{idx}{offset}{size}{stride})"
+                            f" {{{dma_attr}}} : {memref_type}"
+                        )
+                        bd_cnt += 1
 
         process_dma_operations(inputs["_global"], True)
         process_dma_operations(outputs["_global"], False)
@@ -1373,6 +1668,49 @@ def get_func_groups(module):
     return func_groups
 
 
+def get_global_io(module, func_args):
+    """
+    Collects the DTensors read and written by each kernel function.
+
+    Returns
+    -------
+    Tuple of two dicts (inputs, outputs), mapping each function group name to
+    {"_global": DTensors of the group, func_id: DTensors of the function}, and
+    "_global" to all the DTensors.
+    """
+    func_groups = get_func_groups(module)
+    inputs = {}
+    outputs = {}
+    for func_name, funcs in func_groups.items():
+        inputs[func_name] = {}
+        outputs[func_name] = {}
+        inputs[func_name]["_global"] = []
+        outputs[func_name]["_global"] = []
+        for func in funcs:
+            # Even for functions inside the same group, the in/out arguments may be different
+            func_name_w_id = func.attributes["sym_name"].value
+            func_id = tuple(
+                map(int, func_name_w_id.split(func_name + "_")[-1].split("_"))
+            )
+            in_idx, out_idx = analyze_read_write_patterns(func)
+            for io_lst, io_idx in ((inputs, in_idx), (outputs, out_idx)):
+                io_lst[func_name][func_id] = []
+                for idx in io_idx:
+                    dtensor = func_args[func_name_w_id][idx]
+                    if dtensor not in io_lst[func_name]["_global"]:
+                        io_lst[func_name]["_global"].append(dtensor)
+                    io_lst[func_name][func_id].append(dtensor)
+    for io_lst in (inputs, outputs):
+        io_lst["_global"] = []
+        for func_name, sub_func_lst in io_lst.items():
+            if func_name == "_global":
+                continue
+            for tensor in sub_func_lst["_global"]:
+                if tensor not in io_lst["_global"]:
+                    io_lst["_global"].append(tensor)
+    return inputs, outputs
+
+
 class AIEModule:
     def __init__(
         self,
@@ -1381,6 +1719,7 @@ class AIEModule:
         func_args,
         project,
         stream_info,
+        configs=None,
     ):
         self.module = module
         self.top_func_name = top_func_name
@@ -1388,46 +1727,15 @@ class AIEModule:
         self.module = module
         self.func_args = func_args
         self.stream_info = stream_info
+        self.configs = configs
 
     def build(self):
-        assert "MLIR_AIE_INSTALL_DIR" in os.environ, "Please set MLIR_AIE_INSTALL_DIR"
-        assert "PEANO_INSTALL_DIR" in os.environ, "Please set PEANO_INSTALL_DIR"
         os.makedirs(os.path.join(self.project, "build"), exist_ok=True)
         with open(
             os.path.join(self.project, "original.mlir"), "w", encoding="utf-8"
         ) as f:
             f.write(str(self.module))
-        # Create a dictionary to store the kernel functions
-        func_groups = get_func_groups(self.module)
-        inputs = {}
-        outputs = {}
-        for func_name, funcs in func_groups.items():
-            inputs[func_name] = {}
-            outputs[func_name] = {}
-            inputs[func_name]["_global"] = []
-            outputs[func_name]["_global"] = []
-            for func in funcs:
-                # Even for functions inside the same group, the in/out arguments may be different
-                func_name_w_id = func.attributes["sym_name"].value
-                func_id = tuple(
-                    map(int, func_name_w_id.split(func_name + "_")[-1].split("_"))
-                )
-                in_idx, out_idx = analyze_read_write_patterns(func)
-                for io_lst, io_idx in ((inputs, in_idx), (outputs, out_idx)):
-                    io_lst[func_name][func_id] = []
-                    for idx in io_idx:
-                        dtensor = self.func_args[func_name_w_id][idx]
-                        if dtensor not in io_lst[func_name]["_global"]:
-                            io_lst[func_name]["_global"].append(dtensor)
-                        io_lst[func_name][func_id].append(dtensor)
-        for io_lst in (inputs, outputs):
-            io_lst["_global"] = []
-            for func_name, sub_func_lst in io_lst.items():
-                if func_name == "_global":
-                    continue
-                for tensor in sub_func_lst["_global"]:
-                    if tensor not in io_lst["_global"]:
-                        io_lst["_global"].append(tensor)
+        inputs, outputs = get_global_io(self.module, self.func_args)
         self.inputs = inputs
         self.outputs = outputs
         external_kernels = inject_aie_kernels(self.module)
@@ -1443,9 +1751,13 @@ class AIEModule:
             kernel_buf_dicts,
             external_kernels,
             self.stream_info,
+            self.configs,
         )
         with open(os.path.join(self.project, "top.mlir"), "w", encoding="utf-8") as f:
             f.write(code)
+        # top.mlir can be inspected without the toolchain
+        assert "MLIR_AIE_INSTALL_DIR" in os.environ, "Please set MLIR_AIE_INSTALL_DIR"
+        assert "PEANO_INSTALL_DIR" in os.environ, "Please set PEANO_INSTALL_DIR"
         # compile external kernels
         kernel_code, generated_kernels = codegen_external_kernels(external_kernels)
         if len(generated_kernels) > 0:
@@ -0,0 +1,483 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+# This file implements an analytical cycle model of AIE dataflow designs. The core
+# functions are replayed on modeled object FIFOs and DMA channels, while the outputs
+# are computed by the dataflow simulator.
+# pylint: disable=no-name-in-module
+
+from collections import deque
+
+from .._mlir.ir import BlockArgument, IntegerAttr, MemRefType
+from .._mlir.dialects import allo as allo_d, func as func_d
+from .ai_engine import (
+    allocate_global_io,
+    get_fifo_depths,
+    get_func_groups,
+    get_global_io,
+    get_public_funcs,
+    get_stream_in_out,
+    get_type_bytes,
+    lower_tensor_to_memref,
+)
+
+# Default timing parameters in cycles
+AIE_TIMING = {
+    # cycles of a scalar operation, unless listed in `op_cycles`
+    "default_op_cycles": 1,
+    "op_cycles": {
+        "arith.divsi": 8,
+        "arith.divui": 8,
+        "arith.remsi": 8,
+        "arith.remui": 8,
+        "arith.divf": 16,
+        "math.exp": 20,
+        "math.sqrt": 16,
+    },
+    # loop control of each iteration
+    "loop_cycles": 1,
+    # acquiring or releasing a lock of an object FIFO
+    "lock_cycles": 4,
+    # bandwidth of a DMA channel in bytes per cycle
+    "dma_bytes_per_cycle": 4,
+    # setup of a DMA transfer
+    "dma_latency": 32,
+    # cycles of the external kernels, indexed by function name
+    "kernel_cycles": {},
+}
+
+# Operations that do not take cycles on the core
+FREE_OPS = {
+    "arith.constant",
+    "affine.yield",
+    "scf.yield",
+    "func.return",
+    "memref.alloc",
+    "memref.dealloc",
+    "memref.subview",
+    "memref.cast",
+    "memref.reinterpret_cast",
+    "memref.collapse_shape",
+    "memref.expand_shape",
+}
+
+
+def get_trip_count(loop_op):
+    """Returns the trip count of an affine.for or scf.for with constant bounds."""
+    if loop_op.operation.name == "affine.for":
+        lower = int(str(loop_op.lowerBoundMap.value.results[0]))
+        upper = int(str(loop_op.upperBoundMap.value.results[0]))
+        step = int(loop_op.step) if loop_op.step is not None else 1
+    else:
+        lower, upper, step = [
+            IntegerAttr(operand.owner.attributes["value"]).value
+            for operand in loop_op.operands[:3]
+        ]
+    return max((upper - lower + step - 1) // step, 0)
+
+
+def append_event(trace, event):
+    # merge adjacent computations
+    if event[0] == "compute" and len(trace) > 0 and trace[-1][0] == "compute":
+        trace[-1] = ("compute", trace[-1][1] + event[1])
+    elif event[0] != "compute" or event[1] > 0:
+        trace.append(event)
+
+
+def get_core_trace(func, stream_args, timing, funcs):
+    """
+    Summarizes a core function as a trace of events.
+
+    Parameters
+    ----------
+    func: func.FuncOp
+        The core function, whose loops have constant bounds.
+
+    stream_args: Dict[int, str]
+        The stream name of each stream argument.
+
+    timing: dict
+        The timing parameters, see `AIE_TIMING`.
+
+    funcs: Dict[str, func.FuncOp]
+        The functions that can be called by the core.
+
+    Returns
+    -------
+    List of ("compute", cycles), ("put", stream), ("get", stream) and
+    ("loop", trip count, trace) events.
+    """
+
+    def visit_block(block, trace):
+        for op in block.operations:
+            name = op.operation.name
+            if name in {"affine.for", "scf.for"}:
+                body = []
+                visit_block(op.regions[0].blocks[0], body)
+                append_event(body, ("compute", timing["loop_cycles"]))
+                trip_count = get_trip_count(op)
+                if all(event[0] == "compute" for event in body):
+                    cycles = sum(event[1] for event in body)
+                    append_event(trace, ("compute", trip_count * cycles))
+                elif trip_count > 0:
+                    trace.append(("loop", trip_count, body))
+            elif name in {"affine.if", "scf.if"}:
+                # the first branch that accesses streams, otherwise the longest one
+                branches = []
+                for region in op.regions:
+                    branch = []
+                    for inner_block in region.blocks:
+                        visit_block(inner_block, branch)
+                    branches.append(branch)
+                streaming = [
+                    branch
+                    for branch in branches
+                    if any(event[0] != "compute" for event in branch)
+                ]
+                if len(streaming) > 0:
+                    branch = streaming[0]
+                else:
+                    branch = max(branches, key=lambda b: sum(e[1] for e in b))
+                for event in branch:
+                    append_event(trace, event)
+            elif isinstance(op, (allo_d.StreamPutOp, allo_d.StreamGetOp)):
+                arg_number = BlockArgument(op.operands[0]).arg_number
+                direction = "put" if isinstance(op, allo_d.StreamPutOp) else "get"
+                trace.append((direction, stream_args[arg_number]))
+            elif name == "func.call":
+                callee = op.attributes["callee"].value
+                if callee in timing["kernel_cycles"]:
+                    append_event(trace, ("compute", timing["kernel_cycles"][callee]))
+                elif callee in funcs and len(funcs[callee].body.blocks) > 0:
+                    visit_block(funcs[callee].entry_block, trace)
+            elif name == "memref.copy":
+                num_elements = 1
+                for dim in MemRefType(op.operands[0].type).shape:
+                    num_elements *= dim
+                append_event(trace, ("compute", num_elements))
+            elif name not in FREE_OPS and not (
+                len(op.results) == 1 and str(op.results[0].type) == "index"
+            ):
+                # index computations are done by the address generators
+                cycles = timing["op_cycles"].get(name, timing["default_op_cycles"])
+                append_event(trace, ("compute", cycles))
+
+    trace = []
+    visit_block(func.entry_block, trace)
+    return trace
+
+
+def expand_trace(trace):
+    """Yields the events of a trace, unrolling the loops."""
+    for event in trace:
+        if event[0] == "loop":
+            for _ in range(event[1]):
+                yield from expand_trace(event[2])
+        else:
+            yield event
+
+
+class FIFOModel:
+    """
+    Timing model of an object FIFO.
+
+    `free` holds the cycles at which the empty objects can be acquired by the
+    producer, and `full` the cycles at which the filled objects can be acquired
+    by the consumer.
+    """
+
+    def __init__(self, depth, latency):
+        self.free = deque([0] * depth)
+        self.full = deque()
+        self.latency = latency
+
+
+def run_cores(traces, start, fifos, lock_cycles):
+    """
+    Replays the traces of the cores on the stream FIFOs.
+
+    Each core runs as far as its FIFOs allow, and the cycles of the FIFO objects
+    keep the timing independent of the order in which the cores are replayed.
+
+    Returns
+    -------
+    Dict[str, dict]: "end", "compute" and "stall" cycles of each core.
+    """
+    cores = {}
+    for core, trace in traces.items():
+        events = expand_trace(trace)
+        cores[core] = {
+            "time": start[core],
+            "compute": 0,
+            "stall": 0,
+            "events": events,
+            "pending": next(events, None),
+        }
+    progress = True
+    while progress:
+        progress = False
+        for state in cores.values():
+            while state["pending"] is not None:
+                kind, arg = state["pending"]
+                if kind == "compute":
+                    state["time"] += arg
+                    state["compute"] += arg
+                else:
+                    fifo = fifos[arg]
+                    objects = fifo.free if kind == "put" else fifo.full
+                    if len(objects) == 0:
+                        break
+                    ready = max(state["time"], objects.popleft())
+                    state["stall"] += ready - state["time"]
+                    # acquire and release
+                    state["time"] = ready + 2 * lock_cycles
+                    if kind == "put":
+                        fifo.full.append(state["time"] + fifo.latency)
+                    else:
+                        fifo.free.append(state["time"])
+                state["pending"] = next(state["events"], None)
+                progress = True
+    blocked = [core for core, state in cores.items() if state["pending"] is not None]
+    if len(blocked) > 0:
+        raise RuntimeError(f"Deadlock: cores {blocked} are blocked on the streams")
+    return {
+        core: {
+            "end": state["time"],
+            "compute": state["compute"],
+            "stall": state["stall"],
+        }
+        for core, state in cores.items()
+    }
+
+
+def emulate_aie(module, func_args, stream_info, configs=None):
+    """
+    Estimates the cycles of an AIE dataflow design.
+
+    The input tensors are sent from the shim tiles through the memory tiles
+    allocated by `allocate_global_io`, each core starts when all its input tiles
+    arrive, exchanges the streams with the other cores, and sends its output tiles
+    back through the memory tiles when it finishes.
+
+    Parameters
+    ----------
+    module: Module
+        The module built for the AIE target, which is lowered in place.
+
+    func_args: Dict[str, List[Union[DTensor, str]]]
+        The arguments of each kernel, where the streams are given by their names.
+
+    stream_info: Dict[str, List[Tuple[str, str]]]
+        The input and output stream of each kernel.
+
+    configs: dict
+        The timing parameters (see `AIE_TIMING`), ``device``, the number of DMA
+        channels of a shim tile (``shim_channels``), and the FIFO depths (see
+        `get_fifo_depths`).
+
+    Returns
+    -------
+    dict: The report with the total "cycles", the "cores" and "channels" statistics,
+    and the "timeline" of (resource, start, end, label) of each activity.
+    """
+    configs = {} if configs is None else configs
+    timing = {key: configs.get(key, value) for key, value in AIE_TIMING.items()}
+    bandwidth = timing["dma_bytes_per_cycle"]
+    dma_latency = timing["dma_latency"]
+    lock_cycles = timing["lock_cycles"]
+    shim_channels = configs.get("shim_channels", 2)
+
+    inputs, outputs = get_global_io(module, func_args)
+    tile_map, _ = allocate_global_io(
+        inputs,
+        outputs,
+        configs.get("device", "npu1_4col"),
+        shim_channels=shim_channels,
+    )
+    lower_tensor_to_memref(module)
+    func_groups = get_func_groups(module)
+    top_func, all_funcs = get_public_funcs(module)
+    funcs = {
+        op.attributes["sym_name"].value: op
+        for op in module.body.operations
+        if isinstance(op, func_d.FuncOp)
+    }
+
+    timeline = []
+    channels = {}
+
+    def transfer(resource, ready, num_bytes, label):
+        # the channel serves the transfers in order
+        stats = channels.setdefault(resource, {"busy": 0, "bytes": 0, "free": 0})
+        start = max(ready, stats["free"])
+        end = start + dma_latency + -(-num_bytes // bandwidth)
+        stats["busy"] += end - start
+        stats["bytes"] += num_bytes
+        stats["free"] = end
+        timeline.append((resource, start, end, label))
+        return end
+
+    def get_cores(func_name, dtensor, label, io_lst):
+        return [
+            f"{func_name}_{'_'.join(str(i) for i in tile)}"
+            for tile in dtensor.global_placement[label]
+            if dtensor in io_lst[func_name][tile]
+        ]
+
+    # shim -> mem -> compute
+    start = {func.attributes["sym_name"].value: 0 for func in all_funcs}
+    for dtensor in inputs["_global"]:
+        tile_bytes = get_type_bytes(dtensor.get_local_shape(), dtensor.dtype)
+        for part in tile_map[dtensor.name]:
+            # the part takes the least busy MM2S channel of its shim tile
+            lanes = [f"shim{part.shim_id}.mm2s{lane}" for lane in range(shim_channels)]
+            lane = min(lanes, key=lambda name: channels.get(name, {"free": 0})["free"])
+            label = f"{dtensor.name} part {part.part_id}"
+            arrival = transfer(lane, 0, part.num_bytes, label)
+            for tensor_tile in part.tensor_tiles:
+                done = transfer(
+                    f"mem{part.mem_id}.mm2s.{dtensor.name}_{tensor_tile}",
+                    arrival,
+                    tile_bytes,
+                    f"{dtensor.name} tile {tensor_tile}",
+                )
+                for func_name in func_groups:
+                    if dtensor not in inputs[func_name]["_global"]:
+                        continue
+                    for core in get_cores(func_name, dtensor, tensor_tile, inputs):
+                        start[core] = max(start[core], done)
+
+    # compute <-> compute
+    stream_in_out = get_stream_in_out(stream_info)
+    stream_fifos = []
+    stream_bytes = {}
+    for op in top_func.entry_block.operations:
+        if isinstance(op, allo_d.StreamConstructOp):
+            stream_name = op.attributes["name"].value
+            if stream_name not in stream_in_out:
+                continue
+            stream_type_str = str(op.results.types[0])
+            type_str, depth_str = stream_type_str[
+                stream_type_str.find("<") + 1 : stream_type_str.rfind(">")
+            ].split(",")
+            dims = type_str.strip().replace("memref<", "").rstrip(">").split("x")
+            stream_bytes[stream_name] = get_type_bytes(
+                [int(dim) for dim in dims[:-1]], dims[-1]
+            )
+            stream_fifos.append(
+                (stream_name, stream_bytes[stream_name], [], int(depth_str))
+            )
+    depths = get_fifo_depths(stream_fifos, configs)
+    fifos = {
+        name: FIFOModel(depths[name], lock_cycles + -(-num_bytes // bandwidth))
+        for name, num_bytes in stream_bytes.items()
+    }
+    traces = {}
+    for func in all_funcs:
+        func_name = func.attributes["sym_name"].value
+        stream_args = {
+            idx: arg
+            for idx, arg in enumerate(func_args[func_name])
+            if isinstance(arg, str)
+        }
+        traces[func_name] = get_core_trace(func, stream_args, timing, funcs)
+    # acquire the input tiles
+    num_inputs = {
+        f"{func_name}_{'_'.join(str(i) for i in func_id)}": len(dtensors)
+        for func_name, sub_func_lst in inputs.items()
+        if func_name != "_global"
+        for func_id, dtensors in sub_func_lst.items()
+        if func_id != "_global"
+    }
+    for core in start:
+        start[core] += num_inputs.get(core, 0) * lock_cycles
+    cores = run_cores(traces, start, fifos, lock_cycles)
+    for core, stats in cores.items():
+        stats["start"] = start[core]
+        timeline.append((core, stats["start"], stats["end"], "core"))
+
+    # compute -> mem -> shim
+    total = max((stats["end"] for stats in cores.values()), default=0)
+    for dtensor in outputs["_global"]:
+        tile_bytes = get_type_bytes(dtensor.get_local_shape(), dtensor.dtype)
+        for part in tile_map[dtensor.name]:
+            ready = 0
+            for tensor_tile in part.tensor_tiles:
+                for func_name in func_groups:
+                    if dtensor not in outputs[func_name]["_global"]:
+                        continue
+                    for core in get_cores(func_name, dtensor, tensor_tile, outputs):
+                        done = transfer(
+                            f"mem{part.mem_id}.s2mm.{dtensor.name}_{tensor_tile}",
+                            cores[core]["end"] + lock_cycles,
+                            tile_bytes,
+                            f"{dtensor.name} tile {tensor_tile}",
+                        )
+                        cores[core]["output"] = max(cores[core].get("output", 0), done)
+                        ready = max(ready, done)
+            lanes = [f"shim{part.shim_id}.s2mm{lane}" for lane in range(shim_channels)]
+            lane = min(lanes, key=lambda name: channels.get(name, {"free": 0})["free"])
+            total = max(
+                total,
+                transfer(
+                    lane, ready, part.num_bytes, f"{dtensor.name} part {part.part_id}"
+                ),
+            )
+
+    for core, stats in cores.items():
+        waits = {
+            "compute": stats["compute"],
+            "stream": stats["stall"],
+            "dma": stats["start"] + stats.pop("output", stats["end"]) - stats["end"],
+        }
+        stats["bound"] = max(waits, key=waits.get)
+    for stats in channels.values():
+        stats.pop("free")
+    timeline.sort(key=lambda item: (item[1], item[0]))
+    return {
+        "cycles": total,
+        "cores": cores,
+        "channels": channels,
+        "timeline": timeline,
+    }
+
+
+def format_emulation_report(report):
+    """Returns the lines that summarize an emulation report."""
+    lines = [f"total: {report['cycles']} cycles"]
+    for core, stats in sorted(report["cores"].items()):
+        lines.append(
+            f"core {core}: {stats['start']} - {stats['end']}, "
+            f"compute {stats['compute']}, stall {stats['stall']}, {stats['bound']}-bound"
+        )
+    for name, stats in sorted(report["channels"].items()):
+        utilization = stats["busy"] / report["cycles"] if report["cycles"] > 0 else 0
+        lines.append(
+            f"channel {name}: {stats['bytes']} bytes, busy {stats['busy']} "
+            f"({utilization:.0%})"
+        )
+    return lines
+
+
+class AIEEmulatorModule:
+    """
+    Emulates an AIE dataflow design without the AIE toolchain.
+
+    Calls are executed by the dataflow simulator (``sim_mod``, an `LLVMOMPModule`
+    built from the region), so the outputs are computed by the OpenMP simulator and
+    not by the per-core functions of the AIE module, which are not run through the
+    LLVM path. ``report`` holds the estimated cycles of the design, see
+    `emulate_aie`, which only analyzes the per-core functions.
+    """
+
+    def __init__(
+        self, sim_mod, module, top_func_name, func_args, stream_info, configs=None
+    ):
+        self.sim_mod = sim_mod
+        self.top_func_name = top_func_name
+        self.report = emulate_aie(module, func_args, stream_info, configs)
+
+    def __call__(self, *args):
+        return self.sim_mod(*args)
+
+    def __repr__(self):
+        return "\n".join(format_emulation_report(self.report))
@@ -0,0 +1,501 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+# This file implements a planner that enumerates the tensor-parallel shardings of a
+# dataflow kernel, i.e., its mapping and the layouts of its tensors, and ranks them
+# by an analytical estimate of their throughput on the NPU. The index structure of
+# the kernel is either derived from the loads and stores of its function or given
+# by an einsum.
+
+import re
+from collections import namedtuple
+from itertools import combinations, product
+
+import numpy as np
+
+from .._mlir.ir import AffineMapAttr, BlockArgument, MemRefType
+from .._mlir.dialects.affine import AffineDimExpr
+from .._mlir.passmanager import PassManager as mlir_pass_manager
+from ..memory import DTensor, Layout
+from ..passes import _walk_ops, analyze_read_write_patterns
+from .ai_engine import (
+    LOCAL_MEMORY,
+    allocate_global_io,
+    get_func_groups,
+    get_kernel_footprints,
+    get_type_bytes,
+)
+from .aie_emulator import AIE_TIMING, get_trip_count
+
+# Peak multiply-accumulates per cycle of a compute tile, indexed by element type
+AIE_MACS_PER_CYCLE = {"i8": 256, "i16": 64, "i32": 16, "bf16": 128, "f32": 16}
+
+ShardingPlan = namedtuple(
+    "ShardingPlan",
+    "mapping layouts local_shapes local_bytes io_bytes compute_cycles io_cycles cycles",
+)
+
+# The index structure of a kernel. Every tensor argument has a name, a global shape,
+# an element type, whether it is written, and the index of each of its dimensions,
+# or None if the dimension cannot be sharded. Every statement is a tuple of the
+# (index, trip count) of its loops, and the fixed indices, e.g., reductions, are
+# not sharded. The local buffers are (shape, element type, indices) tuples.
+KernelIndices = namedtuple(
+    "KernelIndices",
+    "names shapes dtypes outputs indices extents statements fixed buffers",
+)
+
+
+def parse_einsum(einsum, shapes):
+    """
+    Returns the indices of every tensor of an einsum, e.g., "mk,kn->mn", whose
+    output is the last tensor, and the extent of every index.
+    """
+    inputs, output = einsum.replace(" ", "").split("->")
+    indices = inputs.split(",") + [output]
+    if len(indices) != len(shapes):
+        raise ValueError(f"Expected {len(indices)} tensor shapes for {einsum}.")
+    extents = {}
+    for tensor_indices, shape in zip(indices, shapes):
+        if len(tensor_indices) != len(shape):
+            raise ValueError(f"Shape {shape} does not match indices {tensor_indices}.")
+        for index, size in zip(tensor_indices, shape):
+            if extents.setdefault(index, size) != size:
+                raise ValueError(f"Index {index} has different extents in {einsum}.")
+    return indices, extents
+
+
+def get_einsum_indices(einsum, shapes, dtype, names=None):
+    """
+    Returns the index structure of a kernel given by an einsum, which is a single
+    statement over all the indices and whose contraction indices are fixed.
+    """
+    indices, extents = parse_einsum(einsum, shapes)
+    if names is None:
+        names = [chr(ord("A") + i) for i in range(len(indices))]
+    if len(names) != len(indices):
+        raise ValueError(f"Expected {len(indices)} tensor names for {einsum}.")
+    return KernelIndices(
+        list(names),
+        [tuple(shape) for shape in shapes],
+        [dtype] * len(indices),
+        [False] * (len(indices) - 1) + [True],
+        [tuple(tensor_indices) for tensor_indices in indices],
+        extents,
+        [tuple(extents.items())],
+        {index for index in extents if index not in indices[-1]},
+        [],
+    )
+
+
+def get_kernel_indices(module, func_args, kernel_name=None):
+    """
+    Derives the index structure of a kernel of a dataflow region from the affine
+    loads and stores of its function, after lowering its linalg operations.
+
+    The loops that index the same dimension of a tensor or a local buffer share
+    an index. A dimension cannot be sharded if it is accessed with an offset
+    (e.g., a stencil), by an expression of several loops, through a partial view
+    or by an operation that is not analyzed, e.g., an external kernel, and the
+    loops that index it are fixed, as are the loops of a statement that writes
+    a tensor argument without indexing it, i.e., the reductions.
+
+    Parameters
+    ----------
+    module: Module
+        The module of the region built for the AIE.
+
+    func_args: Dict[str, List[Union[DTensor, str]]]
+        The arguments of each kernel function.
+
+    kernel_name: str
+        The name of the kernel, which can be omitted if the region has only one.
+        The kernel must have a single instance, so that its loops cover the global
+        tensors.
+    """
+    func_groups = get_func_groups(module)
+    if kernel_name is None:
+        if len(func_groups) != 1:
+            raise ValueError(f"Expected one of the kernels {list(func_groups)}.")
+        kernel_name = next(iter(func_groups))
+    if kernel_name not in func_groups:
+        raise ValueError(f"Kernel {kernel_name} is not in the region.")
+    if len(func_groups[kernel_name]) != 1:
+        raise ValueError(
+            f"Kernel {kernel_name} must have a single instance to be planned."
+        )
+    func = func_groups[kernel_name][0]
+    func_name = func.attributes["sym_name"].value
+    _, out_idx = analyze_read_write_patterns(func)
+    with module.context:
+        mlir_pass_manager.parse(
+            "builtin.module(func.func(convert-linalg-to-affine-loops))"
+        ).run(module.operation)
+    # union-find over the loops
+    parents, trips = [], []
+    # a loop that indexes each (memref, dimension), the dimensions that cannot
+    # be sharded, and the loops that cannot be sharded
+    dim_loops, unshardable, fixed_loops = {}, set(), set()
+    # the loops of each statement and the memref that it writes
+    statements = []
+
+    def find(loop):
+        while parents[loop] != loop:
+            parents[loop] = parents[parents[loop]]
+            loop = parents[loop]
+        return loop
+
+    def new_loop(trip):
+        parents.append(len(parents))
+        trips.append(trip)
+        return len(parents) - 1
+
+    def link(memref, dim, loop):
+        if (memref, dim) in dim_loops:
+            parents[find(loop)] = find(dim_loops[(memref, dim)])
+        else:
+            dim_loops[(memref, dim)] = loop
+
+    def resolve(value):
+        # returns the memref fully viewed by `value`
+        while (
+            not BlockArgument.isinstance(value)
+            and value.owner.operation.name == "memref.subview"
+        ):
+            source = value.owner.operands[0]
+            if MemRefType(source.type).shape != MemRefType(value.type).shape:
+                mark(source)
+                break
+            value = source
+        return value
+
+    def mark(value):
+        memref = resolve(value)
+        unshardable.update((memref, dim) for dim in range(MemRefType(memref.type).rank))
+
+    def access(memref, dims, loops):
+        # `dims` has the values that index each dimension and whether the index is
+        # a plain value
+        memref = resolve(memref)
+        ivs = dict(loops)
+        for dim, (values, plain) in enumerate(dims):
+            used = [ivs.get(value) for value in values]
+            if plain and len(used) == 1 and used[0] is not None:
+                link(memref, dim, used[0])
+            else:
+                unshardable.add((memref, dim))
+                fixed_loops.update(loop for loop in used if loop is not None)
+        return memref
+
+    def visit(op, loops):
+        name = op.operation.name
+        if name in {"affine.for", "scf.for"}:
+            loops = loops + [(op.induction_variable, new_loop(get_trip_count(op)))]
+        elif name in {"affine.load", "affine.store", "memref.load", "memref.store"}:
+            pos = 1 if name.endswith("store") else 0
+            operands = op.operands[pos + 1 :]
+            if name.startswith("affine"):
+                dims = [
+                    (
+                        [
+                            operands[int(i)]
+                            for i in sorted(set(re.findall(r"\bd(\d+)\b", str(expr))))
+                        ],
+                        AffineDimExpr.isinstance(expr),
+                    )
+                    for expr in AffineMapAttr(op.attributes["map"]).value.results
+                ]
+            else:
+                dims = [([operand], True) for operand in operands]
+            memref = access(op.operands[pos], dims, loops)
+            if pos == 1:
+                statements.append(([loop for _, loop in loops], memref))
+        elif name == "memref.copy":
+            source, target = resolve(op.operands[0]), resolve(op.operands[1])
+            copy_loops = [new_loop(size) for size in MemRefType(target.type).shape]
+            for dim, loop in enumerate(copy_loops):
+                link(source, dim, loop)
+                link(target, dim, loop)
+            statements.append(([loop for _, loop in loops] + copy_loops, target))
+        elif name not in {"memref.subview", "memref.dealloc"}:
+            for operand in op.operands:
+                if MemRefType.isinstance(operand.type):
+                    mark(operand)
+        for region in op.regions:
+            for block in region.blocks:
+                for inner_op in block.operations:
+                    visit(inner_op, loops)
+
+    for block in func.body.blocks:
+        for op in block.operations:
+            visit(op, [])
+    tensors = [
+        (func.arguments[idx], dtensor, idx in out_idx)
+        for idx, dtensor in enumerate(func_args[func_name])
+        if not isinstance(dtensor, str)
+    ]
+    buffers = [
+        op.result
+        for op in _walk_ops(func.operation)
+        if op.operation.name == "memref.alloc"
+    ]
+    # every class of loops is an index
+    index_of = {}
+    for loop in range(len(parents)):
+        index_of.setdefault(find(loop), len(index_of))
+    fixed = {index_of[find(loop)] for loop in fixed_loops}
+    fixed.update(
+        index_of[find(dim_loops[key])] for key in unshardable if key in dim_loops
+    )
+    for loops, memref in statements:
+        if memref in [arg for arg, _, _ in tensors]:
+            written = {
+                find(dim_loops[(memref, dim)])
+                for dim in range(MemRefType(memref.type).rank)
+                if (memref, dim) in dim_loops
+            }
+            fixed.update(
+                index_of[find(loop)] for loop in loops if find(loop) not in written
+            )
+
+    def get_indices(memref):
+        indices = tuple(
+            (
+                index_of[find(dim_loops[(memref, dim)])]
+                if (memref, dim) in dim_loops and (memref, dim) not in unshardable
+                else None
+            )
+            for dim in range(MemRefType(memref.type).rank)
+        )
+        # an index of several dimensions of a tensor, e.g., a diagonal
+        fixed.update(
+            index for index in indices if index is not None and indices.count(index) > 1
+        )
+        return indices
+
+    extents = {}
+    for loop in range(len(parents)):
+        index = index_of[find(loop)]
+        extents[index] = max(extents.get(index, 0), trips[loop])
+    tensor_indices = [get_indices(arg) for arg, _, _ in tensors]
+    buffer_indices = [get_indices(buffer) for buffer in buffers]
+    sizes = {}
+    for (_, dtensor, _), indices in zip(tensors, tensor_indices):
+        for index, size in zip(indices, dtensor.shape):
+            if index is not None:
+                sizes.setdefault(index, set()).add(size)
+    for index, index_sizes in sizes.items():
+        if len(index_sizes) > 1:
+            fixed.add(index)
+        extents[index] = max(index_sizes)
+    return KernelIndices(
+        [dtensor.name for _, dtensor, _ in tensors],
+        [tuple(dtensor.shape) for _, dtensor, _ in tensors],
+        [dtensor.dtype for _, dtensor, _ in tensors],
+        [output for _, _, output in tensors],
+        tensor_indices,
+        extents,
+        [
+            tuple((index_of[find(loop)], trips[loop]) for loop in loops)
+            for loops, _ in statements
+        ],
+        fixed,
+        [
+            (
+                MemRefType(buffer.type).shape,
+                MemRefType(buffer.type).element_type,
+                indices,
+            )
+            for buffer, indices in zip(buffers, buffer_indices)
+        ],
+    )
+
+
+def get_layout(tensor_indices, sharded):
+    """
+    Returns the layout of a tensor, where `sharded[j]` is the index sharded along
+    dimension j of the kernel mapping. Since the mesh dimensions of a layout are
+    counted from right to left, it is sharded on mesh dimension len(sharded) - 1 - j.
+    """
+    return Layout(
+        "".join(
+            f"S{len(sharded) - 1 - sharded.index(index)}" if index in sharded else "R"
+            for index in tensor_indices
+        )
+    )
+
+
+def estimate_plan(kernel, mapping, sharded, configs):
+    """
+    Estimates the cost of a sharding, or returns None if it is invalid: a tensor
+    cannot be evenly sharded, the local tensors and buffers do not fit in the data
+    memory of a compute tile, or the global I/O does not fit in the DMA channels.
+
+    The compute cycles are the local iterations of the statements, as MACs at the
+    peak rate of the tile for the element type of the first tensor, and the I/O
+    cycles are the bytes moved by the busiest shim tile at the DMA bandwidth of
+    its channels. The transfers are double buffered, so the design takes the
+    larger of the two per iteration.
+    """
+    layouts, dtensors = {}, []
+    for name, shape, dtype, tensor_indices in zip(
+        kernel.names, kernel.shapes, kernel.dtypes, kernel.indices
+    ):
+        layouts[name] = get_layout(tensor_indices, sharded)
+        dtensors.append(
+            DTensor(0, mapping, list(shape), dtype, layouts[name], name=name)
+        )
+    inputs = [dtensor for dtensor, out in zip(dtensors, kernel.outputs) if not out]
+    outputs = [dtensor for dtensor, out in zip(dtensors, kernel.outputs) if out]
+    try:
+        for dtensor in dtensors:
+            dtensor.get_access_pattern()
+        _, load = allocate_global_io(
+            {"kernel": {"_global": inputs}},
+            {"kernel": {"_global": outputs}},
+            configs.get("device", "npu1_4col"),
+        )
+    except (ValueError, RuntimeError):
+        return None
+    local_shapes = {dtensor.name: dtensor.get_local_shape() for dtensor in dtensors}
+    depth = configs.get("fifo_depth", 2)
+    depth = depth if isinstance(depth, int) else 2
+    num_shards = dict(zip(sharded, mapping))
+    local_bytes = depth * sum(
+        get_type_bytes(dtensor.get_local_shape(), dtensor.dtype) for dtensor in dtensors
+    ) + sum(
+        get_type_bytes(
+            [size // num_shards.get(index, 1) for size, index in zip(shape, indices)],
+            dtype,
+        )
+        for shape, dtype, indices in kernel.buffers
+    )
+    if local_bytes > configs.get("local_memory", LOCAL_MEMORY):
+        return None
+    macs = sum(
+        int(np.prod([trip // num_shards.get(index, 1) for index, trip in statement]))
+        for statement in kernel.statements
+    )
+    macs_per_cycle = configs.get("macs_per_cycle", AIE_MACS_PER_CYCLE)[
+        str(kernel.dtypes[0])
+    ]
+    compute_cycles = -(-macs // macs_per_cycle)
+    bandwidth = configs.get("dma_bytes_per_cycle", AIE_TIMING["dma_bytes_per_cycle"])
+    io_cycles = max(
+        -(-usage["bytes"] // (bandwidth * (usage["mm2s"] + usage["s2mm"])))
+        for usage in load["shim"].values()
+    )
+    return ShardingPlan(
+        list(mapping),
+        layouts,
+        local_shapes,
+        local_bytes,
+        sum(usage["bytes"] for usage in load["shim"].values()),
+        compute_cycles,
+        io_cycles,
+        max(compute_cycles, io_cycles),
+    )
+
+
+def plan_kernel_sharding(kernel, mesh, configs=None, num_plans=5):
+    """
+    Enumerates the tensor-parallel shardings of a kernel and returns the best ones.
+
+    Every sharding splits some of the indices of the outputs of the kernel across
+    the dimensions of its mapping, and each tensor is sharded along the indices it
+    has and replicated along the others, e.g., "mk,kn->mn" sharded on m and n
+    gives the mapping [Pm, Pn] with layouts S1R, RS0 and S1S0. The fixed indices
+    are not sharded, e.g., a contraction index, as the partial sums would need an
+    extra accumulation kernel. The mappings must fit in the device mesh (see
+    `get_kernel_footprints`).
+
+    Parameters
+    ----------
+    kernel: KernelIndices
+        The index structure of the kernel, derived from a region by
+        `get_kernel_indices` or given by an einsum to `get_einsum_indices`.
+
+    mesh: List[int]
+        The shape of the mesh of compute tiles [rows, cols].
+
+    configs: dict
+        The device ("device"), the data memory of a tile ("local_memory"), the depth of
+        the object FIFOs ("fifo_depth"), the peak MACs per cycle of each element type
+        ("macs_per_cycle") and the DMA bandwidth ("dma_bytes_per_cycle").
+
+    num_plans: int
+        The number of plans to return.
+
+    Returns
+    -------
+    List[ShardingPlan]
+        The plans ranked by the estimated cycles per iteration, with fewer compute
+        tiles and fewer bytes moved first on ties.
+    """
+    configs = {} if configs is None else configs
+    if str(kernel.dtypes[0]) not in configs.get("macs_per_cycle", AIE_MACS_PER_CYCLE):
+        raise ValueError(f"Unsupported element type {kernel.dtypes[0]}.")
+    candidates = []
+    for output, tensor_indices in zip(kernel.outputs, kernel.indices):
+        for index in tensor_indices:
+            if (
+                output
+                and index is not None
+                and index not in kernel.fixed
+                and index not in candidates
+            ):
+                candidates.append(index)
+    plans = []
+    # the unsharded kernel runs on a single tile
+    plan = estimate_plan(kernel, [1], [], configs)
+    if plan is not None:
+        plans.append(plan)
+    # the kernels have at most 3 mapping dimensions
+    for rank in range(1, min(len(candidates), 3) + 1):
+        # the order of the sharded indices only permutes the tiles
+        for sharded in combinations(candidates, rank):
+            divisors = [
+                [
+                    p
+                    for p in range(2, kernel.extents[index] + 1)
+                    if kernel.extents[index] % p == 0
+                ]
+                for index in sharded
+            ]
+            for mapping in product(*divisors):
+                if len(get_kernel_footprints(mapping, mesh)) == 0:
+                    continue
+                plan = estimate_plan(kernel, mapping, list(sharded), configs)
+                if plan is not None:
+                    plans.append(plan)
+    plans.sort(
+        key=lambda plan: (plan.cycles, int(np.prod(plan.mapping)), plan.io_bytes)
+    )
+    return plans[:num_plans]
+
+
+def plan_sharding(einsum, shapes, dtype, mesh, names=None, configs=None, num_plans=5):
+    """
+    Enumerates the tensor-parallel shardings of a kernel given by an einsum, e.g.,
+    "mk,kn->mn" with the shapes of the inputs and the output, the element type
+    of the tensors and their names, "A", "B", ... by default. See
+    `plan_kernel_sharding` for the other parameters, and
+    `allo.dataflow.plan_sharding` to derive the kernel from a region instead.
+    """
+    return plan_kernel_sharding(
+        get_einsum_indices(einsum, shapes, dtype, names), mesh, configs, num_plans
+    )
+
+
+def format_sharding_plans(plans):
+    """Returns the lines that report the sharding plans, one per plan."""
+    lines = []
+    for plan in plans:
+        layouts = ", ".join(
+            f"{name}: {repr(layout)[7:-1]}" for name, layout in plan.layouts.items()
+        )
+        lines.append(
+            f"mapping {plan.mapping} ({layouts}): {plan.cycles} cycles/iter, "
+            f"compute {plan.compute_cycles}, I/O {plan.io_cycles}, "
+            f"{plan.io_bytes} bytes/iter, {plan.local_bytes} bytes/tile"
+        )
+    return lines
@@ -27,3 +27,13 @@ PART_NUMBER = {
     "u250": "xcu250-figd2104-2L-e",
     "u280": "xcu280-fsvh2892-2L-e",
 }
+
+MEMORY_BANKS = {
+    # Memory resources that kernel arguments can be connected to
+    # https://docs.amd.com/r/en-US/ug1393-vitis-application-acceleration/Mapping-Kernel-Ports-to-Memory
+    "u50": [f"HBM[{i}]" for i in range(32)],
+    "u55c": [f"HBM[{i}]" for i in range(32)],
+    "u280": [f"HBM[{i}]" for i in range(32)],
+    "u200": [f"DDR[{i}]" for i in range(4)],
+    "u250": [f"DDR[{i}]" for i in range(4)],
+}
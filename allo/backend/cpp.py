@@ -0,0 +1,141 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+# This file implements the ahead-of-time compiled CPU backend, which compiles the
+# lowered LLVM IR with a native compiler instead of the MLIR JIT.
+# pylint: disable=no-name-in-module
+
+import os
+import shutil
+import ctypes
+import tempfile
+
+from .llvm import LLVMModule
+from .ip import get_source_hash, build_cached
+
+
+class NativeEngine:
+    """Calls the C interface of a compiled kernel.
+
+    `invoke` takes the same packed arguments as ``ExecutionEngine.invoke``,
+    i.e., a pointer to each argument, followed by a pointer to the scalar
+    result if the function returns a scalar.
+    """
+
+    def __init__(self, lib_path, scalar_return=False):
+        self.lib_path = lib_path
+        self.lib = ctypes.CDLL(lib_path)
+        self.scalar_return = scalar_return
+
+    def invoke(self, name, *args):
+        func = getattr(self.lib, f"_mlir_ciface_{name}")
+        return_ptr = None
+        if self.scalar_return:
+            *args, return_ptr = args
+            func.restype = return_ptr._type_
+        else:
+            func.restype = None
+        c_args = []
+        for arg in args:
+            if isinstance(arg, ctypes.Array):
+                # scalars are passed by value
+                c_args.append(arg._type_(arg[0]))
+            else:
+                # memrefs are passed as pointers to their descriptors
+                c_args.append(arg.contents)
+        ret = func(*c_args)
+        if return_ptr is not None:
+            return_ptr[0] = ret
+
+
+def get_native_compile_cmd(ll_file, cflags, compiler=None):
+    """Returns the command that compiles `ll_file` into a shared library.
+
+    clang from LLVM_BUILD_DIR (or PATH) compiles the LLVM IR directly.
+    Otherwise, the IR is compiled by llc and linked by g++.
+    """
+    bin_dir = os.path.join(os.getenv("LLVM_BUILD_DIR"), "bin")
+    clang = os.path.join(bin_dir, "clang")
+    if not os.path.exists(clang):
+        clang = shutil.which("clang")
+    if compiler is None:
+        compiler = "clang" if clang is not None else "llc"
+    if compiler == "clang":
+        if clang is None:
+            raise RuntimeError("clang is not found")
+        return f"{clang} {cflags} -shared -fPIC -Wno-override-module {ll_file} -o {{output}}"
+    if compiler == "llc":
+        # llc only takes the optimization level and the target CPU
+        opt_level = "-O3"
+        for flag in cflags.split():
+            if flag in {"-O0", "-O1", "-O2", "-O3"}:
+                opt_level = flag
+        mcpu = "-mcpu=native" if "-march=native" in cflags else ""
+        return (
+            f"{bin_dir}/llc {opt_level} {mcpu} -relocation-model=pic -filetype=obj "
+            f"{ll_file} -o {ll_file}.o && g++ -shared {ll_file}.o -o {{output}}"
+        )
+    raise ValueError(f"Unsupported compiler {compiler}")
+
+
+class CPPModule(LLVMModule):
+    """Kernel compiled ahead of time into a shared library.
+
+    The module is lowered in the same way as ``LLVMModule``, translated to
+    LLVM IR, and compiled with ``cflags`` (``-O3 -march=native`` by default).
+    The library is named after the hash of the IR and the flags, and is kept
+    under ``project`` (or a temporary folder), so it can be reused by later
+    builds or loaded by other programs through ``_mlir_ciface_{top}``.
+    """
+
+    def __init__(
+        self,
+        mod,
+        top_func_name,
+        ext_libs=None,
+        project=None,
+        cflags=None,
+        compiler=None,
+        configs=None,
+    ):
+        self.project = (
+            project
+            if project is not None
+            else os.path.join(tempfile.gettempdir(), "allo_cpp")
+        )
+        self.cflags = "-O3 -march=native" if cflags is None else cflags
+        self.compiler = compiler
+        self.lib_path = None
+        super().__init__(mod, top_func_name, ext_libs=ext_libs, configs=configs)
+
+    def create_execution_engine(self, shared_libs):
+        # half and bfloat scalars are passed in floating-point registers by the
+        # C ABI, but the packed arguments only hold their bits as 16-bit integers
+        for dtype, shape in list(self.in_types) + list(self.out_types):
+            if len(shape) == 0 and dtype in {"f16", "bf16"}:
+                raise RuntimeError(
+                    f"The cpp target does not support {dtype} scalar arguments "
+                    "or results, please pass them as arrays"
+                )
+        os.makedirs(self.project, exist_ok=True)
+        llvm_dialect = str(self.module)
+        lib_hash = get_source_hash(llvm_dialect, self.cflags, *shared_libs)
+        prefix = os.path.join(self.project, f"{self.top_func_name}_{lib_hash}")
+        mlir_file = f"{prefix}.mlir"
+        with open(mlir_file, "w", encoding="utf-8") as outfile:
+            outfile.write(llvm_dialect)
+        bin_dir = os.path.join(os.getenv("LLVM_BUILD_DIR"), "bin")
+        ll_file = build_cached(
+            f"{bin_dir}/mlir-translate --mlir-to-llvmir {mlir_file} -o {{output}}",
+            f"{prefix}.ll",
+            f"{self.top_func_name}.ll",
+        )
+        cmd = get_native_compile_cmd(ll_file, self.cflags, self.compiler)
+        # runtime libraries and external kernels are found through rpath
+        for lib in shared_libs:
+            cmd += f" {lib} -Wl,-rpath,{os.path.dirname(os.path.abspath(lib))}"
+        self.lib_path = build_cached(cmd, f"{prefix}.so", f"lib{self.top_func_name}.so")
+        scalar_return = len(self.out_types) == 1 and len(self.out_types[0][1]) == 0
+        return NativeEngine(self.lib_path, scalar_return=scalar_return)
+
+    def __repr__(self):
+        return f"CPPModule({self.top_func_name}, {self.lib_path})"
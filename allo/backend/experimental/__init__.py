@@ -3,8 +3,10 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import os
+import json
 import subprocess
 import shutil
+import tempfile
 
 try:
     import aie.ir as aie_ir
@@ -14,9 +16,11 @@ except ImportError:
 import allo._mlir._mlir_libs._mlir as allo_ir
 from ..._mlir.dialects import func as allo_func_d
 
-from ...passes import analyze_read_write_patterns
+from ...passes import analyze_read_write_patterns, vectorize_loops
 from ...memory import DTensor
 from .external_kernel import ExternalModule
+from ..ai_engine import format_io_load, get_vector_lanes, AIE_VECTOR_BITS
+from ..ip import get_source_hash, build_cached, read_local_includes
 
 from ..._mlir.passmanager import PassManager as mlir_pass_manager
 from .mlir_codegen import CodeGenerator, Argument, Stream
@@ -26,9 +30,112 @@ from .utils import (
     codegen_external_kernels,
     read_tensor_from_file,
     codegen_host,
+    codegen_pipeline_host,
 )
 
 
+# the flags to compile the external kernels with Peano
+EXTERNAL_KERNEL_FLAGS = "-O2 -std=c++20 --target=aie2-none-unknown-elf -Wno-parentheses -Wno-attributes -Wno-macro-redefined -DNDEBUG"
+
+
+def write_if_changed(path: str, content: str):
+    """
+    Write the file unless it already has the content, so that its timestamp
+    (used by the incremental CMake builds) is kept.
+    """
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                return
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+class BuildManifest:
+    """
+    The content hashes of the inputs each artifact of a project was last built from,
+    stored in build/hashes.json. An artifact is rebuilt only if its hash changes.
+    """
+
+    def __init__(self, project_dir: str):
+        self.path = os.path.join(project_dir, "build", "hashes.json")
+        self.hashes: dict[str, str] = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.hashes = json.load(f)
+
+    def is_valid(self, artifact: str, key: str, outputs: list[str]) -> bool:
+        return self.hashes.get(artifact) == key and all(
+            os.path.exists(output) for output in outputs
+        )
+
+    def update(self, artifact: str, key: str):
+        self.hashes[artifact] = key
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.hashes, f, indent=2)
+
+
+def compile_external_kernels(project_dir: str, cache_dir: str = None) -> str:
+    """
+    Compile external.cc of the project into external.o.
+    The objects are cached in `cache_dir` keyed by the source, the local headers it
+    includes, the flags and the toolchain, so they are shared by all the projects.
+    Returns the hash of the object.
+    """
+    if cache_dir is None:
+        cache_dir = os.path.join(tempfile.gettempdir(), "allo_aie_kernels")
+    cache_dir = os.path.abspath(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(project_dir, "external.cc"), "r", encoding="utf-8") as f:
+        code = f.read()
+    key = get_source_hash(
+        code,
+        *read_local_includes(code, project_dir),
+        EXTERNAL_KERNEL_FLAGS,
+        *[
+            os.environ.get(var, "")
+            for var in (
+                "PEANO_INSTALL_DIR",
+                "MLIR_AIE_INSTALL_DIR",
+                "MLIR_AIE_EXTERNAL_KERNEL_DIR",
+            )
+        ],
+    )
+    cmd = f"cd {project_dir} && $PEANO_INSTALL_DIR/bin/clang++ {EXTERNAL_KERNEL_FLAGS} -I $MLIR_AIE_INSTALL_DIR/include -I $MLIR_AIE_EXTERNAL_KERNEL_DIR/aie2 -I. -c external.cc -o {{output}}"
+    obj = build_cached(
+        cmd, os.path.join(cache_dir, f"external_{key}.o"), "external kernels"
+    )
+    shutil.copy(obj, os.path.join(project_dir, "external.o"))
+    return key
+
+
+def build_host(project_dir: str, host_code: str):
+    """
+    Generate the host program of the project and build it with CMake, unless the
+    host code and the harness have not changed since the last build.
+    """
+    path = os.path.dirname(__file__)
+    path = os.path.join(path, "../../harness/aie")
+    harness = []
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), "r", encoding="utf-8") as f:
+            harness.append(f.read())
+    cmd = f"cd {project_dir}/build && cmake .. -DTARGET_NAME=top -DMLIR_AIE_DIR=$RUNTIME_LIB_DIR/.. && cmake --build . --config Release"
+    key = get_source_hash(host_code, *harness, cmd)
+    manifest = BuildManifest(project_dir)
+    if manifest.is_valid("host", key, [os.path.join(project_dir, "build", "top")]):
+        return
+    for name in os.listdir(path):
+        shutil.copy(os.path.join(path, name), project_dir)
+    write_if_changed(os.path.join(project_dir, "test.cpp"), host_code)
+    with subprocess.Popen(cmd, shell=True) as process:
+        process.wait()
+    if process.returncode != 0:
+        raise RuntimeError("Failed to build AIE project.")
+    manifest.update("host", key)
+
+
 class AIE_MLIRModule:
     def __init__(
         self,
@@ -174,6 +281,7 @@ class AIE_MLIRModule:
     def build(
         self,
         device_type="npu1_4col",
+        configs: dict = None,
         profile: bool = False,
         warmup: int = 20,
         num_iters: int = 100,
@@ -181,10 +289,21 @@ class AIE_MLIRModule:
         self.profile = profile
         self.warmup = warmup
         self.num_iters = num_iters
-        build_dir = os.path.join(self.project_dir, "build")
-        if os.path.exists(build_dir):
-            shutil.rmtree(build_dir)
-        os.makedirs(build_dir)
+        self.build_design(device_type, configs)
+        build_host(
+            self.project_dir, codegen_host(self.global_inputs, self.global_outputs)
+        )
+        return self
+
+    def build_design(self, device_type="npu1_4col", configs: dict = None):
+        """
+        Compile the design into build/final.xclbin and its instruction sequence insts.txt.
+        The artifacts are kept across builds: the external kernels and the xclbin are
+        only recompiled if their sources change (see BuildManifest).
+        """
+        configs = {} if configs is None else configs
+        os.makedirs(os.path.join(self.project_dir, "build"), exist_ok=True)
+        manifest = BuildManifest(self.project_dir)
         # TODO: maybe use other ways to capture the relationship between DTensor, function group
         _, core_func_groups, _ = classify_aie_functions(
             self.allo_module, self.top_func_name
@@ -196,22 +315,36 @@ class AIE_MLIRModule:
             self.allo_module, self.top_func_name, self.external_kernel_lib
         )
         # record original allo mlir
-        with open(
-            os.path.join(self.project_dir, "original.mlir"), "w", encoding="utf-8"
-        ) as f:
-            f.write(str(self.allo_module))
+        write_if_changed(
+            os.path.join(self.project_dir, "original.mlir"), str(self.allo_module)
+        )
         # - lower tensor to memref with registered pass
-        passes = [
-            "func.func(convert-linalg-to-affine-loops),lower-affine",
-        ]
-        pipeline = f'builtin.module({",".join(passes)})'
         with self.allo_module.context:
-            mlir_pass_manager.parse(pipeline).run(self.allo_module.operation)
+            mlir_pass_manager.parse(
+                "builtin.module(func.func(convert-linalg-to-affine-loops))"
+            ).run(self.allo_module.operation)
+        # - vectorize the loops of the compute cores (opt-in, as the vector code has not
+        #   been validated with Peano on the NPU yet)
+        if configs.get("vectorize", False):
+            _, core_func_groups, _ = classify_aie_functions(
+                self.allo_module, self.top_func_name
+            )
+            for funcs in core_func_groups.values():
+                for func in funcs:
+                    lanes = get_vector_lanes(
+                        func, configs.get("vector_bits", AIE_VECTOR_BITS)
+                    )
+                    if lanes > 0:
+                        vectorize_loops(func, lanes)
+        with self.allo_module.context:
+            mlir_pass_manager.parse("builtin.module(lower-affine)").run(
+                self.allo_module.operation
+            )
         top_func, core_func_groups, external_funcs = classify_aie_functions(
             self.allo_module, self.top_func_name
         )
         code_generator = CodeGenerator(
-            device_type, self.global_inputs, self.global_outputs, top_func
+            device_type, self.global_inputs, self.global_outputs, top_func, configs
         )
         self.aie_module = code_generator.aie_codegen(
             core_func_groups,
@@ -222,10 +355,12 @@ class AIE_MLIRModule:
             self.core_func_args,
             self.streams,
         )
+        top_code = str(self.aie_module)
+        write_if_changed(os.path.join(self.project_dir, "top.mlir"), top_code)
         with open(
-            os.path.join(self.project_dir, "top.mlir"), "w", encoding="utf-8"
+            os.path.join(self.project_dir, "io_load.txt"), "w", encoding="utf-8"
         ) as f:
-            f.write(str(self.aie_module))
+            f.write("\n".join(format_io_load(code_generator.mapping.io_load)) + "\n")
         if len(injected_kernels) > 0:
             paths = set()
             # user defined external kernels
@@ -239,37 +374,26 @@ class AIE_MLIRModule:
                     continue
                 shutil.copy(src_path, target_path)
             kernel_code = codegen_external_kernels(injected_kernels, include_src)
-            with open(
-                os.path.join(self.project_dir, "external.cc"), "w", encoding="utf-8"
-            ) as f:
-                f.write(kernel_code)
-            cmd = f"cd {self.project_dir} && $PEANO_INSTALL_DIR/bin/clang++ -O2 -v -std=c++20 --target=aie2-none-unknown-elf -Wno-parentheses -Wno-attributes -Wno-macro-redefined -DNDEBUG -I $MLIR_AIE_INSTALL_DIR/include -I $MLIR_AIE_EXTERNAL_KERNEL_DIR/aie2 -I. -c external.cc -o external.o"
-            with subprocess.Popen(cmd, shell=True) as process:
-                process.wait()
-            if process.returncode != 0:
-                raise RuntimeError("Failed to compile external kernels.")
-        # TODO
+            write_if_changed(os.path.join(self.project_dir, "external.cc"), kernel_code)
+            kernel_hash = compile_external_kernels(
+                self.project_dir, configs.get("kernel_cache_dir")
+            )
+        else:
+            kernel_hash = ""
         # build mlir-aie
         cmd = f"cd {self.project_dir} && aiecc.py --alloc-scheme=basic-sequential --aie-generate-xclbin --no-compile-host --xclbin-name=build/final.xclbin --no-xchesscc --no-xbridge --peano ${{PEANO_INSTALL_DIR}} --aie-generate-npu-insts --npu-insts-name=insts.txt top.mlir"
+        key = get_source_hash(top_code, kernel_hash, cmd)
+        outputs = [
+            os.path.join(self.project_dir, "build", "final.xclbin"),
+            os.path.join(self.project_dir, "insts.txt"),
+        ]
+        if manifest.is_valid("xclbin", key, outputs):
+            return
         with subprocess.Popen(cmd, shell=True) as process:
             process.wait()
         if process.returncode != 0:
             raise RuntimeError("Failed to compile the MLIR-AIE code")
-        # generate host code
-        path = os.path.dirname(__file__)
-        path = os.path.join(path, "../../harness/aie")
-        os.system(f"cp -r {path}/* {self.project_dir}")
-        host_code = codegen_host(self.global_inputs, self.global_outputs)
-        with open(
-            os.path.join(self.project_dir, "test.cpp"), "w", encoding="utf-8"
-        ) as f:
-            f.write(host_code)
-        cmd = f"cd {self.project_dir}/build && cmake .. -DTARGET_NAME=top -DMLIR_AIE_DIR=$RUNTIME_LIB_DIR/.. && cmake --build . --config Release"
-        with subprocess.Popen(cmd, shell=True) as process:
-            process.wait()
-        if process.returncode != 0:
-            raise RuntimeError("Failed to build AIE project.")
-        return self
+        manifest.update("xclbin", key)
 
     def __call__(self, *args):
         for i in range(len(self.global_inputs)):
@@ -290,3 +414,113 @@ class AIE_MLIRModule:
         )
         # suppose the last argument is output
         args[-1][:] = result
+
+
+class AIE_MLIRPipeline:
+    """
+    Runs several dataflow regions back to back on the NPU from one host program.
+
+    Every stage is compiled into its own xclbin and instruction sequence under
+    ``{project_dir}/stage{i}``. The host program registers all the xclbins and runs
+    the stages in order on the same device buffers. Tensors with the same name in
+    different stages share one buffer, so the intermediate tensors stay on the
+    device. Only the inputs of the pipeline are copied in, and only the tensors
+    that no later stage reads are copied out, e.g., for A -> B -> C the buffer of
+    B is neither written nor read by the host.
+
+    Merging the stages into one design, i.e., one xclbin with an instruction
+    sequence per stage when their tiles do not overlap, is out of scope. Each
+    stage has its own hardware context, so switching from a stage to the next
+    reconfigures the AIE partition with the next xclbin. The pipeline saves the
+    host round trips of the intermediate tensors, not the reconfigurations.
+    """
+
+    def __init__(self, stages: list[AIE_MLIRModule], project_dir: str):
+        self.stages = stages
+        self.project_dir = project_dir
+        # the tensors of the pipeline, in the order of first appearance
+        self.tensors: list[DTensor] = []
+        self.is_input: list[bool] = []
+        self.is_output: list[bool] = []
+        self.stage_args: list[list[int]] = []
+
+    def collect_tensors(self):
+        # start over, as the pipeline can be built more than once
+        self.tensors, self.is_input, self.is_output = [], [], []
+        self.stage_args = []
+        names = {}
+        for stage in self.stages:
+            args = []
+            global_args = {**stage.global_inputs, **stage.global_outputs}
+            for i, dtensor in sorted(global_args.items()):
+                if dtensor.name not in names:
+                    names[dtensor.name] = len(self.tensors)
+                    self.tensors.append(dtensor)
+                    # read from the host if it is not produced by an earlier stage
+                    self.is_input.append(i in stage.global_inputs)
+                    self.is_output.append(False)
+                idx = names[dtensor.name]
+                other = self.tensors[idx]
+                if list(other.shape) != list(dtensor.shape) or str(other.dtype) != str(
+                    dtensor.dtype
+                ):
+                    raise ValueError(
+                        f"Tensor {dtensor.name} has different types in the stages"
+                    )
+                # copy back the tensors that are not read by a later stage
+                self.is_output[idx] = i in stage.global_outputs
+                args.append(idx)
+            self.stage_args.append(args)
+
+    def build(self, device_type="npu1_4col", configs: dict = None):
+        os.makedirs(os.path.join(self.project_dir, "build"), exist_ok=True)
+        built = set()
+        for stage in self.stages:
+            # a region used by several stages is compiled once
+            if id(stage) not in built:
+                stage.build_design(device_type, configs)
+                built.add(id(stage))
+        self.collect_tensors()
+        host_code = codegen_pipeline_host(
+            [
+                (os.path.relpath(stage.project_dir, self.project_dir), args)
+                for stage, args in zip(self.stages, self.stage_args)
+            ],
+            self.tensors,
+            self.is_input,
+            self.is_output,
+        )
+        build_host(self.project_dir, host_code)
+        return self
+
+    def __call__(self, *args):
+        """
+        Run the pipeline. The arguments are the tensors of the pipeline in the order of
+        their first appearance in the stages, and the outputs are written in place.
+        """
+        if len(args) != len(self.tensors):
+            raise ValueError(
+                f"Expected {len(self.tensors)} arguments "
+                f"({', '.join(dtensor.name for dtensor in self.tensors)})"
+            )
+        for i, arg in enumerate(args):
+            if self.is_input[i]:
+                with open(
+                    os.path.join(self.project_dir, f"input{i}.data"),
+                    "w",
+                    encoding="utf-8",
+                ) as f:
+                    f.write("\n".join([str(x) for x in arg.flatten()]))
+        first = os.path.relpath(self.stages[0].project_dir, self.project_dir)
+        cmd = f"cd {self.project_dir} && ./build/top -x {first}/build/final.xclbin -i {first}/insts.txt -k MLIR_AIE"
+        with subprocess.Popen(cmd, shell=True) as process:
+            process.wait()
+        if process.returncode != 0:
+            raise RuntimeError("Failed to execute AIE code.")
+        for i, arg in enumerate(args):
+            if self.is_output[i]:
+                arg[:] = read_tensor_from_file(
+                    self.tensors[i].dtype,
+                    arg.shape,
+                    os.path.join(self.project_dir, f"output{i}.data"),
+                )
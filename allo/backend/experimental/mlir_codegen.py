@@ -3,7 +3,6 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import re
-from collections import defaultdict
 from dataclasses import dataclass
 import numpy as np
 
@@ -35,10 +34,16 @@ from ..._mlir.ir import (
 
 from ..utils import format_str
 from ..._mlir.dialects import func as allo_func_d
-from ...memory import DTensor
+from ...memory import DTensor, get_dma_bds
+from ...passes import _walk_ops
 
 from .utils import get_element_type
-from ..ai_engine import map_kernels_to_device_mesh
+from ..ai_engine import (
+    map_kernels_to_device_mesh,
+    allocate_global_io,
+    get_fifo_depths,
+    get_type_bytes,
+)
 
 
 class Stream:
@@ -137,6 +142,22 @@ class Argument:
     stream: Stream
 
 
+@dataclass
+class DeviceMapping:
+    """
+    How the kernels and their I/O are mapped to the tiles of the device.
+    """
+
+    # the build configs, e.g., the depths of the object FIFOs
+    configs: dict = None
+    # cost of the kernel placement, see `map_kernels_to_device_mesh`
+    placement_cost: dict[str, int] = None
+    # load of the memory and shim tiles, see `allocate_global_io`
+    io_load: dict = None
+    # depth of the object FIFOs of each DTensor and stream, see `get_fifo_depths`
+    fifo_depths: dict[str, int] = None
+
+
 @dataclass(frozen=True)
 class DMATensorTile:
     dtensor_tile_id: int  # dTensor may need to be further partitioned
@@ -148,152 +169,38 @@ class DMATensorTile:
     stride: list
 
 
-def map_global_io(inputs, outputs) -> tuple[dict[str, list[DMATensorTile]], int, int]:
+def map_global_io(
+    inputs, outputs, device_type="npu1_4col"
+) -> tuple[dict[str, list[DMATensorTile]], dict]:
     """
-    TODO: make use of the fifth mem tile
-    TODO: The current mapping scheme requires the matrices to be completely partitioned without remaining elements (shape should be divided by tile num).
-
     Allocate (shim-tile, mem-tile) pairs for every DTensor that crosses the
-    NPU boundary, while respecting the per-mem-tile ObjectFIFO limits.
-
-    The algorithm tries to pack as much traffic as possible into the fewest
-    number of memory tiles, only falling back to splitting (called "parts")
-    when the requested number of FIFOs would exceed the quota per memory tile.
-
-    Current constrains:
-        - use 4 mem-shim tile pairs for io
-        - each port is assigned to one dtensor tile
+    NPU boundary with the bandwidth-balanced allocator `allocate_global_io`.
 
     Args:
         - inputs: A dictionary mapping function names (group name + id) to lists of objects as inputs.
         - outputs: A dictionary mapping function names (group name + id) to lists of objects as outputs.
+        - device_type: The target device.
     Return:
         - tile_map: dtensor name -> a list of dma tiles
-        - mem_tile_num
-        - shim_tile_num
+        - load: the load of every used memory tile and shim tile (indexed by column)
     """
-    MAX_MEM_TILES = 4  # Maximum number of memory tiles allowed
-    # https://riallto.ai/notebooks/3_2_Ryzenai_capabilities.html#memory-tile-properties
-    MAX_SEND = 6  # Maximum number of producer FIFOs per memory tile (DMA limits)
-    MAX_RECV = 6  # Maximum number of consumer FIFOs per memory tile (DMA limits)
-
-    @dataclass
-    class Tile:
-        send_number: int
-        recv_number: int
-
-    used_tiles: list[Tile] = []
-
-    def assign_tile(send_need, recv_need) -> int:
-        """
-        Try to assign a memory tile satisfying the requirement.
-        Return the tile index.
-            -1 indicates no tile availability.
-        """
-        # 1. Attempt to use a new memory tile
-        if (
-            len(used_tiles) < MAX_MEM_TILES
-            and send_need <= MAX_SEND
-            and recv_need <= MAX_RECV
-        ):
-            used_tiles.append(Tile(send_need, recv_need))
-            return len(used_tiles) - 1
-        # 2. Otherwise, try to pack into an existing tile
-        for i, _ in enumerate(used_tiles):
-            if (
-                used_tiles[i].send_number + send_need <= MAX_SEND
-                and used_tiles[i].recv_number + recv_need <= MAX_RECV
-            ):
-                used_tiles[i].send_number += send_need
-                used_tiles[i].recv_number += recv_need
-                return i
-        # 3. No tile fits
-        return -1
-
-    def map_dtensor_to_tile(dtensor: DTensor, is_input: bool):
-        """
-        Split a DTensor into Part instances so each Part fits on some memory tile with respect to FIFO limits.
-
-        Currently, we focus on dtensor io using memory tiles.
-        Shim tiles are assigned using a one-to-one mapping from memory tiles.
-
-        DTensors are sent to or from compute cores.
-        Since memory tile is used for transfer, we assume that `receive` implies one `send` and `send` implies one `receive`.
-        """
-        device_dims, size, stride = dtensor.get_access_pattern()
-        tensor_tiles = sorted(
-            list(dtensor.global_placement.keys())
-        )  # 'R' can use one port yet multiple destinations
-        send_need = len(tensor_tiles) if is_input else 1
-        recv_need = 1 if is_input else len(tensor_tiles)
-        mem_tile_id = assign_tile(send_need, recv_need)
-        if mem_tile_id >= 0:
-            return [
-                DMATensorTile(
-                    0,
-                    mem_tile_id,
-                    mem_tile_id,
-                    tensor_tiles,
-                    [0, 0, 0, 0],
-                    size,
-                    stride,
-                )
-            ]
-        # We failed to transfer the whole tensor with one memory tile. Try using more.
-        dma_tensor_tiles: list[DMATensorTile] = []
-        # fixme: incomplete
-        #   Currently, we may allow tensor tiles on a sharding dimension to be sent using different memory tiles
-        if len(device_dims) <= 1:
-            lose_factor, inc_factor = 1, 1
-        elif len(device_dims) == 2:
-            lose_factor = size[device_dims[0]]
-            inc_factor = size[device_dims[1]]
-        else:
-            raise ValueError("Unsupported access pattern.")
-        remaining = tensor_tiles[:]
-        start_idx = 0
-        while remaining:
-            offset = [0, 0, 0, 0]
-            chunk = remaining
-            while chunk:
-                send_need = len(chunk) if is_input else 1
-                recv_need = 1 if is_input else len(chunk)
-                mem_tile_id = assign_tile(send_need, recv_need)
-                if mem_tile_id >= 0:
-                    break
-                chunk = chunk[: (len(chunk) - lose_factor)]  # Reduce size and retry
-            if not chunk:
-                raise RuntimeError(
-                    "Failed to allocate (shim, memory) tile: per-tile FIFO limit "
-                    "exceeded or no more available tiles."
-                )
-            offset[device_dims[0]] = start_idx // inc_factor
-            size[device_dims[0]] = len(chunk) // inc_factor
-            dma_tensor_tiles.append(
-                DMATensorTile(
-                    len(dma_tensor_tiles),
-                    mem_tile_id,
-                    mem_tile_id,
-                    chunk,
-                    offset,
-                    size,
-                    stride,
-                )
+    parts, load = allocate_global_io(inputs, outputs, device_type)
+    tile_map: dict[str, list[DMATensorTile]] = {
+        name: [
+            DMATensorTile(
+                part.part_id,
+                part.shim_id,
+                part.mem_id,
+                part.tensor_tiles,
+                part.offset,
+                part.size,
+                part.stride,
             )
-            remaining = remaining[len(chunk) :]
-            start_idx += len(chunk)
-        return dma_tensor_tiles
-
-    tile_map: dict[str, list[DMATensorTile]] = defaultdict(list)
-
-    for io_lst, is_input in ((inputs, True), (outputs, False)):
-        for _, sub in io_lst.items():
-            for dtensor in sub["_global"]:
-                tile_map[dtensor.name].extend(
-                    map_dtensor_to_tile(dtensor, is_input=is_input)
-                )
-
-    return tile_map, len(used_tiles), len(used_tiles)
+            for part in dtensor_parts
+        ]
+        for name, dtensor_parts in parts.items()
+    }
+    return tile_map, load
 
 
 class CodeGenerator:
@@ -310,6 +217,7 @@ class CodeGenerator:
         global_inputs: dict[int, DTensor],
         global_outputs: dict[int, DTensor],
         top_function: allo_func_d.FuncOp,
+        configs: dict = None,
     ):
         self.device_type = device_type
 
@@ -319,9 +227,8 @@ class CodeGenerator:
 
         self.tile_map: dict[str, aie_d.TileOp] = {}
         self.fifo_map: dict[str, aie_d.object_fifo] = {}
-        # function name (with id) -> a map from DTensor to fifo name
-        self.compute_core_io: dict[str : dict[DTensor, str]] = {}
         self.external_functions: str = ""
+        self.mapping = DeviceMapping(configs)
 
         self.aie_module = None  # The top-level AIE IR module
         self.global_ip: aie_ir.InsertionPoint = (
@@ -343,6 +250,58 @@ class CodeGenerator:
                         str(op.res.type), context
                     )
 
+    def choose_fifo_depths(
+        self,
+        core_func_groups: dict[str, list[allo_func_d.FuncOp]],
+        inputs,
+        outputs,
+        streams: dict[str, Stream],
+    ) -> dict[str, int]:
+        """
+        Choose the depth of the object FIFOs of each DTensor and stream, given the
+        local buffers and the FIFO buffers of each compute tile.
+        """
+        fifos = []
+        for arg_lst in (inputs, outputs):
+            for func_name, sub_func_lst in arg_lst.items():
+                for dtensor in sub_func_lst["_global"]:
+                    num_bytes = get_type_bytes(dtensor.get_local_shape(), dtensor.dtype)
+                    for tiles in dtensor.global_placement.values():
+                        fifos.append(
+                            (
+                                dtensor.name,
+                                num_bytes,
+                                [
+                                    f"{func_name}_{'_'.join(str(i) for i in tile)}"
+                                    for tile in tiles
+                                    if dtensor in sub_func_lst[tile]
+                                ],
+                                2,
+                            )
+                        )
+        for stream_name, stream in streams.items():
+            fifos.append(
+                (
+                    stream_name,
+                    get_type_bytes(stream.shape, stream.dtype),
+                    [stream.src, stream.dst],
+                    stream.depth,
+                )
+            )
+        local_usage = {}
+        for funcs in core_func_groups.values():
+            for func in funcs:
+                allocs = [
+                    MemRefType(op.result.type)
+                    for op in _walk_ops(func.operation)
+                    if op.name == "memref.alloc"
+                ]
+                local_usage[func.attributes["sym_name"].value] = sum(
+                    get_type_bytes(memref.shape, memref.element_type)
+                    for memref in allocs
+                )
+        return get_fifo_depths(fifos, self.mapping.configs, local_usage)
+
     def preporocess_dumped_core_func(
         self,
         original_func: allo_func_d.FuncOp,
@@ -433,6 +392,7 @@ class CodeGenerator:
         func_core: aie_d.Core,
         original_func: allo_func_d.FuncOp,
         func_args: dict[int, tuple[Argument, bool]],
+        pe_coord: tuple[int, ...],
     ):
         """
         Generate the computation logic for the fake 'while(1)' loop body for an AIE compute core, transforming high-level Allo ops
@@ -442,6 +402,7 @@ class CodeGenerator:
             - func_core (aie_d.Core): The target compute core to insert into.
             - original_func (FuncOp): The Allo function to compile.
             - func_args (dict): Maps argument indices to (Argument, is_output) tuples.
+            - pe_coord (tuple): The coordinates of the PE tile in the kernel mapping.
         """
         func_string = self.preporocess_dumped_core_func(original_func, func_args)
         original_module = aie_ir.Module.parse(func_string)
@@ -468,20 +429,22 @@ class CodeGenerator:
             # scf.for %arg0 = %c0 to %cmax step %c1
             loop = aie_scf_d.ForOp(lower_bound=c0, upper_bound=cmax, step=c1)
             with aie_ir.InsertionPoint(loop.body):
+                # the FIFOs of the tensor tiles held by this PE
+                dtensor_fifos = {}
+                for i, (arg, is_input) in func_args.items():
+                    if arg.dtensor is not None:
+                        label = arg.dtensor.global_placement.get_label(pe_coord)
+                        io = "in" if is_input else "out"
+                        dtensor_fifos[i] = self.fifo_map[
+                            f"{io}_mem_{arg.dtensor.name}_{label}"
+                        ]
                 # insert operations to get 'function parameter', acquire and subview
-                io_map = (
-                    self.compute_core_io[parsed_function.name.value]
-                    if parsed_function.name.value in self.compute_core_io
-                    else {}
-                )
                 for i, argument in enumerate(parsed_function.arguments):
                     if not i in func_args:
                         continue
                     arg_info: tuple[Argument, bool] = func_args[i]
                     if arg_info[0].dtensor is not None:
-                        acquired = self.fifo_map[io_map[arg_info[0].dtensor]].acquire(
-                            1 if arg_info[1] else 0, 1
-                        )
+                        acquired = dtensor_fifos[i].acquire(1 if arg_info[1] else 0, 1)
                         argument.replace_all_uses_with(acquired)
                     else:
                         stream: Stream = arg_info[0].stream
@@ -554,9 +517,7 @@ class CodeGenerator:
                         continue
                     arg_info: tuple[Argument, bool] = func_args[i]
                     if not arg_info[0].dtensor is None:
-                        self.fifo_map[io_map[arg_info[0].dtensor]].release(
-                            1 if arg_info[1] else 0, 1
-                        )
+                        dtensor_fifos[i].release(1 if arg_info[1] else 0, 1)
 
                 aie_scf_d.YieldOp([])
             aie_d.EndOp()
@@ -574,7 +535,13 @@ class CodeGenerator:
         """
         Generate an AIE MLIR module.
         """
-        io_mapping, mem_tile_num, shim_tile_num = map_global_io(inputs, outputs)
+        io_mapping, self.mapping.io_load = map_global_io(
+            inputs, outputs, self.device_type
+        )
+        self.collect_stream_info(streams, self.top_function.context)
+        self.mapping.fifo_depths = self.choose_fifo_depths(
+            core_func_groups, inputs, outputs, streams
+        )
         wrapper_code = f"""
             module {{
                 aie.device({self.device_type}) {{
@@ -610,10 +577,10 @@ class CodeGenerator:
 
             with aie_ir.InsertionPoint(end_op):
                 # shim tile
-                for shim_id in range(shim_tile_num):
+                for shim_id in sorted(self.mapping.io_load["shim"]):
                     self.tile_map[f"shim_{shim_id}"] = aie_d.TileOp(col=shim_id, row=0)
                 # mem tiles
-                for mem_id in range(mem_tile_num):
+                for mem_id in sorted(self.mapping.io_load["mem"]):
                     self.tile_map[f"mem_{mem_id}"] = aie_d.TileOp(col=mem_id, row=1)
                 # compute tiles
                 # 'logic' mapping for different function groups.
@@ -624,9 +591,24 @@ class CodeGenerator:
                     else:
                         mappings[func_name] = outputs[func_name]["_global"][0].mapping
                 aie_mesh = (5, 4)
-                for func_name, tile_ids in map_kernels_to_device_mesh(
-                    mappings, aie_mesh
-                ).items():
+                instances = {
+                    func_name: [func.attributes["sym_name"].value for func in funcs]
+                    for func_name, funcs in core_func_groups.items()
+                }
+                io_loads = {
+                    func_name_w_id: sum(
+                        arg.dtensor is not None for arg, _ in func_args.values()
+                    )
+                    for func_name_w_id, func_args in core_func_args.items()
+                }
+                placement, self.mapping.placement_cost = map_kernels_to_device_mesh(
+                    mappings,
+                    aie_mesh,
+                    instances,
+                    [(stream.src, stream.dst) for stream in streams.values()],
+                    io_loads,
+                )
+                for func_name, tile_ids in placement.items():
                     for idx, func in zip(tile_ids, core_func_groups[func_name]):
                         func_name = func.attributes["sym_name"].value
                         self.tile_map[f"compute_{func_name}"] = aie_d.TileOp(
@@ -672,7 +654,7 @@ class CodeGenerator:
                                     name,
                                     producer,
                                     consumer,
-                                    depth=2,
+                                    depth=self.mapping.fifo_depths[dtensor.name],
                                     datatype=memref_type,
                                 )
 
@@ -701,9 +683,6 @@ class CodeGenerator:
                                                     f"compute_{func_name}_{idx_str}"
                                                 ]
                                             )
-                                            self.compute_core_io.setdefault(
-                                                f"{func_name}_{idx_str}", {}
-                                            )[dtensor] = name
                                     if io == "in":
                                         producer = mem_tile
                                     else:
@@ -717,7 +696,7 @@ class CodeGenerator:
                                         name,
                                         producer,
                                         consumer,
-                                        depth=2,
+                                        depth=self.mapping.fifo_depths[dtensor.name],
                                         datatype=local_memref_type,
                                     )
                                     fifo_mem.append(fifo)
@@ -732,7 +711,6 @@ class CodeGenerator:
                                     mem_stride[:-1] if io == "in" else [],
                                 )
                 # compute <-> compute
-                self.collect_stream_info(streams, self.top_function.context)
                 for stream_name, stream in streams.items():
                     src_tile = self.tile_map[f"compute_{stream.src}"]
                     dst_tile = [self.tile_map[f"compute_{stream.dst}"]]
@@ -740,7 +718,7 @@ class CodeGenerator:
                         stream_name,
                         src_tile,
                         dst_tile,
-                        depth=stream.depth,
+                        depth=self.mapping.fifo_depths[stream_name],
                         datatype=aie_ir.MemRefType.get(
                             stream.shape,
                             get_element_type(str(stream.dtype)),
@@ -760,8 +738,12 @@ class CodeGenerator:
                         )
                         if self.global_ip is None:
                             self.global_ip = aie_ir.InsertionPoint(func_core)
+                        pe_coord = tuple(
+                            int(x)
+                            for x in func_name_w_id[len(func_name) + 1 :].split("_")
+                        )
                         self.build_core_function(
-                            func_core, func, core_func_args[func_name_w_id]
+                            func_core, func, core_func_args[func_name_w_id], pe_coord
                         )
 
                 # runtime sequence
@@ -795,16 +777,21 @@ class CodeGenerator:
                             dma_fifo = self.fifo_map[
                                 f"{io}_shim_{dtensor.name}{dma_tile.dtensor_tile_id}"
                             ]
-                            aiex_d.NpuDmaMemcpyNd(
-                                metadata=dma_fifo,
-                                bd_id=bd_cnt,
-                                mem=runtime_seq_entry_block.arguments[i],
-                                offsets=dma_tile.offset,
-                                sizes=dma_tile.size,
-                                strides=dma_tile.stride,
-                                issue_token=True,
+                            bds = get_dma_bds(
+                                dma_tile.offset, dma_tile.size, dma_tile.stride
                             )
-                            bd_cnt += 1
+                            for bd_idx, (offsets, sizes, strides) in enumerate(bds):
+                                aiex_d.NpuDmaMemcpyNd(
+                                    metadata=dma_fifo,
+                                    bd_id=bd_cnt,
+                                    mem=runtime_seq_entry_block.arguments[i],
+                                    offsets=offsets,
+                                    sizes=sizes,
+                                    strides=strides,
+                                    # wait for the last BD of the transfer
+                                    issue_token=bd_idx == len(bds) - 1,
+                                )
+                                bd_cnt += 1
                             dma_tiles.append(dma_fifo)
                     # DMA wait
                     for dma_tile in dma_tiles:
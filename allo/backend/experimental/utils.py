@@ -535,3 +535,119 @@ def codegen_host(inputs: dict[int, DTensor], outputs: dict[int, DTensor]):
             code += format_str(f"ifile{i}.close();")
         code += file_close_str
     return code
+
+
+def codegen_pipeline_host(
+    stages: list[tuple[str, list[int]]],
+    tensors: list[DTensor],
+    is_input: list[bool],
+    is_output: list[bool],
+):
+    """
+    Generate the C++ code that runs the stages of a pipeline on shared buffers.
+
+    Args:
+        - stages: The directory of each stage (relative to the project) and the
+            indices of the tensors passed to its kernel.
+        - tensors: The tensors of the pipeline.
+        - is_input: Whether each tensor is read from input{i}.data.
+        - is_output: Whether each tensor is written to output{i}.data.
+    """
+    # the first stage is loaded from the command line options
+    code = host_header.replace(
+        '  std::ofstream ofile("output.data");\n'
+        "  if (!ofile.is_open()) {\n"
+        '      std::cerr << "Error: Could not open output file.\\n";\n'
+        "      return 1;\n"
+        "  }\n",
+        "",
+    )
+    kernels = ["kernel"]
+    instrs = [("bo_instr", "instr_v")]
+    loaded = {stages[0][0]: 0}
+    with format_code(indent=2):
+        for k, (stage_dir, _) in enumerate(stages[1:], start=1):
+            if stage_dir in loaded:
+                # the region is already loaded by an earlier stage
+                kernels.append(kernels[loaded[stage_dir]])
+                instrs.append(instrs[loaded[stage_dir]])
+                continue
+            loaded[stage_dir] = k
+            code += format_str(f"\n// stage {k}", strip=False)
+            code += format_str(
+                f'auto xclbin{k} = xrt::xclbin("{stage_dir}/build/final.xclbin");'
+            )
+            code += format_str(f"device.register_xclbin(xclbin{k});")
+            code += format_str(
+                f"xrt::hw_context context{k}(device, xclbin{k}.get_uuid());"
+            )
+            code += format_str(f"auto kernel{k} = xrt::kernel(context{k}, kernelName);")
+            code += format_str(
+                f"std::vector<uint32_t> instr_v{k} = "
+                f'test_utils::load_instr_binary("{stage_dir}/insts.txt");'
+            )
+            code += format_str(
+                f"auto bo_instr{k} = xrt::bo(device, instr_v{k}.size() * sizeof(int), "
+                f"XCL_BO_FLAGS_CACHEABLE, kernel{k}.group_id(1));"
+            )
+            code += format_str(
+                f"memcpy(bo_instr{k}.map<void *>(), instr_v{k}.data(), "
+                f"instr_v{k}.size() * sizeof(int));"
+            )
+            code += format_str(f"bo_instr{k}.sync(XCL_BO_SYNC_BO_TO_DEVICE);")
+            kernels.append(f"kernel{k}")
+            instrs.append((f"bo_instr{k}", f"instr_v{k}"))
+        code += format_str("bo_instr.sync(XCL_BO_SYNC_BO_TO_DEVICE);")
+        # the buffers shared by the stages
+        for i, dtensor in enumerate(tensors):
+            dtype = aie_ctype_map[str(dtensor.dtype)]
+            size = np.prod(dtensor.shape)
+            k, args = next((k, args) for k, (_, args) in enumerate(stages) if i in args)
+            code += format_str(
+                f"\nauto bo_{i} = xrt::bo(device, {size} * sizeof({dtype}), "
+                f"XRT_BO_FLAGS_HOST_ONLY, {kernels[k]}.group_id({args.index(i) + 3}));",
+                strip=False,
+            )
+            code += format_str(f"{dtype} *buf{i} = bo_{i}.map<{dtype} *>();")
+            if is_input[i]:
+                code += format_str(f'std::ifstream ifile{i}("input{i}.data");')
+                code += format_str(f"for (int i = 0; i < {size}; i++) {{")
+                code += format_str(f"  ifile{i} >> buf{i}[i];", strip=False)
+                code += format_str("}")
+                code += format_str(f"ifile{i}.close();")
+                code += format_str(f"bo_{i}.sync(XCL_BO_SYNC_BO_TO_DEVICE);")
+        # run the stages back to back without copying the buffers
+        code += format_str(
+            "\nauto start = std::chrono::high_resolution_clock::now();", strip=False
+        )
+        for k, (_, args) in enumerate(stages):
+            bufs = ", ".join(f"bo_{i}" for i in args)
+            bo_instr, instr_v = instrs[k]
+            code += format_str(
+                f"auto run{k} = {kernels[k]}(opcode, {bo_instr}, {instr_v}.size(), {bufs});"
+            )
+            code += format_str(f"run{k}.wait();")
+        code += format_str(
+            "auto end = std::chrono::high_resolution_clock::now();", strip=False
+        )
+        code += format_str(
+            "float npu_time = std::chrono::duration_cast<std::chrono::microseconds>(end - start).count();"
+        )
+        code += format_str(
+            'std::cout << "NPU execution time: " << npu_time << "us\\n";'
+        )
+        # get results
+        for i, dtensor in enumerate(tensors):
+            if not is_output[i]:
+                continue
+            size = np.prod(dtensor.shape)
+            code += format_str(
+                f"\nbo_{i}.sync(XCL_BO_SYNC_BO_FROM_DEVICE);", strip=False
+            )
+            code += format_str(f'std::ofstream ofile{i}("output{i}.data");')
+            code += format_str(f"for (uint32_t i = 0; i < {size}; i++) {{")
+            code += format_str(f'  ofile{i} << buf{i}[i] << "\\n";', strip=False)
+            code += format_str("}")
+            code += format_str(f"ofile{i}.close();")
+    code += "  return 0;\n}\n"
+    return code
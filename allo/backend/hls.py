@@ -7,6 +7,9 @@ import re
 import io
 import subprocess
 import time
+import warnings
+from dataclasses import dataclass
+import numpy as np
 from .._mlir.dialects import allo as allo_d
 from .._mlir.ir import (
     Context,
@@ -15,11 +18,15 @@ from .._mlir.ir import (
 )
 from .._mlir.passmanager import PassManager
 
-from .config import DEFAULT_CONFIG, PART_NUMBER
+from .config import DEFAULT_CONFIG, PART_NUMBER, MEMORY_BANKS
 from .vitis import (
     codegen_host,
+    codegen_host_multi_cu,
     postprocess_hls_code,
     generate_description_file,
+    get_top_arg_names,
+    assign_memory_banks,
+    codegen_connectivity,
     write_tensor_to_file,
     read_tensor_from_file,
 )
@@ -32,10 +39,16 @@ from ..passes import (
     _mlir_lower_pipeline,
     decompose_library_function,
     generate_input_output_buffers,
+    generate_tiled_io_buffers,
+    analyze_arg_load_store,
 )
 from ..harness.makefile_gen.makegen import generate_makefile
 from ..ir.transform import find_func_in_module
-from ..utils import get_func_inputs_outputs
+from ..utils import (
+    get_func_inputs_outputs,
+    get_dtype_and_shape_from_type,
+    get_bitwidth_from_type,
+)
 
 
 def is_available(backend="vivado_hls"):
@@ -145,6 +158,22 @@ def separate_header(hls_code, top=None):
     return sig_str, args
 
 
+@dataclass
+class VitisBuild:
+    """The options and artifacts of a Vitis build of an HLSModule."""
+
+    # host-side types of the arguments, which are unchanged by packing
+    io_types: tuple = None
+    # argument name -> HBM/DDR bank (a list of banks, one per compute unit)
+    memory_banks: dict = None
+    # the kernel is replicated into `num_cu` compute units, and the arguments in
+    # `cu_split` (all the arrays by default) are split by rows across them
+    num_cu: int = 1
+    cu_split: list = None
+    # the compiled csim simulator, which is reused across calls
+    csim_mod: object = None
+
+
 class HLSModule:
     def __init__(
         self,
@@ -163,27 +192,44 @@ class HLSModule:
         self.project = project
         self.platform = platform
         self.ext_libs = [] if ext_libs is None else ext_libs
+        self.vitis = VitisBuild()
+        # copy the defaults so that the options do not leak into other modules
+        new_configs = dict(DEFAULT_CONFIG)
         if configs is not None:
-            new_configs = DEFAULT_CONFIG
             new_configs.update(configs)
-            configs = new_configs
-        else:
-            configs = DEFAULT_CONFIG
+        configs = new_configs
         if self.mode is not None:
             configs["mode"] = self.mode
         with Context() as ctx, Location.unknown():
             allo_d.register_dialect(ctx)
             self.module = Module.parse(str(mod), ctx)
-            self.func = find_func_in_module(self.module, top_func_name)
             if platform == "vitis_hls":
                 assert func_args is not None, "Need to specify func_args"
 
-                if wrap_io:
+                tile_size = None
+                if wrap_io and configs.get("io_tile", None) is not None:
+                    # True lets the tile size be inferred from the row count
+                    tile_size = generate_tiled_io_buffers(
+                        self.module,
+                        top_func_name,
+                        tile_size=(
+                            None if configs["io_tile"] is True else configs["io_tile"]
+                        ),
+                    )
+                    if tile_size is None:
+                        warnings.warn(
+                            f"Cannot tile the I/O of {top_func_name}, "
+                            "fall back to full-size buffers"
+                        )
+                if wrap_io and tile_size is None:
+                    if configs.get("bus_width", None) is not None:
+                        self.vitis.io_types = get_func_inputs_outputs(self.func)
                     generate_input_output_buffers(
                         self.module,
                         top_func_name,
                         flatten=True,
                         mappings=configs.get("mappings", None),
+                        bus_width=configs.get("bus_width", None),
                     )
 
             self.module = decompose_library_function(self.module)
@@ -235,11 +281,20 @@ class HLSModule:
                 path = os.path.dirname(__file__)
                 path = os.path.join(path, "../harness/")
                 dst_path = os.path.join(project, "description.json")
+                # replicate the kernel into multiple compute units
+                self.vitis.num_cu = configs.get("num_cu", 1)
+                self.vitis.cu_split = configs.get("cu_split", None)
+                if configs.get("connectivity", None) is not None:
+                    self.vitis.memory_banks = self.get_memory_banks(configs)
+                ldclflags = codegen_connectivity(
+                    self.top_func_name, self.vitis.memory_banks or {}, self.vitis.num_cu
+                )
                 generate_description_file(
                     self.top_func_name,
                     path + "makefile_gen/description.json",
                     dst_path,
                     frequency=configs["frequency"],
+                    ldclflags=ldclflags,
                 )
                 generate_makefile(dst_path, project, self.platform)
                 header, self.args = separate_header(self.hls_code, self.top_func_name)
@@ -256,10 +311,20 @@ class HLSModule:
                         f"{project}/{cpp_file}", "w", encoding="utf-8"
                     ) as outfile:
                         outfile.write(new_code)
-                self.host_code = codegen_host(
-                    self.top_func_name,
-                    self.module,
-                )
+                if self.vitis.num_cu > 1:
+                    self.host_code = codegen_host_multi_cu(
+                        self.top_func_name,
+                        self.module,
+                        self.vitis.num_cu,
+                        split=self.vitis.cu_split,
+                        io_types=self.vitis.io_types,
+                    )
+                else:
+                    self.host_code = codegen_host(
+                        self.top_func_name,
+                        self.module,
+                        io_types=self.vitis.io_types,
+                    )
             elif self.platform == "tapa":
                 assert self.mode in {
                     "csim",
@@ -328,6 +393,70 @@ class HLSModule:
                     ) as tcl_file:
                         tcl_file.write(new_tcl)
 
+    @property
+    def func(self):
+        return find_func_in_module(self.module, self.top_func_name)
+
+    def get_memory_banks(self, configs):
+        """Maps each array argument of the kernel to an HBM/DDR bank.
+
+        ``configs["connectivity"]`` is either ``"auto"`` or a dict mapping
+        argument names/indices to banks, in which case the remaining arguments
+        are balanced automatically. The banks are taken from
+        ``configs["memory_banks"]`` or the default ones of the device.
+        With multiple compute units, each argument is mapped to a list of banks,
+        one per compute unit, and a user-specified bank may also be such a list.
+        """
+        connectivity = configs["connectivity"]
+        banks = configs.get("memory_banks", MEMORY_BANKS.get(configs["device"], None))
+        if banks is None:
+            raise ValueError(
+                f"Memory banks of {configs['device']} are unknown, please specify memory_banks"
+            )
+        func = find_func_in_module(self.module, self.top_func_name)
+        # outputs are emitted as the trailing arguments
+        types = list(func.type.inputs) + list(func.type.results)
+        directions = analyze_arg_load_store(self.module)[self.top_func_name] + [
+            "out"
+        ] * len(func.type.results)
+        arg_names = get_top_arg_names(self.hls_code, self.top_func_name)
+        traffic = {}
+        for (name, is_array), arg_type, direction in zip(arg_names, types, directions):
+            if not is_array:
+                continue
+            dtype, shape = get_dtype_and_shape_from_type(arg_type)
+            bitwidth = 16 if dtype == "bf16" else get_bitwidth_from_type(dtype)
+            # read-write arguments use the bank in both directions
+            traffic[name] = (
+                int(np.prod(shape)) * bitwidth // 8 * (2 if direction == "both" else 1)
+            )
+        fixed = None
+        if isinstance(connectivity, dict):
+            fixed = {
+                arg_names[arg][0] if isinstance(arg, int) else arg: bank
+                for arg, bank in connectivity.items()
+            }
+        elif connectivity != "auto":
+            raise ValueError(f"Invalid connectivity {connectivity}")
+        if self.vitis.num_cu == 1:
+            return assign_memory_banks(traffic, banks, fixed)
+        # every compute unit has its own buffers, so balance them all together
+        cu_traffic = {
+            (name, cu): size
+            for name, size in traffic.items()
+            for cu in range(self.vitis.num_cu)
+        }
+        cu_fixed = {}
+        for name, bank in (fixed or {}).items():
+            cu_banks = bank if isinstance(bank, list) else [bank] * self.vitis.num_cu
+            for cu, cu_bank in enumerate(cu_banks):
+                cu_fixed[(name, cu)] = cu_bank
+        assignment = assign_memory_banks(cu_traffic, banks, cu_fixed)
+        return {
+            name: [assignment[(name, cu)] for cu in range(self.vitis.num_cu)]
+            for name in traffic
+        }
+
     def __repr__(self):
         if self.mode is None:
             return self.hls_code
@@ -375,13 +504,18 @@ class HLSModule:
         elif self.platform == "vitis_hls":
             assert is_available("vitis_hls"), "vitis_hls is not available"
             if self.mode == "csim":
-                cwd = os.getcwd()
-                mod = IPModule(
-                    top=self.top_func_name,
-                    impl=f"{cwd}/{self.project}/kernel.cpp",
-                    link_hls=True,
-                )
-                mod(*args)
+                assert (
+                    self.vitis.io_types is None
+                ), "csim does not support packed interfaces, please remove bus_width"
+                # the compiled simulator is reused across calls
+                if self.vitis.csim_mod is None:
+                    cwd = os.getcwd()
+                    self.vitis.csim_mod = IPModule(
+                        top=self.top_func_name,
+                        impl=f"{cwd}/{self.project}/kernel.cpp",
+                        link_hls=True,
+                    )
+                self.vitis.csim_mod(*args)
                 return
             if self.mode == "csyn":
                 cmd = f"cd {self.project}; vitis_hls -f run.tcl"
@@ -400,11 +534,28 @@ class HLSModule:
             # Use Makefile (sw_emu, hw_emu, hw)
             assert "XDEVICE" in os.environ, "Please set XDEVICE in your environment"
             # prepare data
-            func = find_func_in_module(self.module, self.top_func_name)
-            inputs, outputs = get_func_inputs_outputs(func)
+            if self.vitis.io_types is not None:
+                inputs, outputs = self.vitis.io_types
+            else:
+                func = find_func_in_module(self.module, self.top_func_name)
+                inputs, outputs = get_func_inputs_outputs(func)
             assert len(args) == len(inputs) + len(
                 outputs
             ), f"Number of arguments mismatch, got {len(args)}, expected {len(inputs) + len(outputs)}"
+            if self.vitis.num_cu > 1:
+                # the split arguments hold the batches of all the compute units
+                split = self.vitis.cu_split
+                if split is None:
+                    split = [
+                        i
+                        for i, (_, shape) in enumerate(inputs + outputs)
+                        if len(shape) > 0
+                    ]
+                for i in split:
+                    shape = (inputs + outputs)[i][1]
+                    assert (
+                        args[i].shape[0] == shape[0] * self.vitis.num_cu
+                    ), f"Argument {i} should have {shape[0] * self.vitis.num_cu} rows for {self.vitis.num_cu} compute units, got {args[i].shape[0]}"
             for i, ((_, in_shape), arg) in enumerate(zip(inputs, args)):
                 write_tensor_to_file(
                     arg,
@@ -2,12 +2,17 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import os
-import sys
 import re
-import importlib
+import hashlib
+import importlib.util
 import subprocess
+import threading
+import sysconfig
 import traceback
-import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
 
 # https://pybind11.readthedocs.io/en/stable/advanced/pycpp/numpy.html
 allo2c_type = {
@@ -32,6 +37,70 @@ c2allo_type = {v: k for k, v in allo2c_type.items()}
 c2allo_type["int32_t"] = "int32"
 c2allo_type["uint32_t"] = "uint32"
 
+c2np_type = {
+    "float": np.float32,
+    "double": np.float64,
+    "bool": np.bool_,
+    "int8_t": np.int8,
+    "int16_t": np.int16,
+    "int": np.int32,
+    "int32_t": np.int32,
+    "int64_t": np.int64,
+    "uint8_t": np.uint8,
+    "uint16_t": np.uint16,
+    "unsigned int": np.uint32,
+    "uint32_t": np.uint32,
+    "uint64_t": np.uint64,
+}
+
+
+def get_source_hash(*contents):
+    """Hashes the given strings (e.g., source code and compiler flags)."""
+    sha = hashlib.sha256()
+    for content in contents:
+        sha.update(content.encode("utf-8"))
+        # separator, so that the boundaries of the contents are hashed as well
+        sha.update(b"\0")
+    return sha.hexdigest()[:16]
+
+
+def build_cached(cmd, output, name):
+    """Runs `cmd` to build `output` unless it already exists.
+
+    `cmd` writes to a temporary file, which is then renamed to `output`, so
+    that concurrent builds never use a partially written file.
+    """
+    if os.path.exists(output):
+        return output
+    tmp_path = f"{output}.{os.getpid()}_{threading.get_ident()}.tmp"
+    cmd = cmd.format(output=tmp_path)
+    print(cmd)
+    try:
+        subprocess.check_output(cmd, shell=True)
+    except subprocess.CalledProcessError as exc:
+        raise RuntimeError(f"Failed to compile {name}!") from exc
+    os.replace(tmp_path, output)
+    return output
+
+
+def compile_shared_libs(ext_libs):
+    """Compiles the shared libraries of the external kernels in parallel."""
+    if len(ext_libs) <= 1:
+        return [lib.compile_shared_lib() for lib in ext_libs]
+    with ThreadPoolExecutor(max_workers=min(len(ext_libs), os.cpu_count())) as pool:
+        return list(pool.map(lambda lib: lib.compile_shared_lib(), ext_libs))
+
+
+def read_local_includes(code, path):
+    """Reads the files included with quotes that are found under `path`."""
+    contents = []
+    for header in re.findall(r'#include\s+"([^"]+)"', code):
+        header_path = os.path.join(path, header)
+        if os.path.isfile(header_path):
+            with open(header_path, "r", encoding="utf-8") as f:
+                contents.append(f.read())
+    return contents
+
 
 def parse_cpp_function(code, target_function):
     """
@@ -119,13 +188,70 @@ def parse_cpp_function(code, target_function):
     return result
 
 
+def can_pass_directly(arg, arg_type, arg_shape):
+    # Scalars, pointers of unknown types and C-contiguous arrays of the same
+    # type are passed to the kernel as they are, while the other arrays need
+    # a converted copy
+    if not isinstance(arg, np.ndarray) or (
+        arg_shape is not None and len(arg_shape) == 0
+    ):
+        return True
+    dtype = c2np_type.get(arg_type, None)
+    return dtype is None or (arg.dtype == dtype and arg.flags.c_contiguous)
+
+
+@dataclass
+class IPBuild:
+    """The compile options of an IPModule and the hash of its sources and
+    options, which names the cached artifacts."""
+
+    cflags: str = None
+    srcs: list = field(default_factory=list)
+    defines: list = field(default_factory=list)
+    source_hash: str = None
+
+    def get_flags(self, default):
+        flags = default if self.cflags is None else self.cflags
+        return " ".join([flags] + [f"-D{define}" for define in self.defines])
+
+
 class IPModule:
-    def __init__(self, top, impl, include_paths=None, link_hls=True):
+    """External C++ kernel that can be called from Python or an Allo kernel.
+
+    The pybind11 extension and the shared library are compiled once per
+    (source hash, flags) and kept under the ``_tmp`` folder next to the caller,
+    so that they are reused across calls and processes. ``cflags`` defaults to
+    ``-O2 -march=native`` for the former and ``-O3`` for the latter.
+    ``srcs`` are additional source files compiled with the kernel, and
+    ``defines`` is a dict (or list) of macros passed as ``-D`` flags.
+    """
+
+    def __init__(
+        self,
+        top,
+        impl,
+        include_paths=None,
+        link_hls=True,
+        cflags=None,
+        srcs=None,
+        defines=None,
+    ):
         self.top = top
+        self.lib = None
         self.abs_path = os.path.dirname(traceback.extract_stack()[-2].filename)
         self.temp_path = os.path.join(self.abs_path, "_tmp")
         os.makedirs(self.temp_path, exist_ok=True)
         self.impl = os.path.join(self.abs_path, impl)
+        if isinstance(defines, dict):
+            defines = [
+                key if value is None else f"{key}={value}"
+                for key, value in defines.items()
+            ]
+        self.build = IPBuild(
+            cflags,
+            [os.path.join(self.abs_path, src) for src in (srcs or [])],
+            list(defines or []),
+        )
         if include_paths is None:
             include_paths = []
         self.include_paths = include_paths + [self.abs_path]
@@ -150,9 +276,31 @@ class IPModule:
             code = f.read()
             self.args = parse_cpp_function(code, self.top)
         assert self.args is not None, f"Failed to parse {self.impl}"
-        self.lib_name = f"py{self.top}_{hash(time.time_ns())}"
+        sources = [code, *read_local_includes(code, os.path.dirname(self.impl))]
+        for src in self.build.srcs:
+            with open(src, "r", encoding="utf-8") as f:
+                src_code = f.read()
+            sources += [src_code, *read_local_includes(src_code, os.path.dirname(src))]
+        # the same source and flags always map to the same extension
+        self.build.source_hash = get_source_hash(
+            self.impl,
+            *sources,
+            self.build.get_flags("-O2 -march=native"),
+            " ".join(self.include_paths),
+        )
+        self.lib_name = f"py{self.top}_{self.build.source_hash}"
         self.c_wrapper_file = os.path.join(self.temp_path, f"{self.lib_name}.cpp")
 
+    @property
+    def mlir_wrapper_file(self):
+        return os.path.join(self.temp_path, f"{self.lib_name}_mlir.cpp")
+
+    @property
+    def lib_path(self):
+        return os.path.join(
+            self.temp_path, self.lib_name + sysconfig.get_config_var("EXT_SUFFIX")
+        )
+
     def generate_pybind11_wrapper(self):
         out_str = "// Auto-generated by Allo\n\n"
         # Add headers
@@ -166,8 +314,9 @@ class IPModule:
         out_str += f"void {self.lib_name}(\n"
         for i, (arg_type, arg_shape) in enumerate(self.args):
             if arg_shape is None or len(arg_shape) > 0:
-                # pointer or array
-                out_str += f"  py::array_t<{arg_type}> &arg{i}"
+                # pointer or array, which is passed without copies if it is
+                # a C-contiguous array of the same type
+                out_str += f"  py::array_t<{arg_type}, py::array::c_style> &arg{i}"
             else:
                 # scalar
                 out_str += f"  {arg_type} arg{i}"
@@ -205,24 +354,30 @@ class IPModule:
         return self.c_wrapper_file
 
     def compile_pybind11(self):
+        if os.path.exists(self.lib_path):
+            # built by a previous call or process
+            return self.lib_path
         self.generate_pybind11_wrapper()
-        cmd = "g++ -shared -std=c++14 -fPIC"
+        cmd = (
+            f"g++ -shared -std=c++14 -fPIC {self.build.get_flags('-O2 -march=native')}"
+        )
         cmd += " `python3 -m pybind11 --includes` "
         cmd += " ".join(
             ["-I" + (path if path != "" else ".") for path in self.include_paths]
         )
-        srcs = [self.c_wrapper_file]
+        srcs = [self.c_wrapper_file] + self.build.srcs
         cmd += " " + " ".join(srcs)
-        cmd += (
-            f" -o {self.temp_path}/{self.lib_name}`python3-config --extension-suffix`"
-        )
-        print(cmd)
-        try:
-            subprocess.check_output(cmd, shell=True)
-        except subprocess.CalledProcessError as exc:
-            raise RuntimeError(
-                f"Failed to compile pybind wrapper for {self.lib_name}!"
-            ) from exc
+        cmd += " -o {output}"
+        return build_cached(cmd, self.lib_path, f"pybind wrapper for {self.lib_name}")
+
+    def load(self):
+        if self.lib is None:
+            self.compile_pybind11()
+            # load from the file directly instead of appending to sys.path
+            spec = importlib.util.spec_from_file_location(self.lib_name, self.lib_path)
+            self.lib = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(self.lib)
+        return getattr(self.lib, self.top)
 
     def generate_mlir_c_wrapper(self):
         out_str = "// Auto-generated by Allo\n\n"
@@ -260,49 +415,65 @@ class IPModule:
         # Call library function
         out_str += f"  {self.top}({', '.join(in_ptrs)});\n"
         out_str += "}\n"
-        with open(self.c_wrapper_file, "w", encoding="utf-8") as f:
+        with open(self.mlir_wrapper_file, "w", encoding="utf-8") as f:
             f.write(out_str)
-        return self.c_wrapper_file
+        return self.mlir_wrapper_file
 
     def compile_shared_lib(self):
         # Used in direct function call in an Allo kernel
         self.generate_mlir_c_wrapper()
         if os.system("which llvm-config >> /dev/null") != 0:
             raise RuntimeError("Please install LLVM and add it to your PATH")
-        cmd = "g++ -c -std=c++14 -fpic "
         # suppose the build directory is under llvm-project
-        self.include_paths.append(
+        include_paths = self.include_paths + [
             "/".join(os.popen("which llvm-config").read().split("/")[:-3])
             + "/mlir/include"
-        )
+        ]
+        cmd = f"g++ -c -std=c++14 -fpic {self.build.get_flags('-O3')} "
         cmd += " ".join(
-            ["-I" + (path if path != "" else ".") for path in self.include_paths]
+            ["-I" + (path if path != "" else ".") for path in include_paths]
+        )
+
+        def compile_object(src):
+            # object files are named by the hash of their sources and flags
+            with open(src, "r", encoding="utf-8") as f:
+                code = f.read()
+            obj_hash = get_source_hash(
+                code,
+                *read_local_includes(code, os.path.dirname(src)),
+                self.build.source_hash,
+                cmd,
+            )
+            obj = f"{self.temp_path}/{os.path.basename(src)}_{obj_hash}.o"
+            return build_cached(
+                f"{cmd} {src} -o {{output}}", obj, f"{os.path.basename(src)}.o"
+            )
+
+        srcs = [self.mlir_wrapper_file] + self.build.srcs
+        with ThreadPoolExecutor(max_workers=min(len(srcs), os.cpu_count())) as pool:
+            obj_files = list(pool.map(compile_object, srcs))
+        lib_path = f"{self.temp_path}/lib{self.top}_{get_source_hash(*obj_files)}.so"
+        return build_cached(
+            "g++ -shared -o {output} " + " ".join(obj_files),
+            lib_path,
+            f"lib{self.top}.so",
         )
-        srcs = [self.c_wrapper_file]
-        obj_files = []
-        for src in srcs:
-            subcmd = cmd
-            subcmd += " " + src
-            obj = f"{self.temp_path}/{src.split('/')[-1]}.o"
-            subcmd += " -o " + obj
-            print(subcmd)
-            try:
-                subprocess.check_output(subcmd, shell=True)
-            except subprocess.CalledProcessError as exc:
-                raise RuntimeError(
-                    f"Failed to compile {src.split('/')[-1]}.o!"
-                ) from exc
-            obj_files.append(obj)
-        cmd = f"g++ -shared -o {self.temp_path}/lib{self.top}.so " + " ".join(obj_files)
-        print(cmd)
-        try:
-            subprocess.check_output(cmd, shell=True)
-        except subprocess.CalledProcessError as exc:
-            raise RuntimeError(f"Failed to compile {self.top}.so!") from exc
-        return f"{self.temp_path}/lib{self.top}.so"
 
     def __call__(self, *args):
-        self.compile_pybind11()
-        sys.path.append(self.temp_path)
-        self.lib = importlib.import_module(f"{self.lib_name}")
-        return getattr(self.lib, f"{self.top}")(*args)
+        func = self.load()
+        new_args = []
+        copied = []
+        for arg, (arg_type, arg_shape) in zip(args, self.args):
+            if can_pass_directly(arg, arg_type, arg_shape):
+                new_args.append(arg)
+                continue
+            # mismatched arrays are converted once and written back afterwards,
+            # so that the outputs are not lost in a temporary copy
+            new_arg = np.ascontiguousarray(arg, dtype=c2np_type[arg_type])
+            copied.append((arg, new_arg))
+            new_args.append(new_arg)
+        res = func(*new_args)
+        for arg, new_arg in copied:
+            if arg.flags.writeable:
+                arg[...] = new_arg
+        return res
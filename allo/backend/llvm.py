@@ -11,8 +11,10 @@ from .._mlir.ir import (
     Location,
     Module,
     UnitAttr,
+    ArrayAttr,
+    StringAttr,
 )
-from .._mlir.dialects import allo as allo_d
+from .._mlir.dialects import allo as allo_d, llvm as llvm_d
 from .._mlir.passmanager import PassManager
 from .._mlir.execution_engine import ExecutionEngine
 from .._mlir.runtime import (
@@ -25,6 +27,8 @@ from ..passes import (
     _mlir_lower_pipeline,
     decompose_library_function,
     call_ext_libs_in_ptr,
+    convert_parallel_loops,
+    convert_returns_to_out_params,
 )
 from ..utils import (
     get_func_inputs_outputs,
@@ -43,6 +47,7 @@ from ..utils import (
     extract_out_np_arrays_from_out_struct,
     ranked_memref_to_numpy,
 )
+from .ip import compile_shared_libs
 
 
 def invoke_mlir_parser(mod: str):
@@ -52,8 +57,108 @@ def invoke_mlir_parser(mod: str):
     return module
 
 
+def get_cpu_pipeline(configs):
+    """Returns the affine passes that optimize the loops for CPUs, and the passes
+    that lower the vector operations they create.
+
+    ``configs["cpu_pipeline"]`` is either True, which uses the default options,
+    or a dict with the following keys:
+    - ``tile_size``: tile size of ``affine-loop-tile`` (32), None to disable
+    - ``scalar_replacement``: whether to run ``affine-scalrep`` (True)
+    - ``vector_size``: vector size of ``affine-super-vectorize`` (8), None to disable
+    """
+    pipeline = configs.get("cpu_pipeline", None)
+    if not pipeline:
+        return [], []
+    options = {"tile_size": 32, "scalar_replacement": True, "vector_size": 8}
+    if isinstance(pipeline, dict):
+        options.update(pipeline)
+    affine_passes, vector_passes = [], []
+    if options["tile_size"] is not None:
+        affine_passes.append(f"affine-loop-tile{{tile-size={options['tile_size']}}}")
+    if options["scalar_replacement"]:
+        # forward stores to loads and hoist the invariant accesses of the tiles
+        affine_passes += ["affine-scalrep", "affine-loop-invariant-code-motion"]
+    if options["vector_size"] is not None:
+        affine_passes.append(
+            f"affine-super-vectorize{{virtual-vector-size={options['vector_size']}}}"
+        )
+        vector_passes = [
+            "convert-vector-to-scf",
+            "lower-affine",
+            "convert-vector-to-llvm",
+        ]
+    return affine_passes, vector_passes
+
+
+def set_target_attrs(module, target_cpu=None, target_features=None):
+    """Attaches the target CPU and features to every LLVM function, which
+    overrides the host defaults of the JIT."""
+    attrs = []
+    if target_cpu is not None:
+        attrs.append(
+            ArrayAttr.get([StringAttr.get("target-cpu"), StringAttr.get(target_cpu)])
+        )
+    if target_features is not None:
+        attrs.append(
+            ArrayAttr.get(
+                [StringAttr.get("target-features"), StringAttr.get(target_features)]
+            )
+        )
+    if len(attrs) == 0:
+        return
+    for op in module.body.operations:
+        if isinstance(op, llvm_d.LLVMFuncOp) and len(op.regions[0].blocks) > 0:
+            op.attributes["passthrough"] = ArrayAttr.get(attrs)
+
+
+def free_returned_memrefs(memref_descs, inputs):
+    """Frees the buffers that the kernel allocated for its results.
+
+    The buffers of the inputs and of constant globals (whose allocated pointer
+    is 0xDEADBEEF) are not owned by the results and are skipped.
+    """
+    libc = ctypes.CDLL(None)
+    libc.free.argtypes = [ctypes.c_void_p]
+    owned = {arg.ctypes.data for arg in inputs if isinstance(arg, np.ndarray)}
+    owned.add(0xDEADBEEF)
+    for desc in memref_descs:
+        ptr = ctypes.cast(desc.allocated, ctypes.c_void_p).value
+        if ptr is None or ptr in owned:
+            continue
+        owned.add(ptr)
+        libc.free(ptr)
+
+
 class LLVMModule:
-    def __init__(self, mod, top_func_name, ext_libs=None):
+    """Kernel JIT-compiled by the MLIR ExecutionEngine.
+
+    ``configs`` may contain
+    - ``opt_level``: optimization level of the JIT (2)
+    - ``target_cpu``/``target_features``: e.g., ``"skylake"``/``"+avx2,+fma"``,
+      which default to the host CPU
+    - ``cpu_pipeline``: loop optimizations applied before lowering, see
+      ``get_cpu_pipeline``
+    - ``num_threads``: number of OpenMP threads that run the loops marked by
+      ``.parallel()`` (all the cores by default)
+    - ``auto_parallel``: also run the outermost provably parallel loops in
+      parallel (False)
+    - ``parallel``: set to False to run the loops marked by ``.parallel()``
+      sequentially (True)
+    - ``out_params``: write the returned arrays into buffers passed by the
+      caller instead of allocating them in the kernel (True). This applies
+      when all the results are arrays of NumPy-compatible types, see
+      ``convert_returns_to_out_params``
+    - ``reuse_outputs``: return the same output arrays from every call, which
+      are overwritten by the next call (False)
+
+    The results can also be written into existing arrays with ``out=``.
+    """
+
+    out_params = False
+
+    def __init__(self, mod, top_func_name, ext_libs=None, configs=None):
+        self.configs = {} if configs is None else configs
         # Copy the module to avoid modifying the original one
         with Context() as ctx:
             allo_d.register_dialect(ctx)
@@ -75,6 +180,35 @@ class LLVMModule:
             # Resolve FixedType
             allo_d.lower_fixed_to_int(self.module)
             allo_d.lower_bit_ops(self.module)
+            # Let the caller own the returned arrays
+            self.out_params = (
+                self.configs.get("out_params", True)
+                and len(self.out_types) > 0
+                and all(
+                    len(shape) > 0 and dtype in np_supported_types and dtype != "bf16"
+                    for dtype, shape in self.out_types
+                )
+                and convert_returns_to_out_params(self.module, top_func_name)
+            )
+            self.output_pool = None
+            # Run the parallel loops with OpenMP
+            self.num_parallel_loops = (
+                convert_parallel_loops(self.module)
+                if self.configs.get("parallel", True)
+                else 0
+            )
+            auto_parallel = self.configs.get("auto_parallel", False)
+            self.use_openmp = self.num_parallel_loops > 0 or auto_parallel
+            affine_passes, vector_passes = get_cpu_pipeline(self.configs)
+            if auto_parallel:
+                affine_passes = ["affine-parallelize{max-nested=1}"] + affine_passes
+            omp_passes = []
+            if self.use_openmp:
+                num_threads = self.configs.get("num_threads", None)
+                omp_passes = [
+                    "convert-scf-to-openmp"
+                    + (f"{{num-threads={num_threads}}}" if num_threads else "")
+                ]
             # Run through lowering passes
             pm = PassManager.parse(
                 "builtin.module("
@@ -85,7 +219,8 @@ class LLVMModule:
                 # used for lowering memref.subview
                 "expand-strided-metadata,"
                 # common lowering passes
-                "func.func(convert-linalg-to-affine-loops),lower-affine"
+                f"func.func({','.join(['convert-linalg-to-affine-loops'] + affine_passes)}),"
+                f"{','.join(['lower-affine'] + omp_passes + vector_passes)}"
                 ")"
             )
             pm.run(self.module.operation)
@@ -102,6 +237,11 @@ class LLVMModule:
             allo_d.lower_allo_to_llvm(self.module, ctx)
             pm = PassManager.parse("builtin.module(reconcile-unrealized-casts)")
             pm.run(self.module.operation)
+            set_target_attrs(
+                self.module,
+                self.configs.get("target_cpu", None),
+                self.configs.get("target_features", None),
+            )
             # Add shared library
             assert os.getenv("LLVM_BUILD_DIR") is not None, "LLVM_BUILD_DIR is not set"
             shared_libs = [
@@ -112,15 +252,59 @@ class LLVMModule:
                     os.getenv("LLVM_BUILD_DIR"), "lib", "libmlir_c_runner_utils.so"
                 ),
             ]
-            shared_libs += [lib.compile_shared_lib() for lib in ext_libs]
-            # opt_level should be set to 2 to avoid the following issue
-            # https://github.com/cornell-zhang/allo/issues/72
-            self.execution_engine = ExecutionEngine(
-                self.module, opt_level=2, shared_libs=shared_libs
-            )
+            if self.use_openmp:
+                shared_libs.append(
+                    os.path.join(os.getenv("LLVM_BUILD_DIR"), "lib", "libomp.so")
+                )
+            shared_libs += compile_shared_libs(ext_libs)
+            self.execution_engine = self.create_execution_engine(shared_libs)
+
+    def create_execution_engine(self, shared_libs):
+        # opt_level defaults to 2 to avoid the following issue
+        # https://github.com/cornell-zhang/allo/issues/72
+        return ExecutionEngine(
+            self.module,
+            opt_level=self.configs.get("opt_level", 2),
+            shared_libs=shared_libs,
+        )
+
+    def get_output_buffers(self, out=None):
+        """Returns the arrays that receive the results of a call.
+
+        The arrays in ``out`` are checked against the return types. Otherwise,
+        new arrays are allocated, or taken from the pool if ``reuse_outputs``
+        is set.
+        """
+        if out is not None:
+            outs = list(out) if isinstance(out, (list, tuple)) else [out]
+            if len(outs) != len(self.out_types):
+                raise ValueError(
+                    f"Expected {len(self.out_types)} output arrays, got {len(outs)}"
+                )
+            for buf, (dtype, shape) in zip(outs, self.out_types):
+                if not isinstance(buf, np.ndarray) or buf.shape != tuple(shape):
+                    raise ValueError(f"Output array should have shape {tuple(shape)}")
+                if self.out_params and (
+                    buf.dtype != np_supported_types[dtype]
+                    or not buf.flags["C_CONTIGUOUS"]
+                    or not buf.flags["WRITEABLE"]
+                ):
+                    raise ValueError(
+                        f"Output array should be a writable contiguous {np.dtype(np_supported_types[dtype])} array"
+                    )
+            return outs
+        if self.out_params and self.output_pool is not None:
+            return self.output_pool
+        outs = [
+            np.empty(shape, dtype=np_supported_types.get(dtype, np.float64))
+            for dtype, shape in self.out_types
+        ]
+        if self.out_params and self.configs.get("reuse_outputs", False):
+            self.output_pool = outs
+        return outs
 
     # pylint: disable=too-many-branches
-    def __call__(self, *args):
+    def __call__(self, *args, out=None):
         """
         Reference:
         * https://github.com/llvm/llvm-project/blob/llvmorg-15.0.0/mlir/test/python/execution_engine.py
@@ -220,6 +404,17 @@ class LLVMModule:
         # 2. Construct return pointers
         # Need to verify the return variable is not the same as the input
         result_types = self.out_types
+        if out is not None and len(result_types) == 0:
+            raise ValueError(f"{self.top_func_name} does not return any value")
+        if self.out_params:
+            # The results are trailing arguments of the converted function
+            outs = self.get_output_buffers(out)
+            for buf in outs:
+                arg_ptrs.append(
+                    ctypes.pointer(ctypes.pointer(get_ranked_memref_descriptor(buf)))
+                )
+            self.execution_engine.invoke(self.top_func_name, *arg_ptrs)
+            return outs[0] if len(outs) == 1 else outs
         # Returns as arguments: no return value from the top function
         if len(result_types) == 0:
             self.execution_engine.invoke(self.top_func_name, *arg_ptrs)
@@ -316,7 +511,8 @@ class LLVMModule:
             if len(shape) > 0:  # single return, memref
                 # INVOKE
                 self.execution_engine.invoke(self.top_func_name, return_ptr, *arg_ptrs)
-                ret = ranked_memref_to_numpy(return_ptr[0][0])
+                ret_raw = ranked_memref_to_numpy(return_ptr[0][0])
+                ret = ret_raw
                 if is_anywidth_int_type_and_not_np(result_type):
                     bitwidth = get_bitwidth_from_type(result_type)
                     ret = struct_array_to_int_array(
@@ -338,6 +534,9 @@ class LLVMModule:
                     else:
                         ret = ret.astype(np.uint64)
                     ret = ret.astype(np.float64) / float(2**frac)
+                if ret is ret_raw:
+                    ret = ret_raw.copy()
+                free_returned_memrefs([return_ptr[0][0]], new_args)
             else:  # single return, scalar
                 # INVOKE
                 self.execution_engine.invoke(self.top_func_name, *arg_ptrs, return_ptr)
@@ -377,6 +576,18 @@ class LLVMModule:
                         ret_i = ret.astype(np.uint64)
                     ret_i = ret_i.astype(np.float64) / float(2**frac)
                 else:
-                    ret_i = np_arr
+                    ret_i = np_arr.copy()
                 ret.append(ret_i)
+            free_returned_memrefs(
+                [
+                    getattr(return_ptr[0][0], f"memref{i}")
+                    for i in range(len(result_types))
+                ],
+                new_args,
+            )
+        if out is not None:
+            outs = self.get_output_buffers(out)
+            for buf, res in zip(outs, ret if len(result_types) > 1 else [ret]):
+                buf[...] = res
+            return outs[0] if len(outs) == 1 else outs
         return ret
@@ -48,6 +48,7 @@ from .._mlir.execution_engine import ExecutionEngine
 from ..ir.transform import find_func_in_module
 from ..passes import decompose_library_function
 from ..utils import get_func_inputs_outputs
+from .ip import compile_shared_libs
 
 
 # The `walk` function
@@ -537,7 +538,7 @@ class LLVMOMPModule(LLVMModule):
                 ),
                 os.path.join(os.getenv("LLVM_BUILD_DIR"), "lib", "libomp.so"),
             ]
-            shared_libs += [lib.compile_shared_lib() for lib in ext_libs]
+            shared_libs += compile_shared_libs(ext_libs)
             self.execution_engine = ExecutionEngine(
                 self.module, opt_level=2, shared_libs=shared_libs
             )
@@ -69,10 +69,17 @@ ctype_map = {
 }
 
 
-def codegen_host(top, module):
+def get_host_io_types(top, module, io_types=None):
+    # Returns the (dtype, shape) of the inputs and outputs of the host tensors
+    if io_types is not None:
+        # packed arguments keep the element layout of the original tensors
+        return io_types
+    return get_func_inputs_outputs(find_func_in_module(module, top))
+
+
+def codegen_host(top, module, io_types=None):
     # Reference: https://github.com/Xilinx/Vitis_Accel_Examples/blob/main/sys_opt/kernel_swap/src/host.cpp
-    func = find_func_in_module(module, top)
-    inputs, outputs = get_func_inputs_outputs(func)
+    inputs, outputs = get_host_io_types(top, module, io_types)
     # Get input/output types
     out_str = format_str(header, indent=0, strip=False)
     out_str += format_str(main_header, indent=0, strip=False)
@@ -344,6 +351,216 @@ def codegen_host(top, module):
     return out_str
 
 
+def get_host_ctype(dtype):
+    if dtype in ctype_map:
+        return ctype_map[dtype]
+    if dtype.startswith("i") or dtype.startswith("ui"):
+        prefix, bitwidth = dtype.split("i")
+        if int(bitwidth) == 1:
+            return "bool"
+        return ctype_map[f"{prefix}i{max(get_clostest_pow2(int(bitwidth)), 8)}"]
+    if dtype.startswith("fixed") or dtype.startswith("ufixed"):
+        return "float"
+    raise ValueError(f"Unsupported input type: {dtype}")
+
+
+def codegen_host_multi_cu(top, module, num_cu, split=None, io_types=None):
+    """Generates the host code that runs `num_cu` compute units of `top`.
+
+    The first dimension of the arguments in `split` (indices of the inputs
+    followed by the outputs; all array arguments by default) is split across
+    the compute units, i.e., the host tensors hold `num_cu` times the rows of
+    the kernel arguments, while the other arguments are broadcast. Each compute
+    unit is launched on an out-of-order queue as soon as its inputs are
+    migrated, and the output slices are gathered after all of them finish.
+    """
+    inputs, outputs = get_host_io_types(top, module, io_types)
+    assert len(outputs) <= 1, "Only support one output for now"
+    args = [(f"in{i}", dtype, shape) for i, (dtype, shape) in enumerate(inputs)] + [
+        (f"out{i}", dtype, shape) for i, (dtype, shape) in enumerate(outputs)
+    ]
+    if split is None:
+        split = [i for i, (_, _, shape) in enumerate(args) if len(shape) > 0]
+    # the last input is also the output if the kernel does not return
+    out_name = "out0" if len(outputs) > 0 else f"in{len(inputs) - 1}"
+    out_str = format_str(header, indent=0, strip=False)
+    out_str += format_str(main_header, indent=0, strip=False)
+    out_str += format_str(f"const int num_cu = {num_cu};")
+    out_str += format_str(f"std::vector<cl::Kernel> krnl_{top}(num_cu);")
+    out_str += "\n"
+    # Read the whole tensors and slice them for each compute unit
+    for i, (name, dtype, shape) in enumerate(args):
+        ctype = get_host_ctype(dtype)
+        if len(shape) == 0:
+            out_str += format_str(f'std::ifstream ifile{i}("input{i}.data");')
+            out_str += format_str(f"{ctype} source_{name};")
+            out_str += format_str(f"ifile{i} >> source_{name};")
+            continue
+        size = int(np.prod(shape))
+        total = size * num_cu if i in split else size
+        out_str += format_str(
+            f"size_t size_bytes_{name} = sizeof({ctype}) * {size};", strip=False
+        )
+        out_str += format_str(f"std::vector<{ctype}> data_{name}({total}, 0);")
+        if name.startswith("in"):
+            out_str += format_str(f'std::ifstream ifile{i}("input{i}.data");')
+            out_str += format_str(f"for (unsigned i = 0; i < {total}; i++) {{")
+            out_str += format_str(f"  ifile{i} >> data_{name}[i];", strip=False)
+            out_str += format_str("}")
+        offset = f"c * {size}" if i in split else "0"
+        out_str += format_str(
+            f"std::vector<std::vector<{ctype}, aligned_allocator<{ctype}> > > source_{name}(num_cu);"
+        )
+        out_str += format_str("for (int c = 0; c < num_cu; c++) {")
+        out_str += format_str(
+            f"  source_{name}[c].assign(data_{name}.begin() + {offset}, data_{name}.begin() + {offset} + {size});",
+            strip=False,
+        )
+        out_str += format_str("}")
+    out_str += "\n"
+    out_str += format_str(
+        """
+        auto devices = xcl::get_xil_devices();
+        auto fileBuf = xcl::read_binary_file(binaryFile);
+        cl::Program::Binaries bins{{fileBuf.data(), fileBuf.size()}};
+        bool valid_device = false;
+        for (unsigned int i = 0; i < devices.size(); i++) {
+            auto device = devices[i];
+            // Out-of-order queue to run the compute units concurrently
+            OCL_CHECK(err, context = cl::Context(device, nullptr, nullptr, nullptr, &err));
+            OCL_CHECK(err, q = cl::CommandQueue(context, device, CL_QUEUE_PROFILING_ENABLE | CL_QUEUE_OUT_OF_ORDER_EXEC_MODE_ENABLE, &err));
+            std::cout << "Trying to program device[" << i << "]: " << device.getInfo<CL_DEVICE_NAME>() << std::endl;
+            cl::Program program(context, {device}, bins, nullptr, &err);
+            if (err != CL_SUCCESS) {
+                std::cout << "Failed to program device[" << i << "] with xclbin file!\\n";
+            } else {
+                std::cout << "Device[" << i << "]: program successful!\\n";
+        """
+    )
+    out_str += format_str("for (int c = 0; c < num_cu; c++) {", 12, False)
+    out_str += format_str(
+        f'std::string cu_name = "{top}:{{{top}_" + std::to_string(c + 1) + "}}";',
+        14,
+        False,
+    )
+    out_str += format_str(
+        f"OCL_CHECK(err, krnl_{top}[c] = cl::Kernel(program, cu_name.c_str(), &err));",
+        14,
+        False,
+    )
+    out_str += format_str("}", 12, False)
+    out_str += format_str(
+        """            valid_device = true;
+            break; // we break because we found a valid device
+        }
+    }
+    if (!valid_device) {
+        std::cout << "Failed to program any device found, exit!\\n";
+        exit(EXIT_FAILURE);
+    }
+    """,
+        strip=False,
+        indent=0,
+    )
+    # Buffers and arguments of each compute unit
+    for name, _, shape in args:
+        if len(shape) > 0:
+            out_str += format_str(f"std::vector<cl::Buffer> buffer_{name}(num_cu);")
+    out_str += format_str("std::vector<cl::Event> events(num_cu);")
+    out_str += format_str("for (int c = 0; c < num_cu; c++) {")
+    in_bufs = []
+    for i, (name, _, shape) in enumerate(args):
+        if len(shape) == 0:
+            out_str += format_str(
+                f"  OCL_CHECK(err, err = krnl_{top}[c].setArg({i}, source_{name}));",
+                strip=False,
+            )
+            continue
+        if name == out_name:
+            flag = "CL_MEM_READ_WRITE" if name.startswith("in") else "CL_MEM_WRITE_ONLY"
+        else:
+            flag = "CL_MEM_READ_ONLY"
+        out_str += format_str(
+            f"  OCL_CHECK(err, buffer_{name}[c] = cl::Buffer(context, CL_MEM_USE_HOST_PTR | {flag}, size_bytes_{name}, source_{name}[c].data(), &err));",
+            strip=False,
+        )
+        out_str += format_str(
+            f"  OCL_CHECK(err, err = krnl_{top}[c].setArg({i}, buffer_{name}[c]));",
+            strip=False,
+        )
+        if name.startswith("in"):
+            in_bufs.append(f"buffer_{name}[c]")
+    if len(in_bufs) > 0:
+        out_str += format_str("  std::vector<cl::Event> write_event(1);", strip=False)
+        out_str += format_str(
+            "  OCL_CHECK(err, err = q.enqueueMigrateMemObjects({"
+            + ", ".join(in_bufs)
+            + "}, 0 /* 0 means from host*/, nullptr, &write_event[0]));",
+            strip=False,
+        )
+    wait_list = "&write_event" if len(in_bufs) > 0 else "nullptr"
+    out_str += format_str(
+        f"  OCL_CHECK(err, err = q.enqueueTask(krnl_{top}[c], {wait_list}, &events[c]));",
+        strip=False,
+    )
+    out_str += format_str(
+        "  std::vector<cl::Event> compute_event{events[c]};", strip=False
+    )
+    out_str += format_str(
+        f"  OCL_CHECK(err, err = q.enqueueMigrateMemObjects({{buffer_{out_name}[c]}}, CL_MIGRATE_MEM_OBJECT_HOST, &compute_event, nullptr));",
+        strip=False,
+    )
+    out_str += format_str("}")
+    out_str += format_str("q.finish();")
+    out_str += "\n"
+    # Timing across all the compute units
+    out_str += format_str(
+        """
+        uint64_t nstimestart = UINT64_MAX, nstimeend = 0;
+        for (int c = 0; c < num_cu; c++) {
+            uint64_t start, end;
+            OCL_CHECK(err, err = events[c].getProfilingInfo<uint64_t>(CL_PROFILING_COMMAND_START, &start));
+            OCL_CHECK(err, err = events[c].getProfilingInfo<uint64_t>(CL_PROFILING_COMMAND_END, &end));
+            nstimestart = std::min(nstimestart, start);
+            nstimeend = std::max(nstimeend, end);
+        }
+        """
+    )
+    out_str += format_str(
+        f'std::cout << "{top} x " << num_cu << " CUs: " << nstimeend - nstimestart << " ns\\n";'
+    )
+    out_str += "\n"
+    # Gather the output slices
+    out_idx = len(inputs) if len(outputs) > 0 else len(inputs) - 1
+    size = int(np.prod(args[out_idx][2]))
+    offset = f"c * {size}" if out_idx in split else "0"
+    out_str += format_str("for (int c = 0; c < num_cu; c++) {")
+    out_str += format_str(
+        f"  std::copy(source_{out_name}[c].begin(), source_{out_name}[c].end(), data_{out_name}.begin() + {offset});",
+        strip=False,
+    )
+    out_str += format_str("}")
+    out_str += format_str(
+        f"""    // Write the output data to file
+    std::ofstream ofile;
+    ofile.open("output.data");
+    if (!ofile) {{
+        std::cerr << "Failed to open output file!" << std::endl;
+        return EXIT_FAILURE;
+    }}
+    for (unsigned i = 0; i < data_{out_name}.size(); i++) {{
+        ofile << data_{out_name}[i] << std::endl;
+    }}
+    ofile.close();
+    """,
+        strip=False,
+        indent=0,
+    )
+    out_str += format_str("return EXIT_SUCCESS;", strip=False)
+    out_str += "}\n"
+    return out_str
+
+
 def postprocess_hls_code(hls_code, top=None, pragma=True):
     out_str = ""
     func_decl = False
@@ -394,12 +611,72 @@ def postprocess_hls_code(hls_code, top=None, pragma=True):
     return out_str
 
 
-def generate_description_file(top, src_path, dst_path, frequency):
+def get_top_arg_names(hls_code, top):
+    # Returns the (name, is_array) pairs of the arguments of the top function
+    args = []
+    func_decl = False
+    for line in hls_code.split("\n"):
+        if line.startswith(f"void {top}("):
+            func_decl = True
+        elif func_decl and line.startswith(") {"):
+            break
+        elif func_decl:
+            var = line.strip().rsplit(" ", 1)[1]
+            args.append((var.split("[")[0].rstrip(","), "[" in var))
+    return args
+
+
+def assign_memory_banks(traffic, banks, fixed=None):
+    """Assigns each argument to a memory bank.
+
+    The arguments are greedily placed on the least loaded bank in decreasing
+    order of their traffic, so that the concurrent streams spread over the banks.
+
+    Parameters
+    ----------
+    traffic: dict
+        Maps an argument to the number of bytes it transfers.
+
+    banks: list
+        Available memory banks, e.g., ``["HBM[0]", "HBM[1]"]``.
+
+    fixed: dict
+        User-specified argument to bank assignments.
+    """
+    assignment = dict(fixed) if fixed is not None else {}
+    loads = {bank: 0 for bank in banks}
+    for arg, bank in assignment.items():
+        loads[bank] = loads.get(bank, 0) + traffic.get(arg, 0)
+    for arg in sorted(traffic, key=lambda arg: -traffic[arg]):
+        if arg in assignment:
+            continue
+        # ties go to the first bank
+        bank = min(banks, key=lambda bank: loads[bank])
+        assignment[arg] = bank
+        loads[bank] += traffic[arg]
+    return assignment
+
+
+def codegen_connectivity(top, assignment, num_cu=1):
+    # The compute units of kernel `top` are named `{top}_1`, `{top}_2`, ...
+    # With multiple compute units, each argument maps to a list of banks
+    flags = [f"--connectivity.nk {top}:{num_cu}"] if num_cu > 1 else []
+    for arg, banks in assignment.items():
+        if not isinstance(banks, list):
+            banks = [banks] * num_cu
+        for cu, bank in enumerate(banks):
+            flags.append(f"--connectivity.sp {top}_{cu + 1}.{arg}:{bank}")
+    return " ".join(flags)
+
+
+def generate_description_file(top, src_path, dst_path, frequency, ldclflags=""):
     with open(src_path, "r", encoding="utf-8") as f:
         desc = f.read()
     desc = desc.replace("top", top)
     desc = json.loads(desc)
     desc["containers"][0]["ldclflags"] += f"  --kernel_frequency {frequency}"
+    if ldclflags:
+        desc["containers"][0]["ldclflags"] += f" {ldclflags}"
     with open(dst_path, "w", encoding="utf-8") as outfile:
         json.dump(desc, outfile, indent=4)
 
@@ -4,7 +4,6 @@
 
 import re
 import inspect
-import textwrap
 import copy
 from dataclasses import dataclass
 from functools import wraps
@@ -46,7 +45,7 @@ from ._mlir.exceptions import (
 
 from . import primitives as prim
 from .ir.visitor import ASTContext
-from .ir.utils import MockArg, MockBuffer, parse_ast, get_global_vars
+from .ir.utils import MockArg, MockBuffer, parse_ast, get_global_vars, get_source
 from .ir.builder import ASTTransformer
 from .ir.infer import TypeInferer
 from .ir.transform import (
@@ -59,9 +58,10 @@ from .ir.transform import (
 from .passes import (
     _mlir_lower_pipeline,
     lower_linalg_and_attach_names,
-    analyze_use_def,
+    UseDefIndex,
 )
 from .backend.llvm import LLVMModule
+from .backend.cpp import CPPModule
 from .backend.hls import HLSModule
 from .library import KERNEL2SCHEDULE
 from .library.systolic import check_systolic, prepare_systolic
@@ -83,6 +83,7 @@ def wrapped_apply(fn):
         _mlir_lower_pipeline(sch.module)
         # Remove previous Python-C++ references
         sch.module.context._clear_live_operations()
+        sch.use_def_index = None
         # Update top function in the current context
         for op in sch.module.body.operations:
             if isinstance(op, func_d.FuncOp) and op.name.value == sch.top_func_name:
@@ -129,6 +130,8 @@ class Schedule:
         self.ext_libs = ext_libs
         self.partitioned_arrays = {}
         self.inst_list = inst_list if inst_list is not None else []
+        # built lazily and invalidated after each primitive
+        self.use_def_index = None
         if func_args:
             for func_name, _ in func_args.items():
                 if func_name not in self.func_args:
@@ -314,6 +317,7 @@ class Schedule:
         i32 = IntegerType.get_signless(32)
         ui32 = IntegerType.get_unsigned(32)
         # find all the tensors that need to be partitioned
+        index = self.get_use_def_index()
         visited_target_names = []
         visited_func_calls = []
 
@@ -322,7 +326,9 @@ class Schedule:
             if name in visited_target_names:
                 return
             visited_target_names.append(name)
-            _, _, mlir_target = find_buffer(self.module, inner_target, self.func_args)
+            _, _, mlir_target = find_buffer(
+                self.module, inner_target, self.func_args, index
+            )
             # equivalent users
             arg_names = [
                 dtensor.name if hasattr(dtensor, "name") else dtensor
@@ -344,21 +350,12 @@ class Schedule:
             # calling the same function
             if isinstance(mlir_target, func_d.CallOp):
                 visited_func_calls.append(mlir_target)
-                for func in self.module.body.operations:
-                    if isinstance(func, func_d.FuncOp):
-                        for call_op in func.entry_block.operations:
-                            if (
-                                isinstance(call_op, func_d.CallOp)
-                                and mlir_target.attributes["callee"]
-                                == call_op.attributes["callee"]
-                                and call_op not in visited_func_calls
-                            ):
-                                visited_func_calls.append(call_op)
-                                buffer = MockBuffer(
-                                    func.attributes["sym_name"].value,
-                                    call_op.attributes["name"].value,
-                                )
-                                recursive_partition(buffer)
+                callee = mlir_target.attributes["callee"].value
+                for func_name, call_op in index.get_callers(callee):
+                    if call_op not in visited_func_calls:
+                        visited_func_calls.append(call_op)
+                        buffer = MockBuffer(func_name, call_op.attributes["name"].value)
+                        recursive_partition(buffer)
 
         recursive_partition(target)
         for inner_target in visited_target_names:
@@ -366,6 +363,7 @@ class Schedule:
                 self.module,
                 MockBuffer(inner_target.split(":")[0], inner_target.split(":")[1]),
                 self.func_args,
+                index,
             )
             if inner_target not in self.partitioned_arrays:
                 self.partitioned_arrays[inner_target] = [(partition_type, dim, factor)]
@@ -471,6 +469,7 @@ class Schedule:
         _mlir_lower_pipeline(self.module)
         # Remove previous Python-C++ references
         self.module.context._clear_live_operations()
+        self.use_def_index = None
         # Update top function in the current context
         for op in self.module.body.operations:
             if isinstance(op, func_d.FuncOp) and op.name.value == self.top_func_name:
@@ -497,7 +496,9 @@ class Schedule:
             The loop index whose body contains writes to target
         """
         buff_name = target.name
-        _, _, target = find_buffer(self.module, target, self.func_args)
+        _, _, target = find_buffer(
+            self.module, target, self.func_args, self.get_use_def_index()
+        )
         func, axis = self._get_func_and_axis(axis)
         band_name, axis = find_loop_in_bands(func, axis)
         band = self._find_band(band_name, func)
@@ -529,6 +530,8 @@ class Schedule:
             fifo_memref_type = MemRefType.get([i_size, j_size + 1, k_size], load_type)
             fifo_memref = memref_d.AllocOp(fifo_memref_type, [], [], ip=ip)
             fifo_memref.attributes["name"] = StringAttr.get(f"{buff_name}_fifo")
+        # the new buffer is not in the index
+        self.use_def_index = None
         fifo_mock_buffer = MockBuffer(func.name.value, f"{buff_name}_fifo")
         fifo_mock_buffer.result = fifo_memref.result
         setattr(self, f"{buff_name}_fifo", fifo_mock_buffer)
@@ -892,6 +895,8 @@ class Schedule:
         instantiate: list
             This is a list of objects used to instantiate types `schs` is generic over.
         """
+        # the composed functions exist before any primitive is applied to them
+        func_names = set(self.get_use_def_index().funcs)
 
         def get_name(arg):
             if isinstance(arg, (LoopWrapper, MockBuffer)):
@@ -900,14 +905,14 @@ class Schedule:
                 func_name = (
                     orig_func_name if id is None else orig_func_name + "_" + str(id)
                 )
-                if self._find_function(func_name, error=False) is None:
+                if func_name not in func_names:
                     func_name = orig_func_name + "_0"
                 arg.func = func_name
                 return arg
             orig_func_name = arg.split(":")[0] if ":" in arg else sch.top_func_name
             arg = arg.split(":")[1] if ":" in arg else arg
             func_name = orig_func_name if id is None else orig_func_name + "_" + str(id)
-            if self._find_function(func_name, error=False) is None:
+            if func_name not in func_names:
                 func_name = orig_func_name + "_0"
             return f"{func_name}:{arg}"
 
@@ -969,12 +974,13 @@ class Schedule:
                     # directly apply primitives to new functions
                     primitive_func(*args, **kwargs)
 
+    def get_use_def_index(self):
+        if self.use_def_index is None:
+            self.use_def_index = UseDefIndex(self.module, self.func_args)
+        return self.use_def_index
+
     def get_equivalent_variables(self, name):
-        use_def = analyze_use_def(self.module)
-        for ele in use_def:
-            if name in ele:
-                return ele
-        return []
+        return self.get_use_def_index().get_equivalent_variables(name)
 
     def build(self, target=None, mode=None, project=None, configs=None, wrap_io=True):
         if target is None or target == "llvm":
@@ -983,6 +989,18 @@ class Schedule:
                 self.module,
                 top_func_name=self.top_func_name,
                 ext_libs=self.ext_libs,
+                configs=configs,
+            )
+        if target == "cpp":
+            configs = {} if configs is None else configs
+            return CPPModule(
+                self.module,
+                top_func_name=self.top_func_name,
+                ext_libs=self.ext_libs,
+                project=project,
+                cflags=configs.get("cflags", None),
+                compiler=configs.get("compiler", None),
+                configs=configs,
             )
         if target in {"vhls", "vivado_hls", "vitis_hls", "tapa", "ihls"}:
             match target:
@@ -1022,9 +1040,7 @@ def customize(
         src, starting_line_no = fn, 1
         file_name = None
     else:
-        src, starting_line_no = inspect.getsourcelines(fn)
-        src = [textwrap.fill(line, tabsize=4, width=9999) for line in src]
-        src = textwrap.dedent("\n".join(src))
+        src, starting_line_no = get_source(fn)
         file_name = inspect.getfile(fn)
     tree = parse_ast(src, starting_line_no=starting_line_no, verbose=verbose)
     if instantiate is None:
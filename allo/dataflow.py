@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: Apache-2.0
 # pylint: disable=no-name-in-module, unexpected-keyword-arg, no-value-for-parameter, global-variable-not-assigned, global-statement, broad-exception-caught, too-many-arguments
 
+import os
 import functools
 from ._mlir.ir import (
     InsertionPoint,
@@ -17,11 +18,13 @@ from ._mlir.passmanager import PassManager as mlir_pass_manager
 from .customize import customize as _customize
 from .ir.utils import get_global_vars, get_all_df_kernels
 from .backend.ai_engine import AIEModule
+from .backend.aie_emulator import AIEEmulatorModule
+from .backend.aie_planner import get_kernel_indices, plan_kernel_sharding
 
 from .backend.simulator import LLVMOMPModule
 from .ir.types import Stream
 from .passes import df_pipeline
-from .backend import AIE_MLIRModule
+from .backend import AIE_MLIRModule, AIE_MLIRPipeline
 
 
 def get_pid():
@@ -316,6 +319,7 @@ def build(
             s.func_args,
             project,
             stream_info,
+            configs,
         )
         mod.build()
         return mod
@@ -329,12 +333,24 @@ def build(
             s.module, s.top_func_name, s.func_args, project, stream_info, s.ext_libs
         )
         aie_mod.build(
+            configs=configs,
             profile=profile,
             warmup=warmup,
             num_iters=num_iters,
         )
         return aie_mod
 
+    if target == "aie-emu":
+        s = customize(func, opt_default)
+        sim_mod = LLVMOMPModule(s.module, s.top_func_name)
+        global_vars = get_global_vars(func)
+        s = _customize(func, global_vars=global_vars, enable_tensor=False)
+        stream_info = move_stream_to_interface(s)
+        s = _build_top(s, stream_info, target="aie")
+        return AIEEmulatorModule(
+            sim_mod, s.module, s.top_func_name, s.func_args, stream_info, configs
+        )
+
     if target == "simulator":
         s = customize(func, opt_default)
         return LLVMOMPModule(s.module, s.top_func_name)
@@ -348,3 +364,78 @@ def build(
         wrap_io=wrap_io,
     )
     return hls_mod
+
+
+def build_pipeline(funcs, project="top.prj", configs=None):
+    """
+    Build dataflow regions that run back to back on the NPU (target aie-mlir).
+
+    Each region is compiled into ``{project}/stage{i}`` (a region listed several
+    times is compiled once), and one host program runs them in order. Tensors with
+    the same name in different regions share one device buffer, so the outputs of a
+    region are consumed by the later ones without copies to the host, and only the
+    outputs that no later region reads are copied back. The pipeline takes its
+    tensors in the order of their first appearance. The regions are not merged into
+    one xclbin, so the NPU is reconfigured between the stages.
+    """
+    modules = {}
+    stages = []
+    for func in funcs:
+        if func not in modules:
+            global_vars = get_global_vars(func)
+            s = _customize(func, global_vars=global_vars, enable_tensor=False)
+            stream_info = move_stream_to_interface(s)
+            s = _build_top(s, stream_info, target="aie")
+            modules[func] = AIE_MLIRModule(
+                s.module,
+                s.top_func_name,
+                s.func_args,
+                os.path.join(project, f"stage{len(modules)}"),
+                stream_info,
+                s.ext_libs,
+            )
+        stages.append(modules[func])
+    pipeline = AIE_MLIRPipeline(stages, project)
+    pipeline.build(configs=configs)
+    return pipeline
+
+
+def plan_sharding(func, mesh, kernel_name=None, configs=None, num_plans=5):
+    """
+    Enumerates the tensor-parallel shardings of a kernel of a dataflow region and
+    returns the best ones (see `allo.backend.aie_planner.plan_kernel_sharding`),
+    where the index structure of the kernel is derived from its loads and stores.
+
+    The kernel, given by name if the region has several, must have a single
+    instance, e.g., the region built by the `region_builder` of
+    `rank_sharding_plans` with the mapping [1] and replicated layouts.
+    """
+    global_vars = get_global_vars(func)
+    s = _customize(func, global_vars=global_vars, enable_tensor=False)
+    stream_info = move_stream_to_interface(s)
+    s = _build_top(s, stream_info, target="aie")
+    return plan_kernel_sharding(
+        get_kernel_indices(s.module, s.func_args, kernel_name),
+        mesh,
+        configs,
+        num_plans,
+    )
+
+
+def rank_sharding_plans(region_builder, plans, configs=None):
+    """
+    Ranks the sharding plans of a kernel (see `plan_sharding`) by the cycles of
+    their designs on the AIE emulator, which also models the streams and the
+    other kernels of the region.
+
+    `region_builder(mapping, layouts)` returns the dataflow region with the kernel
+    mapped by `mapping` and its arguments placed by `layouts`, a dictionary from
+    argument names to layouts. The returned plans hold the emulated cycles.
+    """
+    ranked = []
+    for plan in plans:
+        top = region_builder(plan.mapping, plan.layouts)
+        mod = build(top, target="aie-emu", configs=configs)
+        ranked.append(plan._replace(cycles=mod.report["cycles"]))
+    ranked.sort(key=lambda plan: plan.cycles)
+    return ranked
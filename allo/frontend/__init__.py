@@ -2,3 +2,4 @@
 # SPDX-License-Identifier: Apache-2.0
 
 from .pytorch import from_pytorch
+from .dynamic import from_pytorch_dynamic, DynamicShapeModule
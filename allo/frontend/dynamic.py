@@ -0,0 +1,199 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+# This file implements dynamic-shape support for the PyTorch frontend by
+# compiling one module per shape bucket and dispatching calls by input shape.
+
+import bisect
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import torch
+except ImportError:
+    pass
+from .pytorch import from_pytorch
+
+
+class DynamicShapeModule:
+    """Compiles a PyTorch model once per shape bucket.
+
+    Parameters
+    ----------
+    model: torch.nn.Module
+        The model to be compiled.
+
+    example_inputs: list
+        Example inputs used to infer the static dimensions.
+
+    dynamic_dims: dict
+        Maps a symbolic dimension name to a list of (input index, axis) pairs,
+        e.g., ``{"seq_len": [(0, 1), (1, 1)]}``.
+
+    buckets: dict
+        Maps a symbolic dimension name to the sizes that will be compiled,
+        e.g., ``{"seq_len": [32, 64, 128]}``. Inputs are padded up to the
+        smallest bucket that can hold them, so the model must be insensitive
+        to the padded entries (e.g., by masking).
+
+    max_cache_size: int
+        Maximum number of built modules kept in the LRU cache.
+
+    pad_value: float
+        Value used to pad the inputs.
+
+    **kwargs:
+        Other arguments passed to ``from_pytorch``.
+    """
+
+    def __init__(
+        self,
+        model,
+        example_inputs,
+        dynamic_dims,
+        buckets,
+        max_cache_size=8,
+        pad_value=0.0,
+        **kwargs,
+    ):
+        if kwargs.get("target", "llvm") != "llvm":
+            raise NotImplementedError("Only the LLVM target supports dynamic shapes")
+        if set(dynamic_dims) != set(buckets):
+            raise ValueError("Each dynamic dimension requires its buckets")
+        self.model = model
+        self.example_inputs = list(example_inputs)
+        self.dynamic_dims = dynamic_dims
+        self.buckets = {name: sorted(sizes) for name, sizes in buckets.items()}
+        self.max_cache_size = max_cache_size
+        self.pad_value = pad_value
+        self.kwargs = kwargs
+        self.cache = OrderedDict()
+        self.num_compiles = 0
+        self.num_hits = 0
+        self.output_dims = self._infer_output_dims()
+
+    def _run_model(self, sizes):
+        with torch.no_grad():
+            outputs = self.model(*self._make_example_inputs(sizes))
+        if isinstance(outputs, torch.Tensor):
+            return [tuple(outputs.shape)]
+        return [tuple(out.shape) for out in outputs]
+
+    def _infer_output_dims(self):
+        # Perturb each symbolic dimension by one and check which output axes follow
+        sizes = self.get_sizes(self.example_inputs)
+        base = self._run_model(sizes)
+        output_dims = {}
+        for name in self.dynamic_dims:
+            new_sizes = dict(sizes)
+            new_sizes[name] += 1
+            shapes = self._run_model(new_sizes)
+            output_dims[name] = [
+                (i, axis)
+                for i, (old, new) in enumerate(zip(base, shapes))
+                for axis, (x, y) in enumerate(zip(old, new))
+                if y == x + 1
+            ]
+        return output_dims
+
+    def _make_example_inputs(self, sizes):
+        inputs = []
+        for i, x in enumerate(self.example_inputs):
+            if not isinstance(x, torch.Tensor):
+                inputs.append(x)
+                continue
+            shape = list(x.shape)
+            for name, dims in self.dynamic_dims.items():
+                for idx, axis in dims:
+                    if idx == i:
+                        shape[axis] = sizes[name]
+            inputs.append(torch.zeros(shape, dtype=x.dtype))
+        return inputs
+
+    def get_sizes(self, inputs):
+        sizes = {}
+        for name, dims in self.dynamic_dims.items():
+            values = {inputs[idx].shape[axis] for idx, axis in dims}
+            if len(values) != 1:
+                raise ValueError(f"Inconsistent sizes {values} for dimension {name}")
+            sizes[name] = values.pop()
+        return sizes
+
+    def get_bucket(self, sizes):
+        bucket = {}
+        for name, size in sizes.items():
+            pos = bisect.bisect_left(self.buckets[name], size)
+            if pos == len(self.buckets[name]):
+                raise ValueError(
+                    f"Size {size} of dimension {name} exceeds the largest bucket {self.buckets[name][-1]}"
+                )
+            bucket[name] = self.buckets[name][pos]
+        return bucket
+
+    def get_module(self, bucket):
+        key = tuple(sorted(bucket.items()))
+        if key in self.cache:
+            self.num_hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        mod = from_pytorch(
+            self.model,
+            example_inputs=self._make_example_inputs(bucket),
+            **self.kwargs,
+        )
+        self.num_compiles += 1
+        self.cache[key] = mod
+        if len(self.cache) > self.max_cache_size:
+            self.cache.popitem(last=False)
+        return mod
+
+    def warmup(self):
+        """Builds every bucket ahead of time (at most `max_cache_size` are kept)."""
+        names = list(self.buckets)
+        for sizes in np.ndindex(*[len(self.buckets[name]) for name in names]):
+            self.get_module(
+                {name: self.buckets[name][i] for name, i in zip(names, sizes)}
+            )
+
+    def __call__(self, *args):
+        sizes = self.get_sizes(args)
+        bucket = self.get_bucket(sizes)
+        mod = self.get_module(bucket)
+        new_args = []
+        for i, arg in enumerate(args):
+            if not isinstance(arg, np.ndarray):
+                new_args.append(arg)
+                continue
+            pad_width = [[0, 0] for _ in arg.shape]
+            for name, dims in self.dynamic_dims.items():
+                for idx, axis in dims:
+                    if idx == i:
+                        pad_width[axis][1] = bucket[name] - sizes[name]
+            new_args.append(
+                np.ascontiguousarray(
+                    np.pad(arg, pad_width, constant_values=self.pad_value)
+                )
+            )
+        outputs = mod(*new_args)
+        is_tuple = isinstance(outputs, (list, tuple))
+        outputs = list(outputs) if is_tuple else [outputs]
+        # remove the padded entries from the outputs
+        for name, dims in self.output_dims.items():
+            for idx, axis in dims:
+                slices = [slice(None)] * outputs[idx].ndim
+                slices[axis] = slice(0, sizes[name])
+                outputs[idx] = outputs[idx][tuple(slices)]
+        return tuple(outputs) if is_tuple else outputs[0]
+
+
+def from_pytorch_dynamic(
+    model, example_inputs, dynamic_dims, buckets, max_cache_size=8, **kwargs
+):
+    return DynamicShapeModule(
+        model,
+        example_inputs,
+        dynamic_dims,
+        buckets,
+        max_cache_size=max_cache_size,
+        **kwargs,
+    )
@@ -0,0 +1,146 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+# This file implements the FX-graph-level operator fusion of the PyTorch frontend,
+# which maps chains of operators to the fused kernels in allo/library/nn.py.
+
+import operator
+import numbers
+from dataclasses import dataclass, field
+
+try:
+    import torch
+    from torch import fx
+    from torch.nn import functional as F
+except ImportError:
+    pass
+
+
+@dataclass
+class FusedOp:
+    # "linear_act", "add_layernorm", or "matmul_scale_softmax"
+    kind: str
+    # FX nodes of the chain in topological order
+    nodes: list
+    attrs: dict = field(default_factory=dict)
+
+
+def _single_user(node):
+    users = list(node.users)
+    return users[0] if len(users) == 1 else None
+
+
+def _has_shape(node):
+    return isinstance(node, fx.Node) and "tensor_meta" in node.meta
+
+
+def _get_activation(modules, node):
+    if node.op == "call_module":
+        return {torch.nn.ReLU: "relu", torch.nn.GELU: "gelu"}.get(
+            type(modules[node.target])
+        )
+    if node.op == "call_function":
+        return {F.relu: "relu", F.gelu: "gelu"}.get(node.target)
+    return None
+
+
+def _match_linear_act(modules, node):
+    if node.op != "call_module" or not isinstance(
+        modules[node.target], torch.nn.Linear
+    ):
+        return None
+    if modules[node.target].bias is None:
+        return None
+    user = _single_user(node)
+    if user is None or user.args[0] is not node:
+        return None
+    act = _get_activation(modules, user)
+    if act is None or len(node.meta["tensor_meta"].shape) not in {2, 3}:
+        return None
+    return FusedOp("linear_act", [node, user], {"act": act})
+
+
+def _match_add_layernorm(modules, node):
+    if node.op != "call_function" or node.target is not operator.add:
+        return None
+    lhs, rhs = node.args[:2]
+    if not (_has_shape(lhs) and _has_shape(rhs)):
+        return None
+    shape = tuple(node.meta["tensor_meta"].shape)
+    if (
+        tuple(lhs.meta["tensor_meta"].shape) != shape
+        or tuple(rhs.meta["tensor_meta"].shape) != shape
+        or len(shape) not in {2, 3}
+    ):
+        return None
+    user = _single_user(node)
+    if user is None or user.op != "call_module":
+        return None
+    module = modules[user.target]
+    if (
+        not isinstance(module, torch.nn.LayerNorm)
+        or not module.elementwise_affine
+        or tuple(module.normalized_shape) != shape[-1:]
+    ):
+        return None
+    return FusedOp("add_layernorm", [node, user], {"eps": module.eps})
+
+
+def _match_matmul_scale_softmax(node):
+    if node.op != "call_function" or node.target is not torch.matmul:
+        return None
+    lhs, rhs = node.args[:2]
+    if not (_has_shape(lhs) and _has_shape(rhs)):
+        return None
+    lhs_shape = tuple(lhs.meta["tensor_meta"].shape)
+    rhs_shape = tuple(rhs.meta["tensor_meta"].shape)
+    # batch dimensions are not broadcast by the fused kernel
+    if len(lhs_shape) < 2 or lhs_shape[:-2] != rhs_shape[:-2]:
+        return None
+    scale_node = _single_user(node)
+    if (
+        scale_node is None
+        or scale_node.op != "call_function"
+        or scale_node.target not in {operator.truediv, operator.mul}
+        or scale_node.args[0] is not node
+        or not isinstance(scale_node.args[1], numbers.Number)
+    ):
+        return None
+    scale = scale_node.args[1]
+    scale = 1.0 / scale if scale_node.target is operator.truediv else float(scale)
+    softmax = _single_user(scale_node)
+    if (
+        softmax is None
+        or softmax.op != "call_function"
+        or softmax.target is not F.softmax
+        or softmax.kwargs.get("dim") != -1
+    ):
+        return None
+    return FusedOp(
+        "matmul_scale_softmax", [node, scale_node, softmax], {"scale": scale}
+    )
+
+
+def find_fusion_groups(gm, exclude=None):
+    """Finds fusible operator chains in a shape-propagated FX graph.
+
+    Intermediate nodes of a chain must have the next node as their only user,
+    so that their results need not be materialized.
+
+    Returns a dict mapping the name of every node in a chain to its FusedOp.
+    """
+    exclude = exclude if exclude is not None else set()
+    modules = dict(gm.named_modules())
+    groups = {}
+    for node in gm.graph.nodes:
+        if node.name in groups or not _has_shape(node) or node.target in exclude:
+            continue
+        group = (
+            _match_linear_act(modules, node)
+            or _match_add_layernorm(modules, node)
+            or _match_matmul_scale_softmax(node)
+        )
+        if group is None or any(n.name in groups for n in group.nodes):
+            continue
+        for item in group.nodes:
+            groups[item.name] = group
+    return groups
@@ -6,6 +6,8 @@ import operator
 import inspect
 import math
 
+import numpy as np
+
 try:
     import torch
     from torch import fx
@@ -16,11 +18,18 @@ try:
 except ImportError:
     pass
 from .library import CoreAttention_lib, KVCache_lib
+from .quantize import (
+    calibrate,
+    resolve_quant_config,
+    quantize_weight,
+    accuracy_report,
+)
+from .fusion import find_fusion_groups
 from .. import dsl
 from ..library import nn
 from ..ir import types
 from ..customize import customize
-from ..ir.types import float32
+from ..ir.types import float32, int32
 
 
 def from_pytorch(
@@ -32,7 +41,13 @@ def from_pytorch(
     target="llvm",
     mode="csim",
     project="top.prj",
+    options=None,
 ):
+    # options: the per-layer dtype policies ("quant_config"), the calibration
+    # inputs ("calib_inputs"), and whether to fuse operators ("enable_fusion")
+    options = {} if options is None else options
+    quant_config = options.get("quant_config")
+    calib_inputs = options.get("calib_inputs")
     sig = inspect.signature(model.forward)
     input_names = [
         p.name for i, p in enumerate(sig.parameters.values()) if i < len(example_inputs)
@@ -67,8 +82,20 @@ def from_pytorch(
         new_name = "gb_" + name.replace(".", "_")
         global_vars.update({new_name: buf.detach().numpy()})
 
-    builder = TorchBuilder(gm, example_inputs, leaf_modules)
+    quant_params = None
+    if quant_config:
+        # calibration pass on the example (or user-provided) inputs
+        if calib_inputs is None:
+            calib_inputs = [args]
+        stats = calibrate(gm, calib_inputs)
+        quant_params = resolve_quant_config(gm, quant_config, stats)
+    fused = None
+    if options.get("enable_fusion", False):
+        # quantized layers are lowered separately and cannot be fused
+        fused = find_fusion_groups(gm, exclude=set(quant_params or {}))
+    builder = TorchBuilder(gm, example_inputs, leaf_modules, quant_params, fused)
     code = builder.build()
+    global_vars.update(builder.global_vars)
     if verbose:
         print(code)
     s = customize(code, global_vars=global_vars, enable_tensor=enable_tensor)
@@ -80,6 +107,18 @@ def from_pytorch(
     if target == "mlir":
         return s
     mod = s.build(target=target, mode=mode, project=project)
+    if quant_params and target == "llvm":
+        # accuracy of the quantized module vs. the float model
+        with torch.no_grad():
+            golden = model(*example_inputs)
+        if isinstance(golden, (list, tuple)):
+            golden = [x.detach().numpy() for x in golden]
+        else:
+            golden = golden.detach().numpy()
+        outputs = mod(*[x.detach().numpy() for x in example_inputs])
+        mod.quant_report = accuracy_report(golden, outputs)
+        if verbose:
+            print(mod.quant_report)
     return mod
 
 
@@ -88,7 +127,9 @@ def get_var_name(node):
 
 
 class TorchBuilder:
-    def __init__(self, gm, example_inputs, leaf_modules=None):
+    def __init__(
+        self, gm, example_inputs, leaf_modules=None, quant_params=None, fused=None
+    ):
         self.gm = gm
         self.code = []
         self.input_names = []
@@ -102,6 +143,14 @@ class TorchBuilder:
         self.output = []
         self.composition = []
         self.unique_id = {}
+        # module name -> LayerQuantParams
+        self.quant_params = quant_params if quant_params is not None else {}
+        # parameter name -> (type name, global variable name)
+        self.param_types = {}
+        # extra global variables (quantized weights, types) used by the code
+        self.global_vars = {}
+        # node name -> FusedOp
+        self.fused = fused if fused is not None else {}
 
     def build(self):
         for node in self.gm.graph.nodes:
@@ -140,7 +189,8 @@ class TorchBuilder:
         if self.named_params:
             for name, param in self.named_params.items():
                 new_name = name.replace(".", "_")
-                res += f"    {new_name}: float32[{', '.join([str(s) for s in param.shape])}] = g_{new_name}\n"
+                dtype, g_name = self.param_types.get(name, ("float32", f"g_{new_name}"))
+                res += f"    {new_name}: {dtype}[{', '.join([str(s) for s in param.shape])}] = {g_name}\n"
         if self.named_buffers:
             for name, buf in self.named_buffers.items():
                 new_name = name.replace(".", "_")
@@ -155,8 +205,16 @@ class TorchBuilder:
         return res
 
     def __call__(self, node):
-        method = getattr(self, "build_" + node.op)
-        ret = method(node)
+        if node.name in self.fused:
+            group = self.fused[node.name]
+            # the whole chain is emitted at its last node
+            if node is not group.nodes[-1]:
+                return None
+            ret = getattr(self, f"build_fused_{group.kind}")(group)
+            ret += f'  # shape: {str(tuple(node.meta["tensor_meta"].shape))}'
+        else:
+            method = getattr(self, "build_" + node.op)
+            ret = method(node)
         if ret:
             self.code.append(ret)
         return ret
@@ -335,6 +393,10 @@ class TorchBuilder:
         raise NotImplementedError("Unsupported shape for relu")
 
     def build_linear(self, node, bias):
+        if isinstance(node.target, str) and node.target in self.quant_params:
+            return self.build_quantized_linear(
+                node, bias, self.quant_params[node.target]
+            )
         target_name = node.target.replace(".", "_")
         inp = get_var_name(node.args[0])
         weight = get_var_name(target_name + "_weight")
@@ -362,6 +424,163 @@ class TorchBuilder:
             raise NotImplementedError("Unsupported shape for linear")
         return f"{node.name} = dsl.linear({inp}, {weight})"
 
+    def build_quantized_linear(self, node, bias, layer):
+        # Layers are lowered on 2D views, and the inputs/outputs are kept in float32,
+        # so quantized layers can be freely mixed with float32 ones.
+        target_name = node.target.replace(".", "_")
+        inp = get_var_name(node.args[0])
+        weight = target_name + "_weight"
+        out_shape = tuple(node.meta["tensor_meta"].shape)
+        if len(out_shape) not in {2, 3}:
+            raise NotImplementedError("Unsupported shape for quantized linear")
+        d, m = self.named_params[f"{node.target}.weight"].shape
+        n = math.prod(out_shape[:-1])
+        if len(out_shape) == 3:
+            self.code.append(f"{node.name}_in = dsl.view({inp}, ({n}, {m}))")
+            inp = f"{node.name}_in"
+        out = node.name if len(out_shape) == 2 else f"{node.name}_out"
+        if bias:
+            bias = target_name + "_bias"
+        else:
+            bias = target_name + "_zero_bias"
+            self.global_vars[f"gq_{bias}"] = np.zeros((d,), dtype=np.float32)
+            self.code.append(f"{bias}: float32[{d}] = gq_{bias}")
+        if layer.policy.dtype == "int8":
+            # quantize -> int8 x int8 linear with int32 accumulation -> dequantize
+            qweight = quantize_weight(
+                self.named_params[f"{node.target}.weight"].detach().numpy(), layer
+            )
+            self.global_vars[f"gq_{weight}"] = qweight
+            self.param_types[f"{node.target}.weight"] = ("int8", f"gq_{weight}")
+            zp = layer.x_zero_point
+            name_id = self.get_unique_id("quantize2d")
+            self.composition.append(
+                ("quantize2d", name_id, [float32, types.int8, n, m, layer.qmax])
+            )
+            self.code.append(
+                f'{node.name}_q = nn.quantize2d[float32, int8, {n}, {m}, {layer.qmax}, "{name_id}"]({inp}, {layer.x_scale!r}, {float(zp)!r})'
+            )
+            name_id = self.get_unique_id("qlinear2d")
+            self.composition.append(
+                ("qlinear2d", name_id, [types.int8, int32, float32, n, d, m])
+            )
+            scale = layer.x_scale * layer.w_scale
+            stmt = f'{out} = nn.qlinear2d[int8, int32, float32, {n}, {d}, {m}, "{name_id}"]({node.name}_q, {weight}, {bias}, {zp}, {scale!r})'
+        else:
+            # bf16/fixed: cast the input, run the typed kernel, and cast back
+            dtype = f"qty_{target_name}"
+            self.global_vars[dtype] = layer.dtype
+            name_id = self.get_unique_id("cast2d")
+            self.composition.append(("cast2d", name_id, [float32, layer.dtype, n, m]))
+            self.code.append(
+                f'{node.name}_c = nn.cast2d[float32, {dtype}, {n}, {m}, "{name_id}"]({inp})'
+            )
+            if layer.policy.dtype == "bf16" and not bias.endswith("_zero_bias"):
+                # bf16 parameters are directly stored in the reduced precision
+                for param in (f"{node.target}.weight", f"{node.target}.bias"):
+                    new_name = param.replace(".", "_")
+                    self.param_types[param] = (dtype, f"g_{new_name}")
+            else:
+                name_id = self.get_unique_id("cast2d")
+                self.composition.append(
+                    ("cast2d", name_id, [float32, layer.dtype, d, m])
+                )
+                self.code.append(
+                    f'{weight}_c = nn.cast2d[float32, {dtype}, {d}, {m}, "{name_id}"]({weight})'
+                )
+                weight = f"{weight}_c"
+                name_id = self.get_unique_id("cast1d")
+                self.composition.append(("cast1d", name_id, [float32, layer.dtype, d]))
+                self.code.append(
+                    f'{bias}_c = nn.cast1d[float32, {dtype}, {d}, "{name_id}"]({bias})'
+                )
+                bias = f"{bias}_c"
+            name_id = self.get_unique_id("linear")
+            self.composition.append(("linear2d", name_id, [layer.dtype, n, d, m]))
+            self.code.append(
+                f'{node.name}_y = nn.linear2d[{dtype}, {n}, {d}, {m}, "{name_id}"]({node.name}_c, {weight}, {bias})'
+            )
+            name_id = self.get_unique_id("cast2d")
+            self.composition.append(("cast2d", name_id, [layer.dtype, float32, n, d]))
+            stmt = f'{out} = nn.cast2d[{dtype}, float32, {n}, {d}, "{name_id}"]({node.name}_y)'
+        if len(out_shape) == 3:
+            self.code.append(stmt)
+            stmt = f"{node.name} = dsl.view({out}, {out_shape})"
+        return stmt
+
+    def view_as(self, name, inp, in_shape, shape):
+        if tuple(in_shape) == tuple(shape):
+            return inp
+        self.code.append(f"{name} = dsl.view({inp}, {tuple(shape)})")
+        return name
+
+    def build_fused_linear_act(self, group):
+        node, act = group.nodes
+        target_name = node.target.replace(".", "_")
+        in_shape = tuple(node.args[0].meta["tensor_meta"].shape)
+        out_shape = tuple(act.meta["tensor_meta"].shape)
+        d, m = self.named_params[f"{node.target}.weight"].shape
+        n = math.prod(out_shape[:-1])
+        inp = self.view_as(
+            f"{act.name}_in", get_var_name(node.args[0]), in_shape, (n, m)
+        )
+        func = f"linear2d_{group.attrs['act']}"
+        name_id = self.get_unique_id(func)
+        self.composition.append((func, name_id, [float32, n, d, m]))
+        call = f'nn.{func}[float32, {n}, {d}, {m}, "{name_id}"]({inp}, {target_name}_weight, {target_name}_bias)'
+        if len(out_shape) == 2:
+            return f"{act.name} = {call}"
+        self.code.append(f"{act.name}_out = {call}")
+        return f"{act.name} = dsl.view({act.name}_out, {out_shape})"
+
+    def build_fused_add_layernorm(self, group):
+        add, norm = group.nodes
+        target_name = norm.target.replace(".", "_")
+        shape = tuple(norm.meta["tensor_meta"].shape)
+        l, d = math.prod(shape[:-1]), shape[-1]
+        lhs, rhs = [
+            self.view_as(f"{norm.name}_in{i}", get_var_name(arg), shape, (l, d))
+            for i, arg in enumerate(add.args[:2])
+        ]
+        name_id = self.get_unique_id("add_layer_norm")
+        self.composition.append(("add_layer_norm", name_id, [float32, l, d]))
+        call = f'nn.add_layer_norm[float32, {l}, {d}, "{name_id}"]({lhs}, {rhs}, {target_name}_weight, {target_name}_bias, {group.attrs["eps"]!r})'
+        if len(shape) == 2:
+            return f"{norm.name} = {call}"
+        self.code.append(f"{norm.name}_out = {call}")
+        return f"{norm.name} = dsl.view({norm.name}_out, {shape})"
+
+    def build_fused_matmul_scale_softmax(self, group):
+        matmul, _, softmax = group.nodes
+        lhs_shape = tuple(matmul.args[0].meta["tensor_meta"].shape)
+        rhs_shape = tuple(matmul.args[1].meta["tensor_meta"].shape)
+        out_shape = tuple(softmax.meta["tensor_meta"].shape)
+        # batch dimensions are flattened into one
+        b = math.prod(lhs_shape[:-2])
+        l, d = lhs_shape[-2:]
+        m = rhs_shape[-1]
+        lhs = self.view_as(
+            f"{softmax.name}_lhs",
+            get_var_name(matmul.args[0]),
+            lhs_shape,
+            (b, l, d),
+        )
+        rhs = self.view_as(
+            f"{softmax.name}_rhs",
+            get_var_name(matmul.args[1]),
+            rhs_shape,
+            (b, d, m),
+        )
+        name_id = self.get_unique_id("matmul_scale_softmax")
+        self.composition.append(
+            ("matmul_scale_softmax", name_id, [float32, b, l, d, m])
+        )
+        call = f'nn.matmul_scale_softmax[float32, {b}, {l}, {d}, {m}, "{name_id}"]({lhs}, {rhs}, {group.attrs["scale"]!r})'
+        if len(out_shape) == 3:
+            return f"{softmax.name} = {call}"
+        self.code.append(f"{softmax.name}_out = {call}")
+        return f"{softmax.name} = dsl.view({softmax.name}_out, {out_shape})"
+
     def build_gelu(self, node):
         inp = get_var_name(node.args[0])
         return f"{node.name} = dsl.gelu({inp})"
@@ -0,0 +1,185 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+# This file implements the calibration and per-layer dtype policies used by the
+# quantization-aware mode of the PyTorch frontend.
+
+import math
+import fnmatch
+from dataclasses import dataclass
+
+import numpy as np
+
+try:
+    import torch
+    from torch import fx
+except ImportError:
+    pass
+from ..ir.types import AlloType, Fixed, bfloat16, int8
+
+
+@dataclass
+class QuantPolicy:
+    """Describes how a layer should be lowered.
+
+    dtype: one of "bf16", "int8" and "fixed".
+    bits: total bitwidth of the quantized values ("int8" and "fixed").
+    frac_bits: fractional bits of "fixed"; derived from calibration if None.
+    symmetric: use a zero point of 0 for the activations of "int8".
+    """
+
+    dtype: str = "int8"
+    bits: int = 8
+    frac_bits: int = None
+    symmetric: bool = False
+
+
+@dataclass
+class LayerQuantParams:
+    policy: QuantPolicy
+    dtype: AlloType
+    # only used by "int8"
+    x_scale: float = 1.0
+    x_zero_point: int = 0
+    w_scale: float = 1.0
+
+    @property
+    def qmax(self):
+        return (1 << (self.policy.bits - 1)) - 1
+
+
+def _to_policy(policy):
+    if isinstance(policy, QuantPolicy):
+        return policy
+    if isinstance(policy, str):
+        if policy == "bf16":
+            return QuantPolicy("bf16", bits=16)
+        if policy == "int8":
+            return QuantPolicy("int8", bits=8)
+        if policy == "fixed":
+            return QuantPolicy("fixed", bits=16)
+    raise ValueError(f"Unsupported quantization policy: {policy}")
+
+
+def calibrate(gm, calib_inputs):
+    """Runs the traced graph on each set of inputs and records the (min, max)
+    range of every floating-point tensor produced by a node."""
+
+    stats = {}
+
+    class Observer(fx.Interpreter):
+        def run_node(self, n):
+            out = super().run_node(n)
+            if isinstance(out, torch.Tensor) and out.is_floating_point():
+                lo, hi = out.min().item(), out.max().item()
+                if n.name in stats:
+                    lo = min(lo, stats[n.name][0])
+                    hi = max(hi, stats[n.name][1])
+                stats[n.name] = (lo, hi)
+            return out
+
+    with torch.no_grad():
+        for args in calib_inputs:
+            Observer(gm).run(*args)
+    return stats
+
+
+def _int_bits(max_abs):
+    # sign bit + integer bits required to hold max_abs
+    return max(math.ceil(math.log2(max_abs + 1e-12)), 0) + 1 if max_abs > 0 else 1
+
+
+def _resolve_layer(policy, x_range, y_range, weight):
+    if policy.dtype == "bf16":
+        return LayerQuantParams(policy, bfloat16)
+    if policy.dtype == "fixed":
+        if policy.frac_bits is None:
+            max_abs = max(
+                abs(x_range[0]),
+                abs(x_range[1]),
+                abs(y_range[0]),
+                abs(y_range[1]),
+                float(np.abs(weight).max()),
+            )
+            frac_bits = policy.bits - _int_bits(max_abs)
+            if frac_bits < 0:
+                raise ValueError(
+                    f"{policy.bits} bits cannot represent the calibrated range {max_abs}"
+                )
+        else:
+            frac_bits = policy.frac_bits
+        return LayerQuantParams(policy, Fixed(policy.bits, frac_bits))
+    if policy.dtype == "int8":
+        if policy.bits != 8:
+            raise ValueError("Only 8-bit integer quantization is supported")
+        qmax = (1 << (policy.bits - 1)) - 1
+        qmin = -qmax - 1
+        lo, hi = min(x_range[0], 0.0), max(x_range[1], 0.0)
+        if policy.symmetric:
+            x_scale = max(abs(lo), abs(hi)) / qmax
+            x_zero_point = 0
+        else:
+            x_scale = (hi - lo) / (qmax - qmin)
+            x_zero_point = 0 if x_scale == 0 else int(round(qmin - lo / x_scale))
+        w_scale = float(np.abs(weight).max()) / qmax
+        return LayerQuantParams(
+            policy,
+            int8,
+            x_scale=x_scale if x_scale > 0 else 1.0,
+            x_zero_point=x_zero_point,
+            w_scale=w_scale if w_scale > 0 else 1.0,
+        )
+    raise ValueError(f"Unsupported quantization dtype: {policy.dtype}")
+
+
+def resolve_quant_config(gm, quant_config, stats):
+    """Maps every quantized ``torch.nn.Linear`` module to its layer parameters.
+
+    ``quant_config`` maps module names (glob patterns are allowed, e.g.,
+    ``"encoder.*.fc1"`` or ``"*"``) to a policy ("bf16", "int8", "fixed" or a
+    ``QuantPolicy``). Layers without a matching pattern stay in float32.
+    """
+    policies = {key: _to_policy(val) for key, val in quant_config.items()}
+    modules = dict(gm.named_modules())
+    params = {}
+    for node in gm.graph.nodes:
+        if node.op != "call_module" or not isinstance(
+            modules[node.target], torch.nn.Linear
+        ):
+            continue
+        for pattern, policy in policies.items():
+            if fnmatch.fnmatchcase(node.target, pattern):
+                break
+        else:
+            continue
+        weight = modules[node.target].weight.detach().numpy()
+        params[node.target] = _resolve_layer(
+            policy,
+            stats.get(node.args[0].name, (0.0, 0.0)),
+            stats.get(node.name, (0.0, 0.0)),
+            weight,
+        )
+    return params
+
+
+def quantize_weight(weight, layer):
+    qmax = layer.qmax
+    return np.clip(np.round(weight / layer.w_scale), -qmax - 1, qmax).astype(np.int8)
+
+
+def accuracy_report(golden, outputs):
+    """Compares the outputs of the quantized module against the float model."""
+    if not isinstance(golden, (list, tuple)):
+        golden, outputs = [golden], [outputs]
+    report = []
+    for ref, res in zip(golden, outputs):
+        ref = np.asarray(ref, dtype=np.float32)
+        err = np.abs(np.asarray(res, dtype=np.float32) - ref)
+        norm = float(np.linalg.norm(ref))
+        report.append(
+            {
+                "max_abs_error": float(err.max()),
+                "mean_abs_error": float(err.mean()),
+                "relative_error": float(np.linalg.norm(err)) / norm if norm else 0.0,
+            }
+        )
+    return report
@@ -5,8 +5,6 @@
 import ast
 import sys
 import traceback
-import inspect
-import textwrap
 import warnings
 import sympy
 import numpy as np
@@ -39,7 +37,12 @@ from ..utils import (
 )
 from ..memory import DTensor, Layout
 from ..logging import print_error_message
-from .utils import parse_ast, get_func_id_from_param_types, resolve_generic_types
+from .utils import (
+    parse_ast,
+    get_func_id_from_param_types,
+    resolve_generic_types,
+    get_source,
+)
 from ..backend.experimental.external_kernel import ExternalModule
 
 
@@ -903,9 +906,7 @@ class TypeInferer(ASTVisitor):
         else:
             # Visit arguments in the top-level
             visit_stmts(ctx, node.args)
-            src, starting_line_no = inspect.getsourcelines(func)
-            src = [textwrap.fill(line, tabsize=4, width=9999) for line in src]
-            src = textwrap.dedent("\n".join(src))
+            src, starting_line_no = get_source(func)
             tree = parse_ast(
                 src, starting_line_no=starting_line_no, verbose=ctx.verbose
             )
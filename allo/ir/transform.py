@@ -15,10 +15,17 @@ from .._mlir.ir import (
     FlatSymbolRefAttr,
     FunctionType,
     TypeAttr,
+    IndexType,
+    F16Type,
+    F32Type,
+    F64Type,
+    BF16Type,
 )
 from .._mlir.dialects import (
+    allo as allo_d,
     memref as memref_d,
     affine as affine_d,
+    arith as arith_d,
     scf as scf_d,
     func as func_d,
 )
@@ -83,11 +90,14 @@ def get_loop_band_names(func):
     return results
 
 
-def find_buffer(module, target, func_args):
+def find_buffer(module, target, func_args, index=None):
     assert isinstance(target, MockBuffer), "Target must be a buffer"
     if target.op is not None:
         return None, -1, target.op
     func_name, target_name = target.func, target.name
+    if index is not None:
+        # use the prebuilt symbol table (see allo.passes.UseDefIndex)
+        return index.find_buffer(func_name, target_name)
     target_func = None
     for op in module.body.operations:
         if (
@@ -403,11 +413,118 @@ def create_data_movement(
             )
 
 
-def wrap_data_movement(arg, ip, func_name, from_memory, flatten, mapping):
+def get_packed_lanes(memref_type, bus_width):
+    """Returns the number of elements of `memref_type` packed into one
+    `bus_width`-bit word, or None if the tensor cannot be packed."""
+    ele_type = memref_type.element_type
+    if IntegerType.isinstance(ele_type):
+        bitwidth = IntegerType(ele_type).width
+    elif F16Type.isinstance(ele_type) or BF16Type.isinstance(ele_type):
+        bitwidth = 16
+    elif F32Type.isinstance(ele_type):
+        bitwidth = 32
+    elif F64Type.isinstance(ele_type):
+        bitwidth = 64
+    else:
+        # fixed-point types cannot be bitcast
+        return None
+    if bus_width % bitwidth != 0:
+        return None
+    lanes = bus_width // bitwidth
+    if lanes <= 1 or np.prod(memref_type.shape) % lanes != 0:
+        return None
+    return lanes
+
+
+def get_packed_type(memref_type, bus_width, lanes):
+    return MemRefType.get(
+        (int(np.prod(memref_type.shape)) // lanes,),
+        IntegerType.get_signless(bus_width),
+    )
+
+
+def create_packed_data_movement(tensors, name, ip, from_memory, lanes):
+    # Moves data between a packed memref<N x i{bus_width}> and an on-chip buffer.
+    # One word is transferred per cycle and the lanes are (un)packed in parallel.
+    if len(tensors) != 2:
+        raise IndexError("One source and one destination ONLY!")
+    if from_memory:
+        packed, buf = tensors[0], tensors[1]
+    else:
+        buf, packed = tensors[0], tensors[1]
+    word_type = MemRefType(packed.type).element_type
+    ele_type = MemRefType(buf.type).element_type
+    shape = MemRefType(buf.type).shape
+    bitwidth = IntegerType(word_type).width // lanes
+
+    for_loops = build_for_loops([MemRefType(packed.type).shape[0], lanes], ip, name)
+    if len(for_loops) != 2:
+        raise RuntimeError(f"Expected a word loop and a lane loop in {name}")
+    outer_loop, inner_loop = for_loops[0], for_loops[1]
+    outer_loop.attributes["pipeline_ii"] = IntegerAttr.get(
+        IntegerType.get_unsigned(32), 1
+    )
+    inner_loop.attributes["unroll"] = IntegerAttr.get(IntegerType.get_unsigned(32), 0)
+    induction_vars = [for_loop.induction_variable for for_loop in for_loops]
+
+    # (word, lane) -> row-major index of the on-chip buffer
+    flat_idx = f"(d0 * {lanes} + d1)"
+    buf_idx = []
+    for i, dim in enumerate(shape):
+        stride = int(np.prod(shape[i + 1 :]))
+        expr = f"{flat_idx} floordiv {stride}" if stride > 1 else flat_idx
+        buf_idx.append(f"({expr}) mod {dim}" if i > 0 else expr)
+    buf_attr = AffineMapAttr.parse(f"affine_map<(d0, d1)->({', '.join(buf_idx)})>")
+    word_attr = AffineMapAttr.parse("affine_map<(d0)->(d0)>")
+    scalar_attr = AffineMapAttr.parse("affine_map<()->()>")
+    lane_type = IntegerType.get_signless(bitwidth)
+
+    with InsertionPoint(inner_loop):
+        if from_memory:
+            word = affine_d.AffineLoadOp(
+                word_type, packed, [induction_vars[0]], word_attr
+            ).result
+        else:
+            word_buf = memref_d.AllocOp(MemRefType.get([], word_type), [], [])
+            word_buf.attributes["name"] = StringAttr.get("word")
+    with InsertionPoint(inner_loop.body.operations[0]):
+        # bit range of the lane
+        lower = arith_d.MulIOp(
+            induction_vars[1],
+            arith_d.ConstantOp(IndexType.get(), bitwidth).result,
+        )
+        upper = arith_d.AddIOp(
+            lower.result, arith_d.ConstantOp(IndexType.get(), bitwidth - 1).result
+        )
+        if from_memory:
+            val = allo_d.GetIntSliceOp(lane_type, word, upper.result, lower.result)
+            if not IntegerType.isinstance(ele_type):
+                val = arith_d.BitcastOp(ele_type, val.result)
+            affine_d.AffineStoreOp(val.result, buf, induction_vars, buf_attr)
+        else:
+            val = affine_d.AffineLoadOp(ele_type, buf, induction_vars, buf_attr)
+            if not IntegerType.isinstance(ele_type):
+                val = arith_d.BitcastOp(lane_type, val.result)
+            word = affine_d.AffineLoadOp(word_type, word_buf.result, [], scalar_attr)
+            word = allo_d.SetIntSliceOp(
+                word_type, word.result, upper.result, lower.result, val.result
+            )
+            affine_d.AffineStoreOp(word.result, word_buf.result, [], scalar_attr)
+    if not from_memory:
+        with InsertionPoint.at_block_terminator(outer_loop.body):
+            word = affine_d.AffineLoadOp(word_type, word_buf.result, [], scalar_attr)
+            affine_d.AffineStoreOp(word.result, packed, [induction_vars[0]], word_attr)
+
+
+def wrap_data_movement(
+    arg, ip, func_name, from_memory, flatten, mapping, bus_width=None, lanes=None
+):
     # Build input types
     shape = MemRefType(arg.type).shape
 
-    if not flatten:
+    if lanes is not None:
+        type_flatten = get_packed_type(MemRefType(arg.type), bus_width, lanes)
+    elif not flatten:
         type_flatten = MemRefType.get(shape, MemRefType(arg.type).element_type)
     else:
         type_flatten = MemRefType.get(
@@ -422,7 +539,11 @@ def wrap_data_movement(arg, ip, func_name, from_memory, flatten, mapping):
     func_op = func_d.FuncOp(name=func_name, type=func_type, ip=ip)
 
     # Attach type hints
-    if hasattr(arg, "dtype"):
+    if lanes is not None:
+        # packed words are emitted as ap_uint<bus_width>
+        typehints = ["u", "_"] if from_memory else ["_", "u"]
+        func_op.attributes["itypes"] = StringAttr.get("".join(typehints))
+    elif hasattr(arg, "dtype"):
         typehints = [get_extra_type_hints(arg.dtype)] * 2
         func_op.attributes["itypes"] = StringAttr.get("".join(typehints))
 
@@ -433,14 +554,72 @@ def wrap_data_movement(arg, ip, func_name, from_memory, flatten, mapping):
     with func_op.context, Location.unknown():
         ip_move = InsertionPoint(func_op.entry_block)
 
-        create_data_movement(
-            func_op.arguments,
-            func_name,
-            ip=ip_move,
-            from_memory=from_memory,
-            flatten=flatten,
-            mapping=mapping,
+        if lanes is not None:
+            create_packed_data_movement(
+                func_op.arguments,
+                func_name,
+                ip=ip_move,
+                from_memory=from_memory,
+                lanes=lanes,
+            )
+        else:
+            create_data_movement(
+                func_op.arguments,
+                func_name,
+                ip=ip_move,
+                from_memory=from_memory,
+                flatten=flatten,
+                mapping=mapping,
+            )
+
+    func_d.ReturnOp([], ip=InsertionPoint(func_op.entry_block))
+
+
+def wrap_tile_movement(memref_type, tile_rows, ip, func_name, from_memory):
+    # Moves the `idx`-th block of `tile_rows` rows between a flattened
+    # off-chip tensor and an on-chip tile buffer
+    shape = memref_type.shape
+    ele_type = memref_type.element_type
+    type_flatten = MemRefType.get((int(np.prod(shape)),), ele_type)
+    type_tile = MemRefType.get((tile_rows, *shape[1:]), ele_type)
+    input_types = (
+        [type_flatten, type_tile] if from_memory else [type_tile, type_flatten]
+    )
+    func_type = FunctionType.get(input_types + [IndexType.get()], [])
+    func_op = func_d.FuncOp(name=func_name, type=func_type, ip=ip)
+    func_op.add_entry_block()
+
+    with func_op.context, Location.unknown():
+        for_loops = build_for_loops(
+            list(type_tile.shape), InsertionPoint(func_op.entry_block), func_name
+        )
+        for_loops[-1].attributes["pipeline_ii"] = IntegerAttr.get(
+            IntegerType.get_unsigned(32), 1
+        )
+        induction_vars = [for_loop.induction_variable for for_loop in for_loops]
+        dims = [f"d{i}" for i in range(len(shape))]
+        flat_str = f"(s0 * {tile_rows} + d0) * {int(np.prod(shape[1:]))}"
+        for i in range(1, len(shape)):
+            flat_str += f" + d{i} * {int(np.prod(shape[i + 1 :]))}"
+        flat_attr = AffineMapAttr.parse(
+            f"affine_map<({', '.join(dims)})[s0]->({flat_str})>"
         )
+        tile_attr = AffineMapAttr.parse(
+            f"affine_map<({', '.join(dims)})->({', '.join(dims)})>"
+        )
+        src, dst = func_op.arguments[0], func_op.arguments[1]
+        idx = func_op.arguments[2]
+        with InsertionPoint(for_loops[-1].body.operations[0]):
+            if from_memory:
+                load = affine_d.AffineLoadOp(
+                    ele_type, src, induction_vars + [idx], flat_attr
+                )
+                affine_d.AffineStoreOp(load.result, dst, induction_vars, tile_attr)
+            else:
+                load = affine_d.AffineLoadOp(ele_type, src, induction_vars, tile_attr)
+                affine_d.AffineStoreOp(
+                    load.result, dst, induction_vars + [idx], flat_attr
+                )
 
     func_d.ReturnOp([], ip=InsertionPoint(func_op.entry_block))
 
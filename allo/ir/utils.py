@@ -4,7 +4,8 @@
 
 import ast
 import inspect
-from collections.abc import Callable
+import textwrap
+import weakref
 from types import FunctionType as PyFunctionType
 from .._mlir.ir import (
     MemRefType,
@@ -27,40 +28,124 @@ from .types import AlloType, Int, UInt, Fixed, UFixed, Index
 from .symbol_resolver import ASTResolver
 
 
-def _get_global_vars(_func):
-    if isinstance(_func, Callable):
-        # Discussions: https://github.com/taichi-dev/taichi/issues/282
-        global_vars = _func.__globals__.copy()
-    else:
-        global_vars = {}
+# Source code and referenced names of each function, keyed by its code object,
+# so that redefined functions are automatically invalidated
+_SOURCE_CACHE = weakref.WeakKeyDictionary()
+
+
+def get_source(func):
+    """Returns the dedented source code of `func` and its starting line number."""
+    code = func.__code__
+    if code not in _SOURCE_CACHE:
+        lines, starting_line_no = inspect.getsourcelines(func)
+        src = textwrap.dedent("\n".join(line.expandtabs(4).rstrip() for line in lines))
+        _SOURCE_CACHE[code] = [src, starting_line_no, None]
+    return _SOURCE_CACHE[code][0], _SOURCE_CACHE[code][1]
+
+
+def _collect_names(tree):
+    # Names and dotted attribute chains (e.g., `nn.linear2d`) used in the AST
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            names.add(node.id)
+        elif isinstance(node, ast.Attribute):
+            chain = [node.attr]
+            value = node.value
+            while isinstance(value, ast.Attribute):
+                chain.append(value.attr)
+                value = value.value
+            if isinstance(value, ast.Name):
+                chain.append(value.id)
+                names.add(".".join(reversed(chain)))
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            # string annotations, e.g., "Ty[M, N]"
+            try:
+                names |= _collect_names(ast.parse(node.value, mode="eval"))
+            except SyntaxError:
+                pass
+    return names
+
+
+def get_referenced_names(func):
+    get_source(func)
+    entry = _SOURCE_CACHE[func.__code__]
+    if entry[2] is None:
+        entry[2] = frozenset(_collect_names(ast.parse(entry[0])))
+    return entry[2]
+
+
+def _get_global_vars(_func, outer_vars):
+    # Only capture the variables referenced by the function instead of copying
+    # the whole __globals__ dict. Priority: closure > outer scope > globals
+    closure = {}
+    if _func.__closure__:
+        closure = {
+            name: cell.cell_contents
+            for name, cell in zip(_func.__code__.co_freevars, _func.__closure__)
+        }
+    global_vars = {}
+    for chain in get_referenced_names(_func):
+        name = chain.split(".")[0]
+        for scope in (closure, outer_vars, _func.__globals__):
+            if name in scope:
+                global_vars[name] = scope[name]
+                break
+    return global_vars
+
+
+def _resolve_chain(chain, global_vars):
+    names = chain.split(".")
+    var = global_vars.get(names[0])
+    for attr in names[1:]:
+        var = getattr(var, attr, None)
+    return var
 
+
+def get_global_vars(func):
+    """Returns the global variables used by `func` and the functions it calls."""
     # Get back to the outer-most scope (user-defined function)
     # Mainly used to get the annotation definitions (shape and type),
     # which are probably not defined in __globals__
-    for name, var in inspect.stack()[3][0].f_locals.items():
-        if isinstance(var, (int, float, AlloType)) or inspect.isfunction(var):
-            global_vars[name] = var
-
-    if isinstance(_func, Callable):
-        freevar_names = _func.__code__.co_freevars
-        closure = _func.__closure__
-        if closure:
-            freevar_values = [x.cell_contents for x in closure]
-            for name, value in zip(freevar_names, freevar_values):
-                global_vars[name] = value
+    frame = inspect.currentframe().f_back.f_back
+    outer_vars = {
+        name: var
+        for name, var in frame.f_locals.items()
+        if isinstance(var, (int, float, AlloType)) or inspect.isfunction(var)
+    }
+    del frame
+    if not isinstance(func, PyFunctionType):
+        return outer_vars
+    try:
+        global_vars = _get_global_vars(func, outer_vars)
+    except (OSError, TypeError):
+        # Source code is not available
+        global_vars = {**func.__globals__, **outer_vars}
+        return global_vars
+    # import functions from other files
+    worklist = [func]
+    visited = {func}
+    while worklist:
+        var = worklist.pop()
+        if var is func:
+            new_vars = global_vars
+        else:
+            try:
+                new_vars = _get_global_vars(var, outer_vars)
+            except (OSError, TypeError):
+                for name, value in var.__globals__.items():
+                    global_vars.setdefault(name, value)
+                continue
+        for chain in get_referenced_names(var):
+            callee = _resolve_chain(chain, new_vars)
+            if isinstance(callee, PyFunctionType) and callee not in visited:
+                visited.add(callee)
+                worklist.append(callee)
+        for name, value in new_vars.items():
+            global_vars.setdefault(name, value)
     return global_vars
 
 
-def get_global_vars(func):
-    global_vars = _get_global_vars(func)
-    new_global_vars = global_vars.copy()
-    for var in global_vars.values():
-        # import functions from other files
-        if isinstance(var, PyFunctionType):
-            new_global_vars.update(_get_global_vars(var))
-    return new_global_vars
-
-
 def get_extra_type_hints(dtype: AlloType):
     assert isinstance(dtype, AlloType), f"Expect AlloType, got {dtype}"
     if isinstance(dtype, (Int, Fixed)):
@@ -38,6 +38,22 @@ from .nn import (
     schedule_avgpool2d,
     batchnorm2d,
     schedule_batchnorm2d,
+    cast1d,
+    schedule_cast1d,
+    cast2d,
+    schedule_cast2d,
+    quantize2d,
+    schedule_quantize2d,
+    qlinear2d,
+    schedule_qlinear2d,
+    linear2d_relu,
+    schedule_linear2d_relu,
+    linear2d_gelu,
+    schedule_linear2d_gelu,
+    add_layer_norm,
+    schedule_add_layer_norm,
+    matmul_scale_softmax,
+    schedule_matmul_scale_softmax,
 )
 
 KERNEL2SCHEDULE = {}
@@ -65,5 +81,13 @@ KERNEL2SCHEDULE.update(
         maxpool2d: schedule_maxpool2d,
         avgpool2d: schedule_avgpool2d,
         batchnorm2d: schedule_batchnorm2d,
+        cast1d: schedule_cast1d,
+        cast2d: schedule_cast2d,
+        quantize2d: schedule_quantize2d,
+        qlinear2d: schedule_qlinear2d,
+        linear2d_relu: schedule_linear2d_relu,
+        linear2d_gelu: schedule_linear2d_gelu,
+        add_layer_norm: schedule_add_layer_norm,
+        matmul_scale_softmax: schedule_matmul_scale_softmax,
     }
 )
@@ -297,3 +297,192 @@ def batchnorm2d[
 def schedule_batchnorm2d(s):
     s.pipeline("batchnorm2d:w")
     return s
+
+
+def cast1d[TyIn, TyOut, N](X: "TyIn[N]") -> "TyOut[N]":
+    Z: TyOut[N]
+    for i in range(N):
+        Z[i] = X[i]
+    return Z
+
+
+def schedule_cast1d(s):
+    s.pipeline("cast1d:i")
+    return s
+
+
+def cast2d[TyIn, TyOut, M, N](X: "TyIn[M, N]") -> "TyOut[M, N]":
+    Z: TyOut[M, N]
+    for i, j in dsl.grid(M, N, name="cast"):
+        Z[i, j] = X[i, j]
+    return Z
+
+
+def schedule_cast2d(s):
+    lj = s.get_loops(s.top_func_name)["cast"]["j"]
+    s.pipeline(lj)
+    return s
+
+
+def quantize2d[
+    Ty, TyQ, M, N, QMax
+](X: "Ty[M, N]", scale: "Ty", zp: "Ty") -> "TyQ[M, N]":
+    # Affine quantization: q = clamp(round(x / scale + zp), -QMax - 1, QMax)
+    Z: TyQ[M, N]
+    for i, j in dsl.grid(M, N, name="quant"):
+        v: Ty = X[i, j] / scale + zp
+        # round half away from zero before the truncating cast
+        r: Ty = v + 0.5
+        if v < 0.0:
+            r = v - 0.5
+        lo: Ty = max(r, 0.0 - float(QMax) - 1.0)
+        c: Ty = min(lo, float(QMax))
+        Z[i, j] = c
+    return Z
+
+
+def schedule_quantize2d(s):
+    lj = s.get_loops(s.top_func_name)["quant"]["j"]
+    s.pipeline(lj)
+    return s
+
+
+def qlinear2d[
+    TyQ, TyA, Ty, M, N, K
+](X: "TyQ[M, K]", W: "TyQ[N, K]", b: "Ty[N]", zp: "TyA", scale: "Ty") -> "Ty[M, N]":
+    # Quantized linear layer with integer accumulation and a fused dequantization,
+    # i.e., Z = ((X - zp) @ W^T) * (x_scale * w_scale) + b
+    Z: Ty[M, N]
+    buf: TyA[N]
+    for i in range(M):
+        for j_init in range(N):
+            buf[j_init] = 0
+        for k in range(K):
+            x: TyA = X[i, k]
+            x_c: TyA = x - zp
+            for j in range(N):
+                w: TyA = W[j, k]
+                buf[j] += x_c * w
+        for j_back in range(N):
+            Z[i, j_back] = buf[j_back] * scale + b[j_back]
+    return Z
+
+
+def schedule_qlinear2d(s):
+    s.pipeline("qlinear2d:j")
+    s.pipeline("qlinear2d:j_init")
+    s.pipeline("qlinear2d:j_back")
+    return s
+
+
+def linear2d_relu[Ty, M, N, K](X: "Ty[M, K]", W: "Ty[N, K]", b: "Ty[N]") -> "Ty[M, N]":
+    # relu(linear(X)) without materializing the linear output
+    Z: Ty[M, N]
+    buf: Ty[N]
+    for i in range(M):
+        for j_init in range(N):
+            buf[j_init] = 0
+        for k in range(K):
+            x: Ty = X[i, k]
+            for j in range(N):
+                buf[j] += x * W[j, k]
+        for j_back in range(N):
+            Z[i, j_back] = max(0.0, buf[j_back] + b[j_back])
+    return Z
+
+
+def schedule_linear2d_relu(s):
+    s.pipeline("linear2d_relu:j")
+    s.pipeline("linear2d_relu:j_init")
+    s.pipeline("linear2d_relu:j_back")
+    return s
+
+
+def linear2d_gelu[Ty, M, N, K](X: "Ty[M, K]", W: "Ty[N, K]", b: "Ty[N]") -> "Ty[M, N]":
+    # gelu(linear(X)) without materializing the linear output
+    Z: Ty[M, N]
+    buf: Ty[N]
+    for i in range(M):
+        for j_init in range(N):
+            buf[j_init] = 0
+        for k in range(K):
+            x: Ty = X[i, k]
+            for j in range(N):
+                buf[j] += x * W[j, k]
+        for j_back in range(N):
+            y: Ty = buf[j_back] + b[j_back]
+            Z[i, j_back] = (
+                0.5
+                * y
+                * (1.0 + dsl.tanh(0.797885 * (y + 0.044715 * dsl.power(y, 3.0))))
+            )
+    return Z
+
+
+def schedule_linear2d_gelu(s):
+    s.pipeline("linear2d_gelu:j")
+    s.pipeline("linear2d_gelu:j_init")
+    s.pipeline("linear2d_gelu:j_back")
+    return s
+
+
+def add_layer_norm[
+    Ty, L, D
+](
+    X1: "Ty[L, D]", X2: "Ty[L, D]", gamma: "Ty[D]", beta: "Ty[D]", eps: "Ty"
+) -> "Ty[L, D]":
+    # layer_norm(X1 + X2), the sum is only kept for one row at a time
+    Z: Ty[L, D]
+    X: Ty[D]
+    for i in range(L):
+        mean: Ty = 0.0
+        mean2: Ty = 0.0
+        for j_sum in range(D):
+            X[j_sum] = X1[i, j_sum] + X2[i, j_sum]
+            mean += X[j_sum]
+            mean2 += X[j_sum] * X[j_sum]
+        mu: Ty = mean / float(D)
+        var: Ty = mean2 / float(D) - mu * mu
+        for j in range(D):
+            Z[i, j] = gamma[j] * (X[j] - mu) / dsl.sqrt(var + eps) + beta[j]
+    return Z
+
+
+def schedule_add_layer_norm(s):
+    s.pipeline("add_layer_norm:j_sum")
+    s.pipeline("add_layer_norm:j")
+    return s
+
+
+def matmul_scale_softmax[
+    Ty, B, L, D, M
+](X: "Ty[B, L, D]", Y: "Ty[B, D, M]", scale: "Ty") -> "Ty[B, L, M]":
+    # softmax(X @ Y * scale) along the last dimension, one row at a time
+    Z: Ty[B, L, M]
+    row: Ty[M]
+    for b, i in dsl.grid(B, L, name="row"):
+        for j_init in range(M):
+            row[j_init] = 0.0
+        for k in range(D):
+            x: Ty = X[b, i, k]
+            for j in range(M):
+                row[j] += x * Y[b, k, j]
+        row_max: Ty = -1000000000000.0
+        for j_max in range(M):
+            row[j_max] = row[j_max] * scale
+            new_max: Ty = max(row_max, row[j_max])
+            row_max = new_max
+        row_sum: Ty = 0.0
+        for j_exp in range(M):
+            row[j_exp] = dsl.exp(row[j_exp] - row_max)
+            row_sum += row[j_exp]
+        for j_back in range(M):
+            Z[b, i, j_back] = row[j_back] / row_sum
+    return Z
+
+
+def schedule_matmul_scale_softmax(s):
+    s.pipeline("matmul_scale_softmax:j")
+    s.pipeline("matmul_scale_softmax:j_exp")
+    s.pipeline("matmul_scale_softmax:j_back")
+    return s
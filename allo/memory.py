@@ -2,7 +2,88 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import re
+from collections.abc import Mapping
+from functools import lru_cache
 from itertools import product
+import numpy as np
+
+
+class Placement(Mapping):
+    """
+    Mapping from tensor tile IDs to the coordinates of the PE tiles holding them.
+
+    The placement is stored as index arrays: `tile_ids` holds the tensor tile index of
+    each PE tile (in the shape of the mesh), and the PE tiles of tensor tile `i` are
+    `pe_order[offsets[i]:offsets[i + 1]]` (flattened indices in row-major order), so
+    lookups in both directions take O(1). Tensor tile IDs are ordered by their first
+    PE tile, e.g., "00", "01", "10", "11" for S0S1 on a [2, 2] mesh.
+    """
+
+    def __init__(self, placement, mesh_dims):
+        self.mesh_dims = tuple(mesh_dims)
+        coords = np.indices(self.mesh_dims).reshape(len(self.mesh_dims), -1)
+        num_pes = coords.shape[1]
+        # tensor tile coordinates of each PE tile, in a mixed radix
+        flat_ids = np.zeros(num_pes, dtype=np.int64)
+        for op, dim in placement:
+            if op == "S":
+                # count the mesh dimensions from right to left
+                flat_ids = flat_ids * self.mesh_dims[-dim - 1] + coords[-dim - 1]
+        _, first, inverse = np.unique(flat_ids, return_index=True, return_inverse=True)
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        self.tile_ids = rank[inverse.reshape(-1)].reshape(self.mesh_dims)
+        self.labels = []
+        for pe in first[order]:
+            self.labels.append(
+                "".join(
+                    str(coords[-dim - 1][pe]) if op == "S" else "R" if op == "R" else ""
+                    for op, dim in placement
+                )
+            )
+        self.label_ids = {label: i for i, label in enumerate(self.labels)}
+        self.pe_order = np.argsort(self.tile_ids.reshape(-1), kind="stable")
+        self.offsets = np.searchsorted(
+            self.tile_ids.reshape(-1)[self.pe_order], np.arange(len(self.labels) + 1)
+        )
+        self._pes = {}
+
+    def get_pes(self, label):
+        """Returns the coordinates of the PE tiles holding a tensor tile."""
+        tile_id = self.label_ids[label]
+        if tile_id not in self._pes:
+            pes = self.pe_order[self.offsets[tile_id] : self.offsets[tile_id + 1]]
+            # tuples, as the placement is shared through the cache
+            self._pes[tile_id] = tuple(
+                tuple(coord)
+                for coord in np.stack(
+                    np.unravel_index(pes, self.mesh_dims), axis=-1
+                ).tolist()
+            )
+        return self._pes[tile_id]
+
+    def get_label(self, pe_coord):
+        """Returns the ID of the tensor tile held by a PE tile."""
+        return self.labels[self.tile_ids[tuple(pe_coord)]]
+
+    def __getitem__(self, label):
+        return self.get_pes(label)
+
+    def __iter__(self):
+        return iter(self.labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __contains__(self, label):
+        return label in self.label_ids
+
+
+@lru_cache(maxsize=None)
+def get_placement(placement, mesh_dims):
+    """Returns the cached `Placement` of a placement scheme on a mesh."""
+    return Placement(placement, mesh_dims)
 
 
 class Layout:
@@ -50,42 +131,10 @@ class Layout:
             mesh_dims (list): Dimensions of the device mesh (e.g., [4] for 1D, [2,2] for 2D)
 
         Returns:
-            dict: A mapping from tensor tile IDs to corresponding PE tile coordinates
+            Placement: A mapping from tensor tile IDs to corresponding PE tile coordinates,
+                shared by all the layouts with the same placement scheme and mesh.
         """
-        # Generate all possible PE coordinates
-        pe_coords = list(product(*[range(dim) for dim in mesh_dims]))
-
-        # Initialize mapping
-        mapping = {}
-
-        # For each PE coordinate, determine its tensor tile ID
-        for pe_coord in pe_coords:
-            tensor_id_parts = []
-
-            for _, (op, dim) in enumerate(self.placement):
-                if op == "S":
-                    # For sharding, use the coordinate at the specified dimension
-                    # start from right to left
-                    mesh_dim = int(dim)
-                    tensor_id_parts.append(str(pe_coord[-mesh_dim - 1]))
-                elif op == "R":
-                    # For replication, use 'R'
-                    tensor_id_parts.append("R")
-
-            tensor_id = "".join(tensor_id_parts)
-
-            # Add this PE coordinate to the mapping for this tensor ID
-            if tensor_id not in mapping:
-                mapping[tensor_id] = []
-            mapping[tensor_id].append(pe_coord)
-
-        # Post-process the mapping to combine PE coordinates for replicated dimensions
-        result = {}
-        for tensor_id, coords in mapping.items():
-            # Convert to tuples for final output
-            result[tensor_id] = [tuple(coord) for coord in coords]
-
-        return result
+        return get_placement(tuple(self.placement), tuple(mesh_dims))
 
     def __repr__(self):
         result = ""
@@ -109,7 +158,7 @@ class DTensor:
         self.layout = layout
         self.name = name
         if layout is not None and mapping is not None:
-            self.global_placement: dict[str, tuple] = layout.get_placement(mapping)
+            self.global_placement: Placement = layout.get_placement(mapping)
         self.type_as_param: list = None
 
     def get_local_shape(self):
@@ -130,66 +179,95 @@ class DTensor:
 
     def get_access_pattern(self) -> tuple[list, list, list]:
         """
-        Specify how to access the dtensor (local tensor) from the global tensor
-            (tensor has at most 4 dimensions: DMA support 4-dimension address generation)
+        Specify how to access the dtensor (local tensor) from the global tensor.
+            The tensor tiles are visited in the order of their labels, and each tensor
+            tile is visited in row-major order, i.e., the loop nest has one dimension
+            for each sharded tensor dimension followed by the local tensor dimensions.
+            The loop nest is padded to 4 dimensions (the DMA supports 4-dimension address
+            generation) and may have more dimensions for higher-rank tensors, which are
+            folded into DMA buffer descriptors by `get_dma_bds`.
 
         Returns:
             - device_dims (list): Indexes of tensor dimensions sharded across devices.
-            - size (list): 4D tensor dimensions used for access.
+            - size (list): Tensor dimensions used for access.
             - stride (list): Stride along each dimension in the global tensor.
         """
-        partition_str = "".join([p[0] for p in self.layout.placement])
-        partition_dim = [p[1] for p in self.layout.placement]
-        if len(self.shape) == 1:
-            if partition_str == "S":
-                shard_size = self.shape[0] // self.mapping[-partition_dim[0] - 1]
-                device_dims = [2]  # partition idx = 2
-                size = [1, 1, self.mapping[-partition_dim[0] - 1], shard_size]
-                stride = [0, 0, shard_size, 1]
-            elif partition_str == "R":
-                device_dims = []  # no partition
-                size = [1, 1, 1, self.shape[0]]
-                stride = [0, 0, 0, 1]
-            else:
-                raise ValueError("Unsupported access pattern for 1D tensor.")
-        elif len(self.shape) == 2:
-            tensor_m, tensor_n = self.shape  # [tensor_m x tensor_n]
-            if partition_str == "SS":
-                device_a, device_b = (
-                    self.mapping[-partition_dim[0] - 1],
-                    self.mapping[-partition_dim[1] - 1],
+        device_size, device_stride = [], []
+        local_size, local_stride = [], []
+        for i, dim_size in enumerate(self.shape):
+            shard, dim = self.layout.placement[i]
+            if shard not in {"S", "R"}:
+                raise ValueError(f"Unsupported access pattern {self.layout}.")
+            num_shards = self.mapping[-dim - 1] if shard == "S" else 1
+            if dim_size % num_shards != 0:
+                raise ValueError(
+                    f"Tensor dimension {dim_size} cannot be evenly sharded into {num_shards} parts."
                 )
-                device_dims = [0, 1]
-                size = [device_a, device_b, tensor_m // device_a, tensor_n // device_b]
-                stride = [
-                    (tensor_m // device_a) * tensor_n,
-                    tensor_n // device_b,
-                    tensor_n,
-                    1,
-                ]
-            elif partition_str == "SR":
-                device_a = self.mapping[-partition_dim[0] - 1]
-                # First dim sharded across all devices, second replicated
-                device_dims = [1]
-                size = [1, device_a, tensor_m // device_a, tensor_n]
-                stride = [0, (tensor_m // device_a) * tensor_n, tensor_n, 1]
-            elif partition_str == "RS":
-                device_b = self.mapping[-partition_dim[1] - 1]
-                # First dim replicated, second sharded across second dim of mesh
-                device_dims = [1]
-                size = [1, device_b, tensor_m, tensor_n // device_b]
-                stride = [0, tensor_n // device_b, tensor_n, 1]
-            elif partition_str == "RR":
-                # Both dimensions replicated
-                device_dims = []
-                size = [1, 1, tensor_m, tensor_n]
-                stride = [0, 0, tensor_n, 1]
-            else:
-                raise ValueError("Unsupported access pattern for 2D tensor.")
-        else:
-            raise ValueError("Unsupported access pattern.")
-
+            tensor_stride = int(np.prod(self.shape[i + 1 :]))
+            if shard == "S":
+                device_size.append(num_shards)
+                device_stride.append(dim_size // num_shards * tensor_stride)
+            local_size.append(dim_size // num_shards)
+            local_stride.append(tensor_stride)
+        num_pads = max(4 - len(device_size) - len(local_size), 0)
+        device_dims = list(range(num_pads, num_pads + len(device_size)))
+        size = [1] * num_pads + device_size + local_size
+        stride = [0] * num_pads + device_stride + local_stride
         return device_dims, size, stride
 
     def __str__(self):
         return f"DTensor(name={self.name}, shape={self.shape}, dtype={self.dtype}, layout={self.layout}, mapping={self.mapping}, rank={self.rank}, local_shape={self.get_local_shape()})"
+
+
+def get_dma_bds(offset, size, stride, max_dims=4):
+    """
+    Fold an N-D access pattern into DMA buffer descriptors (BDs) with at most
+        `max_dims` dimensions. Contiguous dimensions are merged, and the outer
+        dimensions that still do not fit are unrolled into multiple BDs, which
+        access the data in the same order as the original pattern.
+
+    Args:
+        - offset (list): Offset along each dimension.
+        - size (list): Size of each dimension (outermost first).
+        - stride (list): Stride of each dimension.
+        - max_dims (int): Number of dimensions supported by a BD.
+
+    Returns:
+        - bds (list): (offset, size, stride) of each BD, padded to `max_dims` dimensions.
+    """
+    if len(size) <= max_dims:
+        num_pads = max_dims - len(size)
+        return [
+            (
+                [0] * num_pads + list(offset),
+                [1] * num_pads + list(size),
+                [0] * num_pads + list(stride),
+            )
+        ]
+    base = sum(o * s for o, s in zip(offset, stride))
+    dims = [[sz, st] for sz, st in zip(size, stride) if sz != 1]
+    # merge a dimension into its inner neighbor if they are contiguous
+    folded = []
+    for dim in reversed(dims):
+        if len(folded) > 0 and dim[1] == folded[-1][0] * folded[-1][1]:
+            folded[-1][0] *= dim[0]
+        else:
+            folded.append(dim)
+    folded.reverse()
+    num_outer = max(len(folded) - max_dims, 0)
+    outer, inner = folded[:num_outer], folded[num_outer:]
+    num_pads = max_dims - len(inner)
+    inner_size = [1] * num_pads + [sz for sz, _ in inner]
+    inner_stride = [0] * num_pads + [st for _, st in inner]
+    bds = []
+    for idx in product(*[range(sz) for sz, _ in outer]):
+        start = base + sum(i * st for i, (_, st) in zip(idx, outer))
+        # express the start address with the per-dimension offsets
+        bd_offset = [0] * max_dims
+        for dim in sorted(range(max_dims), key=lambda d: -inner_stride[d]):
+            if inner_stride[dim] > 0:
+                bd_offset[dim], start = divmod(start, inner_stride[dim])
+        if start != 0:
+            raise ValueError("Failed to express the offset of a DMA buffer descriptor.")
+        bds.append((bd_offset, list(inner_size), list(inner_stride)))
+    return bds
@@ -23,6 +23,10 @@ from ._mlir.ir import (
     IntegerType,
     Operation,
     BlockArgument,
+    DenseIntElementsAttr,
+    IndexType,
+    BoolAttr,
+    AffineConstantExpr,
 )
 from ._mlir.dialects import (
     allo as allo_d,
@@ -32,12 +36,20 @@ from ._mlir.dialects import (
     scf as scf_d,
     linalg as linalg_d,
     arith as arith_d,
+    vector as vector_d,
 )
 from ._mlir.ir import StringAttr
+from ._mlir.dialects.affine import AffineDimExpr
 from ._mlir.passmanager import PassManager as mlir_pass_manager
 from .ir.transform import find_func_in_module
-from .ir.transform import wrap_data_movement
-from .ir.utils import MockBuffer
+from .ir.transform import (
+    wrap_data_movement,
+    wrap_tile_movement,
+    get_packed_lanes,
+    get_packed_type,
+    build_for_loops,
+)
+from .ir.utils import MockArg, MockBuffer
 from .utils import get_mlir_dtype_from_str
 from .backend.ip import c2allo_type
 
@@ -60,6 +72,130 @@ def _mlir_lower_pipeline(module, **kwargs):
         raise e
 
 
+def convert_parallel_loops(module):
+    """Converts the affine.for loops marked by `.parallel()` into affine.parallel,
+    which are then lowered to OpenMP on CPUs.
+
+    Only the outermost marked loop of a nest is converted, and loops that carry
+    values (iter_args) are kept sequential. The marked loops are trusted to be
+    free of loop-carried dependences. Returns the number of converted loops.
+    """
+    loops = []
+
+    def collect(op):
+        for region in op.regions:
+            for block in region.blocks:
+                for inner_op in block.operations:
+                    if (
+                        isinstance(inner_op, affine_d.AffineForOp)
+                        and "parallel" in inner_op.attributes
+                        and len(inner_op.results) == 0
+                    ):
+                        loops.append(inner_op)
+                    else:
+                        collect(inner_op.operation)
+
+    with module.context, Location.unknown():
+        for op in module.body.operations:
+            if isinstance(op, func_d.FuncOp) and not op.is_external:
+                collect(op.operation)
+        i64 = IntegerType.get_signless(64)
+        for loop in loops:
+            lb_map = loop.attributes["lowerBoundMap"]
+            ub_map = loop.attributes["upperBoundMap"]
+            attributes = {
+                "lowerBoundsMap": lb_map,
+                "lowerBoundsGroups": DenseIntElementsAttr.get(
+                    np.array([AffineMapAttr(lb_map).value.n_results], dtype=np.int32)
+                ),
+                "upperBoundsMap": ub_map,
+                "upperBoundsGroups": DenseIntElementsAttr.get(
+                    np.array([AffineMapAttr(ub_map).value.n_results], dtype=np.int32)
+                ),
+                "steps": ArrayAttr.get(
+                    [IntegerAttr.get(i64, IntegerAttr(loop.attributes["step"]).value)]
+                ),
+                "reductions": ArrayAttr.get([]),
+            }
+            par_op = Operation.create(
+                "affine.parallel",
+                operands=list(loop.operands),
+                attributes=attributes,
+                regions=1,
+                ip=InsertionPoint(loop),
+            )
+            block = par_op.regions[0].blocks.append(IndexType.get())
+            yield_op = Operation.create("affine.yield", ip=InsertionPoint(block))
+            for inner_op in list(loop.body.operations)[:-1]:
+                inner_op.operation.move_before(yield_op)
+            loop.induction_variable.replace_all_uses_with(block.arguments[0])
+            loop.operation.erase()
+    return len(loops)
+
+
+def convert_returns_to_out_params(module, top_func_name):
+    """Turns the buffers returned by the top function into trailing arguments,
+    so the caller owns the memory of the results instead of the kernel.
+
+    The conversion only applies when every returned value is a distinct
+    statically shaped ``memref.alloc`` in the entry block of the function, and
+    the function is not called by others. Returns whether it is applied.
+    """
+    func = find_func_in_module(module, top_func_name)
+    if func is None:
+        return False
+    ret_op = func.entry_block.operations[len(func.entry_block.operations) - 1]
+    if not isinstance(ret_op, func_d.ReturnOp) or len(ret_op.operands) == 0:
+        return False
+    entry_ops = list(func.entry_block.operations)
+    allocs = []
+    for value in ret_op.operands:
+        if BlockArgument.isinstance(value):
+            return False
+        owner = value.owner
+        if (
+            owner.name != "memref.alloc"
+            or len(owner.operands) > 0
+            or not any(owner == op.operation for op in entry_ops)
+            or any(owner == alloc for alloc in allocs)
+        ):
+            return False
+        allocs.append(owner)
+    for op in module.body.operations:
+        for inner_op in _walk_ops(op.operation):
+            if (
+                isinstance(inner_op, func_d.CallOp)
+                and FlatSymbolRefAttr(inner_op.attributes["callee"]).value
+                == top_func_name
+            ):
+                return False
+
+    with module.context, Location.unknown():
+        out_types = []
+        for alloc in allocs:
+            arg = func.entry_block.add_argument(
+                alloc.results[0].type, Location.unknown()
+            )
+            alloc.results[0].replace_all_uses_with(arg)
+            alloc.erase()
+            out_types.append(arg.type)
+        func_d.ReturnOp([], ip=InsertionPoint(ret_op))
+        ret_op.operation.erase()
+        in_types = func.attributes["function_type"].value.inputs
+        func.attributes["function_type"] = TypeAttr.get(
+            FunctionType.get(list(in_types) + out_types, [])
+        )
+        if "otypes" in func.attributes:
+            itypes = (
+                func.attributes["itypes"].value if "itypes" in func.attributes else ""
+            ).ljust(len(in_types), "_")
+            func.attributes["itypes"] = StringAttr.get(
+                itypes + func.attributes["otypes"].value.ljust(len(out_types), "_")
+            )
+            func.attributes["otypes"] = StringAttr.get("")
+    return True
+
+
 def lower_linalg_and_attach_names(module):
     op_names = []
     cnt_loop_nests = 0
@@ -114,14 +250,63 @@ def lower_linalg_and_attach_names(module):
                         cnt_loop_nests += 1
 
 
+def _get_bus_lanes(values, flatten, mappings, bus_width):
+    # Returns the number of elements of each value packed into a `bus_width`-bit
+    # word, or None for the values moved element-wise (unflattened, remapped,
+    # scalar, or not packable tensors).
+    if bus_width is None or not flatten or any(m is not None for m in mappings):
+        return [None] * len(values)
+    return [
+        (
+            get_packed_lanes(MemRefType(val.type), bus_width)
+            if isinstance(val.type, MemRefType)
+            else None
+        )
+        for val in values
+    ]
+
+
+def _get_io_type(memref_type, flatten, bus_width, lanes):
+    # Returns the type of a tensor at the interface of the top function
+    if lanes is not None:
+        return get_packed_type(memref_type, bus_width, lanes)
+    if flatten:
+        return MemRefType.get(
+            (np.prod(memref_type.shape),),
+            memref_type.element_type,
+        )
+    return memref_type
+
+
+def _mark_packed_types(func, arg_lanes, res_lanes):
+    # packed words are emitted as ap_uint<bus_width>
+    for attr, lanes in (("itypes", arg_lanes), ("otypes", res_lanes)):
+        if all(lane is None for lane in lanes):
+            continue
+        hints = (func.attributes[attr].value if attr in func.attributes else "").ljust(
+            len(lanes), "_"
+        )
+        func.attributes[attr] = StringAttr.get(
+            "".join(
+                "u" if lane is not None else hint for hint, lane in zip(hints, lanes)
+            )
+        )
+
+
 # pylint: disable=too-many-branches
-def generate_input_output_buffers(module, top_func_name, flatten=False, mappings=None):
+def generate_input_output_buffers(
+    module, top_func_name, flatten=False, mappings=None, bus_width=None
+):
     results = {"inputs": [], "outputs": []}
     top_func = find_func_in_module(module, top_func_name)
 
     if mappings is None:
         mappings = [None] * len(top_func.arguments)
 
+    # Pack the flattened arguments into `bus_width`-bit words.
+    # Tensors that cannot be packed fall back to element-wise movement.
+    arg_lanes = _get_bus_lanes(top_func.arguments, flatten, mappings, bus_width)
+
     load_store_mapping = analyze_arg_load_store(module)
     # Build Buffer-Load functions
     load_func_names = []
@@ -143,6 +328,8 @@ def generate_input_output_buffers(module, top_func_name, flatten=False, mappings
                     from_memory=True,
                     flatten=flatten,
                     mapping=mappings[idx],
+                    bus_width=bus_width,
+                    lanes=arg_lanes[idx],
                 )
 
     # Find ReturnOp
@@ -153,6 +340,7 @@ def generate_input_output_buffers(module, top_func_name, flatten=False, mappings
 
     # Build Buffering functions
     store_func_names = []
+    res_lanes = _get_bus_lanes(op_return.operands, flatten, mappings, bus_width)
     with module.context, Location.unknown():
         if len(mappings) < len(op_return.operands) + len(top_func.arguments):
             mappings += [None] * len(op_return.operands)
@@ -173,6 +361,8 @@ def generate_input_output_buffers(module, top_func_name, flatten=False, mappings
                     from_memory=False,
                     flatten=flatten,
                     mapping=mappings[idx],
+                    bus_width=bus_width,
+                    lanes=res_lanes[idx],
                 )
 
         else:
@@ -192,6 +382,8 @@ def generate_input_output_buffers(module, top_func_name, flatten=False, mappings
                         from_memory=False,
                         flatten=flatten,
                         mapping=mappings[-1],
+                        bus_width=bus_width,
+                        lanes=arg_lanes[idx],
                     )
 
     # Modify Top function
@@ -220,16 +412,11 @@ def generate_input_output_buffers(module, top_func_name, flatten=False, mappings
                 arg.replace_all_uses_with(alloc_op.result)
 
                 # Update shape of arguments in top function
-                if flatten:
-                    old_memref = MemRefType(arg.type)
-                    new_memref = MemRefType.get(
-                        (np.prod(old_memref.shape),),
-                        old_memref.element_type,
-                    )
-                    arg.set_type(new_memref)
-                    new_in_types.append(new_memref)
-                else:
-                    new_in_types.append(arg.type)
+                new_memref = _get_io_type(
+                    MemRefType(arg.type), flatten, bus_width, arg_lanes[idx]
+                )
+                arg.set_type(new_memref)
+                new_in_types.append(new_memref)
 
                 # Build CallOp for buffer loading
                 if load_store_mapping[top_func_name][idx] in {
@@ -257,16 +444,10 @@ def generate_input_output_buffers(module, top_func_name, flatten=False, mappings
                     continue
 
                 # Build AllocOP for buffer
-                if not flatten:
-                    store_memref = MemRefType(arg.type)
-                else:
-                    store_memref = MemRefType.get(
-                        (np.prod(MemRefType(arg.type).shape),),
-                        MemRefType(arg.type).element_type,
-                    )
-
                 alloc_op = memref_d.AllocOp(
-                    store_memref,
+                    _get_io_type(
+                        MemRefType(arg.type), flatten, bus_width, res_lanes[idx]
+                    ),
                     [],
                     [],
                     ip=ip_first,
@@ -310,10 +491,395 @@ def generate_input_output_buffers(module, top_func_name, flatten=False, mappings
 
         func_type = FunctionType.get(new_in_types, new_out_types)
         top_func.attributes["function_type"] = TypeAttr.get(func_type)
+        _mark_packed_types(top_func, arg_lanes, res_lanes)
 
     return results
 
 
+def _get_constant_bounds(loop):
+    # Returns the (lower, upper) bounds of an affine.for, or None if not constant
+    bounds = [
+        AffineMapAttr(loop.attributes[name]).value.results
+        for name in ("lowerBoundMap", "upperBoundMap")
+    ]
+    if not all(
+        len(results) == 1 and AffineConstantExpr.isinstance(results[0])
+        for results in bounds
+    ):
+        return None
+    return tuple(AffineConstantExpr(results[0]).value for results in bounds)
+
+
+def vectorize_loops(func, lanes):
+    """Vectorizes the parallel loops of `func` with `affine-super-vectorize`,
+    using vectors of `lanes` elements along the contiguous memref dimension.
+
+    The vectorized loops are told apart from the scalar ones, including the
+    user loops that step by `lanes`, by a tag that only the scalar loops keep.
+    A load or store vectorized along the induction variable of its innermost
+    loop, whose trip count (in scalar iterations) is a multiple of `lanes`,
+    covers exactly the elements of the scalar iterations, so it is marked in
+    bounds and lowered to a plain vector load or store instead of a masked one.
+    Returns the number of loops whose loads and stores are vectorized.
+    """
+    tag = "allo.scalar_loop"
+    with func.context, Location.unknown():
+        # the vectorizer rebuilds the loops that it vectorizes, which drops the tag
+        for op in _walk_ops(func.operation):
+            if isinstance(op, affine_d.AffineForOp):
+                op.attributes[tag] = UnitAttr.get()
+        mlir_pass_manager.parse(
+            f"func.func(affine-super-vectorize{{virtual-vector-size={lanes}}})"
+        ).run(func.operation)
+        vectorized = []
+        for op in _walk_ops(func.operation):
+            if not isinstance(op, (vector_d.TransferReadOp, vector_d.TransferWriteOp)):
+                continue
+            perm_map = AffineMapAttr(op.attributes["permutation_map"]).value
+            # broadcasts of loop-invariant elements are always in bounds
+            if not AffineDimExpr.isinstance(perm_map.results[0]):
+                continue
+            loop = op.operation.parent
+            while loop.name not in {"affine.for", "func.func"}:
+                loop = loop.parent
+            if loop.name != "affine.for" or tag in loop.attributes:
+                continue
+            loop = loop.opview
+            index = op.indices[AffineDimExpr(perm_map.results[0]).position]
+            iv = loop.induction_variable
+            if not (
+                index == iv
+                or (
+                    not BlockArgument.isinstance(index)
+                    and index.owner.name == "affine.apply"
+                    and any(operand == iv for operand in index.owner.operands)
+                )
+            ):
+                continue
+            if all(loop.operation != other.operation for other in vectorized):
+                vectorized.append(loop)
+            bounds = _get_constant_bounds(loop)
+            if (
+                bounds is not None
+                and IntegerAttr(loop.attributes["step"]).value == lanes
+                and (bounds[1] - bounds[0]) % lanes == 0
+            ):
+                op.attributes["in_bounds"] = ArrayAttr.get([BoolAttr.get(True)])
+        for op in _walk_ops(func.operation):
+            if isinstance(op, affine_d.AffineForOp) and tag in op.attributes:
+                del op.attributes[tag]
+    return len(vectorized)
+
+
+def _walk_ops(op):
+    for region in op.regions:
+        for block in region.blocks:
+            for inner_op in block.operations:
+                yield inner_op
+                yield from _walk_ops(inner_op.operation)
+
+
+def _get_row_operand(op, memref):
+    # Returns the operand number of the value that indexes the first dimension
+    # of `memref` in a load/store `op`, or None if it is not a plain loop index.
+    if isinstance(op, (affine_d.AffineLoadOp, memref_d.LoadOp)):
+        offset = 1
+    elif isinstance(op, (affine_d.AffineStoreOp, memref_d.StoreOp)):
+        offset = 2
+    else:
+        return None
+    if op.operands[offset - 1] != memref:
+        return None
+    if isinstance(op, (memref_d.LoadOp, memref_d.StoreOp)):
+        return offset
+    affine_map = AffineMapAttr(op.attributes["map"]).value
+    first = affine_map.results[0]
+    if not AffineDimExpr.isinstance(first):
+        return None
+    pos = AffineDimExpr(first).position
+    # the row index cannot be used by the other dimensions
+    if any(re.search(rf"\bd{pos}\b", str(expr)) for expr in affine_map.results[1:]):
+        return None
+    return offset + pos
+
+
+def _is_nested_in(op, loops):
+    parent = op.operation.parent
+    while parent is not None and parent.operation.name != "func.func":
+        if any(parent.operation == loop.operation for loop in loops):
+            return True
+        parent = parent.operation.parent
+    return False
+
+
+def generate_tiled_io_buffers(module, top_func_name, tile_size=None):
+    """Wraps the top function with tiled, double-buffered I/O movement.
+
+    The tensors whose first dimension is only indexed by the induction variable
+    of a top-level loop are split into tiles of `tile_size` rows. The body of
+    the top function is outlined into `{top_func_name}_tile`, which is called
+    once per tile between `load_tile{i}` and `store_tile{i}` in a dataflow loop,
+    so that the tile buffers become ping-pong buffers and the transfers overlap
+    with the computation. Other inputs are loaded once into full-size buffers.
+
+    Returns the tile size, or None if the top function cannot be tiled, in which
+    case the module is not modified.
+    """
+    top_func = find_func_in_module(module, top_func_name)
+    load_store_mapping = analyze_arg_load_store(module)[top_func_name]
+    ops = list(top_func.entry_block.operations)
+    op_return = ops[-1]
+    if any(isinstance(op, func_d.CallOp) for op in _walk_ops(top_func.operation)):
+        return None
+    # outputs decide the tiled dimension
+    ret_allocs = []
+    for res in op_return.operands:
+        if BlockArgument.isinstance(res) or not isinstance(res.type, MemRefType):
+            return None
+        owner = res.owner.operation.opview
+        if not isinstance(owner, memref_d.AllocOp):
+            return None
+        ret_allocs.append(owner)
+    out_args = [
+        arg
+        for idx, arg in enumerate(top_func.arguments)
+        if load_store_mapping[idx] in {"out", "both"}
+    ]
+    outputs = [op.result for op in ret_allocs] + out_args
+    if len(outputs) == 0 or MemRefType(outputs[0].type).rank == 0:
+        return None
+    rows = MemRefType(outputs[0].type).shape[0]
+    if tile_size is None:
+        # keep at least four tiles in flight
+        tile_size = max(d for d in range(1, max(rows // 4, 1) + 1) if rows % d == 0)
+    if rows % tile_size != 0:
+        raise ValueError(f"Tile size {tile_size} does not divide {rows} rows")
+    if tile_size == rows:
+        return None
+
+    # top-level loops that can iterate over the rows of a tile
+    row_loops = [
+        op
+        for op in ops
+        if isinstance(op, affine_d.AffineForOp)
+        and str(op.attributes["lowerBoundMap"]) == "affine_map<() -> (0)>"
+        and str(op.attributes["upperBoundMap"]) == f"affine_map<() -> ({rows})>"
+        and IntegerAttr(op.attributes["step"]).value == 1
+    ]
+
+    def get_row_loop(val):
+        # the loop whose induction variable indexes all the rows of `val`
+        loops = []
+        for use in val.uses:
+            owner = use.owner
+            if isinstance(owner, (linalg_d.FillOp, func_d.ReturnOp)):
+                continue
+            operand = _get_row_operand(owner, val)
+            if operand is None:
+                return None
+            idx = owner.operands[operand]
+            loop = next(
+                (loop for loop in row_loops if idx == loop.induction_variable), None
+            )
+            if loop is None:
+                return None
+            loops.append(loop)
+        return loops
+
+    tiled, tile_loops = [], []
+    candidates = list(top_func.arguments) + [
+        op.result for op in ops if isinstance(op, memref_d.AllocOp)
+    ]
+    for val in candidates:
+        if (
+            not isinstance(val.type, MemRefType)
+            or MemRefType(val.type).rank == 0
+            or MemRefType(val.type).shape[0] != rows
+        ):
+            continue
+        loops = get_row_loop(val)
+        if loops is None:
+            if any(val == out for out in outputs):
+                return None
+            # read-only inputs and scratch buffers stay resident
+            continue
+        tiled.append(val)
+        for loop in loops:
+            if all(loop != other for other in tile_loops):
+                tile_loops.append(loop)
+    if any(all(val != out for val in tiled) for out in outputs):
+        return None
+    # the induction variables of the tiled loops can only index the rows
+    for loop in tile_loops:
+        for use in loop.induction_variable.uses:
+            owner = use.owner
+            if not any(
+                _get_row_operand(owner, val) == use.operand_number for val in tiled
+            ):
+                return None
+    # resident buffers cannot carry values across the rows
+    for op in ops:
+        if isinstance(op, memref_d.AllocOp) and all(op.result != val for val in tiled):
+            for use in op.result.uses:
+                if not isinstance(
+                    use.owner, (affine_d.AffineLoadOp, memref_d.LoadOp)
+                ) and _is_nested_in(use.owner, tile_loops):
+                    return None
+
+    num_args = len(top_func.arguments)
+    in_hints = (
+        top_func.attributes["itypes"].value
+        if "itypes" in top_func.attributes
+        else "_" * num_args
+    )
+    out_hints = (
+        top_func.attributes["otypes"].value
+        if "otypes" in top_func.attributes
+        else "_" * len(ret_allocs)
+    )
+
+    tiled_args = [any(arg == val for val in tiled) for arg in top_func.arguments]
+    tiled_allocs = [
+        op.result
+        for op in ops
+        if isinstance(op, memref_d.AllocOp)
+        and any(op.result == val for val in tiled)
+        and all(op.operation != ret_op.operation for ret_op in ret_allocs)
+    ]
+
+    def get_tile_type(val):
+        memref = MemRefType(val.type)
+        if all(val != other for other in tiled):
+            return memref
+        return MemRefType.get((tile_size, *memref.shape[1:]), memref.element_type)
+
+    with module.context, Location.unknown():
+        alloc_types = [get_tile_type(val) for val in tiled_allocs]
+        # Outline the body of the top function
+        tile_func_name = f"{top_func_name}_tile"
+        tile_types = [
+            get_tile_type(arg) if isinstance(arg.type, MemRefType) else arg.type
+            for arg in top_func.arguments
+        ] + [get_tile_type(op.result) for op in ret_allocs]
+        tile_func = func_d.FuncOp(
+            name=tile_func_name,
+            type=FunctionType.get(tile_types, []),
+            ip=InsertionPoint(top_func),
+        )
+        tile_func.attributes["itypes"] = StringAttr.get(in_hints + out_hints)
+        tile_func.add_entry_block()
+        tile_return = func_d.ReturnOp([], ip=InsertionPoint(tile_func.entry_block))
+        op_return.operation.erase()
+        for op in ops[:-1]:
+            op.move_before(tile_return)
+        for arg, new_arg in zip(top_func.arguments, tile_func.arguments):
+            arg.replace_all_uses_with(new_arg)
+        for op, new_arg in zip(ret_allocs, tile_func.arguments[num_args:]):
+            op.result.replace_all_uses_with(new_arg)
+            op.operation.erase()
+        for val, tile_type in zip(tiled_allocs, alloc_types):
+            val.set_type(tile_type)
+        for loop in tile_loops:
+            loop.attributes["upperBoundMap"] = AffineMapAttr.parse(
+                f"affine_map<() -> ({tile_size})>"
+            )
+
+        # Rebuild the top function
+        ip_func = InsertionPoint(tile_func)
+        ip = InsertionPoint(top_func.entry_block)
+        call_operands = list(top_func.arguments)
+        for idx, arg in enumerate(top_func.arguments):
+            if not isinstance(arg.type, MemRefType) or tiled_args[idx]:
+                continue
+            # resident inputs are loaded once
+            wrap_data_movement(
+                arg, ip_func, f"load_buf{idx}", True, flatten=True, mapping=None
+            )
+            alloc_op = memref_d.AllocOp(MemRefType(arg.type), [], [], ip=ip)
+            alloc_op.attributes["name"] = StringAttr.get(f"buf{idx}")
+            func_d.CallOp(
+                [],
+                FlatSymbolRefAttr.get(f"load_buf{idx}"),
+                [arg, alloc_op.result],
+                ip=ip,
+            )
+            call_operands[idx] = alloc_op.result
+        res_allocs = []
+        for idx, ret_type in enumerate(tile_types[num_args:]):
+            memref = MemRefType(ret_type)
+            alloc_op = memref_d.AllocOp(
+                MemRefType.get(
+                    (rows * int(np.prod(memref.shape[1:])),), memref.element_type
+                ),
+                [],
+                [],
+                ip=ip,
+            )
+            alloc_op.attributes["name"] = StringAttr.get(f"res{num_args + idx}")
+            res_allocs.append(alloc_op.result)
+
+        tile_loop = build_for_loops([rows // tile_size], ip, "tile")[0]
+        tile_loop.attributes["dataflow"] = UnitAttr.get()
+        with InsertionPoint(tile_loop.body.operations[0]):
+            tile_idx = tile_loop.induction_variable
+            tile_bufs = []
+            stores = []
+            tensors = [
+                (idx, arg, load_store_mapping[idx])
+                for idx, arg in enumerate(top_func.arguments)
+                if tiled_args[idx]
+            ] + [(num_args + idx, res, "out") for idx, res in enumerate(res_allocs)]
+            for idx, tensor, io_type in tensors:
+                memref = MemRefType(tile_types[idx])
+                full_type = MemRefType.get(
+                    (rows, *memref.shape[1:]), memref.element_type
+                )
+                alloc_op = memref_d.AllocOp(memref, [], [])
+                alloc_op.attributes["name"] = StringAttr.get(f"tile{idx}")
+                tile_bufs.append(alloc_op.result)
+                if io_type in {"in", "both"}:
+                    wrap_tile_movement(
+                        full_type, tile_size, ip_func, f"load_tile{idx}", True
+                    )
+                    func_d.CallOp(
+                        [],
+                        FlatSymbolRefAttr.get(f"load_tile{idx}"),
+                        [tensor, alloc_op.result, tile_idx],
+                    )
+                if io_type in {"out", "both"}:
+                    wrap_tile_movement(
+                        full_type, tile_size, ip_func, f"store_tile{idx}", False
+                    )
+                    stores.append((idx, tensor, alloc_op.result))
+                if idx < num_args:
+                    call_operands[idx] = alloc_op.result
+            func_d.CallOp(
+                [],
+                FlatSymbolRefAttr.get(tile_func_name),
+                call_operands + tile_bufs[len(tile_bufs) - len(res_allocs) :],
+            )
+            for idx, tensor, buf in stores:
+                func_d.CallOp(
+                    [],
+                    FlatSymbolRefAttr.get(f"store_tile{idx}"),
+                    [buf, tensor, tile_idx],
+                )
+        func_d.ReturnOp(res_allocs, ip=ip)
+
+        # Flatten the arguments of the top function
+        new_in_types = []
+        for arg in top_func.arguments:
+            if isinstance(arg.type, MemRefType):
+                memref = MemRefType(arg.type)
+                arg.set_type(
+                    MemRefType.get((int(np.prod(memref.shape)),), memref.element_type)
+                )
+            new_in_types.append(arg.type)
+        func_type = FunctionType.get(new_in_types, [res.type for res in res_allocs])
+        top_func.attributes["function_type"] = TypeAttr.get(func_type)
+    return tile_size
+
+
 # pylint: disable=dangerous-default-value
 def analyze_arg_load_store_in_func(func, mapping={}):
     res = []
@@ -664,7 +1230,11 @@ def analyze_use_def(mod):
                     vals.append(use.owner.result)
         # pylint: disable=redefined-argument-from-local
         for val in vals:
-            if isinstance(val.owner, Operation) and "func.call" in str(val.owner):
+            if (
+                isinstance(val.owner, Operation)
+                and val.owner.name == "func.call"
+                and val.owner.attributes["callee"].value in ret_vals
+            ):
                 # not sure why cannot use isinstance(val.owner, func_d.CallOp)
                 # return value
                 callee = val.owner.attributes["callee"].value
@@ -685,12 +1255,16 @@ def analyze_use_def(mod):
             arg_name = f"{func_name}:{i}"
             uf_add(arg_name)
             add_use(arg, arg_name)
-        for op in func.entry_block.operations:
+        # unnamed results are keyed by their position in the entry block,
+        # which avoids printing the operations to recover their SSA names
+        unnamed = []
+        for pos, op in enumerate(func.entry_block.operations):
             if isinstance(op, (memref_d.AllocOp, func_d.CallOp, memref_d.GetGlobalOp)):
                 if "name" in op.attributes:
                     buf_name = f"{func_name}:{op.attributes['name'].value}"
-                elif " = " in str(op):
-                    buf_name = f"{func_name}:{str(op).split(' = ', maxsplit=1)[0]}"
+                elif len(op.results) > 0:
+                    buf_name = f"{func_name}:%{pos}"
+                    unnamed.append((op.result, buf_name))
                 else:
                     # call op does not have return value
                     continue
@@ -699,14 +1273,19 @@ def analyze_use_def(mod):
             if isinstance(op, func_d.ReturnOp):
                 for i, ret in enumerate(op.operands):
                     owner = ret.owner
-                    if "name" in owner.attributes:
+                    if BlockArgument.isinstance(ret):
+                        # function argument
+                        buf_name = f"{func_name}:{BlockArgument(ret).arg_number}"
+                    elif "name" in owner.attributes:
                         buf_name = f"{func_name}:{owner.attributes['name'].value}"
                     elif "from" in owner.attributes:
                         buf_name = f"{func_name}:{owner.attributes['from'].value}"
-                    elif " = " in str(owner):
-                        buf_name = (
-                            f"{func_name}:{str(owner).split(' = ', maxsplit=1)[0]}"
+                    else:
+                        buf_name = next(
+                            (key for res, key in unnamed if res == ret), None
                         )
+                        if buf_name is None:
+                            continue
                     ret_vals[func_name] = buf_name
 
     # recover final sets
@@ -714,6 +1293,75 @@ def analyze_use_def(mod):
     return res
 
 
+class UseDefIndex:
+    """Buffer symbol table of a module.
+
+    Maps each buffer to its defining operation, each callee to its call sites,
+    and each buffer to its use-def equivalence set, so that lookups do not scan
+    the module. The operation handles are only valid for the current revision
+    of the module, so the index must be rebuilt after the module is lowered.
+    """
+
+    def __init__(self, mod, func_args):
+        self.funcs = {}  # func_name -> FuncOp
+        self.buffers = {}  # func_name -> {buf_name -> (idx, op)}
+        self.callers = {}  # callee -> [(func_name, call_op)]
+        for func in mod.body.operations:
+            if not isinstance(func, func_d.FuncOp):
+                continue
+            func_name = func.attributes["sym_name"].value
+            self.funcs[func_name] = func
+            buffers = self.buffers.setdefault(func_name, {})
+            # function arguments take precedence over inner buffers
+            for idx, (dtensor, arg) in enumerate(
+                zip(func_args.get(func_name, []), func.arguments)
+            ):
+                name = dtensor.name if hasattr(dtensor, "name") else dtensor
+                buffers.setdefault(name, (idx, MockArg(arg)))
+            ops = list(func.entry_block.operations)
+            ret_operands = list(ops[-1].operands) if len(ops) > 0 else []
+            for op in ops:
+                if isinstance(op, func_d.CallOp):
+                    self.callers.setdefault(op.attributes["callee"].value, []).append(
+                        (func_name, op)
+                    )
+                if isinstance(op, memref_d.GetGlobalOp):
+                    buffers.setdefault(op.name.value, (-1, op))
+                    continue
+                if (
+                    not isinstance(op, (memref_d.AllocOp, func_d.CallOp))
+                    or "name" not in op.attributes
+                ):
+                    continue
+                idx = -1
+                # verify if it is a return tensor
+                if (
+                    isinstance(op, memref_d.AllocOp)
+                    and len(ret_operands) > 0
+                    and ret_operands[0] == op.result
+                ):
+                    idx = len(func.arguments)
+                buffers.setdefault(op.attributes["name"].value, (idx, op))
+        self.equivalent_sets = {}  # "func:name" -> set of equivalent names
+        for ele in analyze_use_def(mod):
+            for name in ele:
+                self.equivalent_sets[name] = ele
+
+    def find_buffer(self, func_name, target_name):
+        if func_name not in self.funcs:
+            raise RuntimeError(f"Target function {func_name} not found")
+        if target_name not in self.buffers[func_name]:
+            raise RuntimeError(f"Target {func_name}:{target_name} not found")
+        idx, op = self.buffers[func_name][target_name]
+        return self.funcs[func_name], idx, op
+
+    def get_equivalent_variables(self, name):
+        return self.equivalent_sets.get(name, [])
+
+    def get_callers(self, callee):
+        return self.callers.get(callee, [])
+
+
 def analyze_read_write_patterns(mlir_func, external_kernel_lib: dict = {}):
     """
     Analyze the read/write patterns of function arguments to determine which are inputs and outputs.
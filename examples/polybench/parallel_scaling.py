@@ -0,0 +1,97 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+# Measures how the LLVM backend scales with the number of OpenMP threads, e.g.,
+#   python3 polybench/parallel_scaling.py --size 512 --threads 1 2 4 8
+
+import argparse
+import time
+import numpy as np
+import allo
+from allo.ir.types import float32
+
+
+def gemm(N):
+    def kernel(A: float32[N, N], B: float32[N, N]) -> float32[N, N]:
+        C: float32[N, N] = 0.0
+        for i, j, k in allo.grid(N, N, N):
+            C[i, j] += A[i, k] * B[k, j]
+        return C
+
+    s = allo.customize(kernel)
+    s.parallel("i")
+    return s, 2
+
+
+def two_mm(N):
+    def kernel(A: float32[N, N], B: float32[N, N], C: float32[N, N]) -> float32[N, N]:
+        tmp: float32[N, N] = 0.0
+        for i, j, k in allo.grid(N, N, N, name="mm1"):
+            tmp[i, j] += A[i, k] * B[k, j]
+        D: float32[N, N] = 0.0
+        for i, j, k in allo.grid(N, N, N, name="mm2"):
+            D[i, j] += tmp[i, k] * C[k, j]
+        return D
+
+    s = allo.customize(kernel)
+    loops = s.get_loops()
+    s.parallel(loops.mm1.i)
+    s.parallel(loops.mm2.i)
+    return s, 3
+
+
+def jacobi(N):
+    def kernel(A: float32[N, N]) -> float32[N, N]:
+        B: float32[N, N] = 0.0
+        for i, j in allo.grid(N - 2, N - 2):
+            B[i + 1, j + 1] = 0.2 * (
+                A[i + 1, j + 1]
+                + A[i, j + 1]
+                + A[i + 2, j + 1]
+                + A[i + 1, j]
+                + A[i + 1, j + 2]
+            )
+        return B
+
+    # the stencil is parallelized by the compiler
+    return allo.customize(kernel), 1
+
+
+KERNELS = {"gemm": gemm, "two_mm": two_mm, "jacobi": jacobi}
+
+
+def measure(mod, inputs, repeats):
+    mod(*inputs)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        mod(*inputs)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--kernels", nargs="+", default=list(KERNELS))
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    for name in args.kernels:
+        s, num_inputs = KERNELS[name](args.size)
+        inputs = [
+            np.random.random((args.size, args.size)).astype(np.float32)
+            for _ in range(num_inputs)
+        ]
+        baseline = measure(s.build(configs={"parallel": False}), inputs, args.repeats)
+        print(f"{name} ({args.size}x{args.size}) sequential: {baseline:.6f}s")
+        for num_threads in args.threads:
+            configs = {"num_threads": num_threads, "auto_parallel": name == "jacobi"}
+            elapsed = measure(s.build(configs=configs), inputs, args.repeats)
+            print(
+                f"{name} with {num_threads} threads: {elapsed:.6f}s "
+                f"({baseline / elapsed:.2f}x)"
+            )
+
+
+if __name__ == "__main__":
+    main()
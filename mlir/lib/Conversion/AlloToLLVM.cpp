@@ -13,6 +13,7 @@
 #include "mlir/Conversion/LLVMCommon/TypeConverter.h"
 #include "mlir/Conversion/MathToLLVM/MathToLLVM.h"
 #include "mlir/Conversion/MemRefToLLVM/MemRefToLLVM.h"
+#include "mlir/Conversion/OpenMPToLLVM/ConvertOpenMPToLLVM.h"
 #include "mlir/Conversion/ReconcileUnrealizedCasts/ReconcileUnrealizedCasts.h"
 #include "mlir/Conversion/SCFToControlFlow/SCFToControlFlow.h"
 #include "mlir/Dialect/Affine/IR/AffineOps.h"
@@ -254,6 +255,9 @@ bool applyAlloToLLVMLoweringPass(ModuleOp &module, MLIRContext &context) {
   // details how one type maps to another. This is necessary now that we will be
   // doing more complicated lowerings, involving loop region arguments.
   LLVMTypeConverter typeConverter(&context);
+  // Parallel loops may have been lowered to OpenMP, whose regions are
+  // converted together with the other operations.
+  configureOpenMPToLLVMConversionLegality(target, typeConverter);
 
   // Now that the conversion target has been defined, we need to provide the
   // patterns used for lowering. At this point of the compilation process, we
@@ -279,6 +283,7 @@ bool applyAlloToLLVMLoweringPass(ModuleOp &module, MLIRContext &context) {
 
   populateFuncToLLVMConversionPatterns(typeConverter, patterns);
   cf::populateControlFlowToLLVMConversionPatterns(typeConverter, patterns);
+  populateOpenMPToLLVMConversionPatterns(typeConverter, patterns);
   //   populateReconcileUnrealizedCastsPatterns(patterns);
 
   patterns.add<CreateLoopHandleOpLowering>(&context);
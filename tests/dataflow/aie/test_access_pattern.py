@@ -0,0 +1,121 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+import numpy as np
+from allo.ir.types import int32
+from allo.memory import DTensor, Layout, get_dma_bds
+from allo.backend.ai_engine import allocate_global_io
+
+
+def gather(tensor, bds):
+    # the elements visited by the DMA buffer descriptors, in order
+    flat = tensor.reshape(-1)
+    data = []
+    for offset, size, stride in bds:
+        assert len(size) == 4
+        base = sum(o * s for o, s in zip(offset, stride))
+        for idx in np.ndindex(*size):
+            data.append(flat[base + sum(i * s for i, s in zip(idx, stride))])
+    return np.array(data)
+
+
+def reference(dtensor, tensor, labels):
+    # the local tensors of the tensor tiles, in order
+    local_shape = dtensor.get_local_shape()
+    data = []
+    for label in labels:
+        slices = []
+        for i, char in enumerate(label):
+            if char == "R":
+                slices.append(slice(None))
+            else:
+                start = int(char) * local_shape[i]
+                slices.append(slice(start, start + local_shape[i]))
+        data.append(tensor[tuple(slices)].reshape(-1))
+    return np.concatenate(data)
+
+
+@pytest.mark.parametrize(
+    "shape, layout, mapping, num_bds",
+    [
+        ([64], "S0", [4], 1),
+        ([64], "R", [4], 1),
+        ([16, 32], "S1S0", [2, 4], 1),
+        ([16, 32], "S0R", [4], 1),
+        ([16, 32], "RS0", [4], 1),
+        ([16, 32], "RR", [4], 1),
+        ([4, 8, 6], "S0RR", [2], 1),
+        ([4, 8, 6], "S1S0R", [2, 2], 1),
+        ([4, 8, 6], "RS0S1", [3, 2], 2),
+        ([4, 4, 4, 4], "S0S1S2R", [2, 2, 2], 4),
+        ([4, 4, 4, 4], "RS0S1S2", [2, 2, 2], 8),
+    ],
+)
+def test_access_pattern(shape, layout, mapping, num_bds):
+    dtensor = DTensor(0, mapping, shape, int32, Layout(layout), name="A")
+    tensor = np.arange(np.prod(shape)).reshape(shape)
+    device_dims, size, stride = dtensor.get_access_pattern()
+    assert len(size) >= 4 and len(device_dims) == layout.count("S")
+    bds = get_dma_bds([0] * len(size), size, stride)
+    assert len(bds) == num_bds
+    labels = sorted(dtensor.global_placement.keys(), key=lambda l: (len(l), l))
+    np.testing.assert_array_equal(
+        gather(tensor, bds), reference(dtensor, tensor, labels)
+    )
+
+
+def test_legacy_patterns():
+    dtensor = DTensor(0, [2, 4], [16, 32], int32, Layout("S1S0"), name="A")
+    assert dtensor.get_access_pattern() == ([0, 1], [2, 4, 8, 8], [256, 8, 32, 1])
+    dtensor = DTensor(0, [4], [64], int32, Layout("S0"), name="A")
+    assert dtensor.get_access_pattern() == ([2], [1, 1, 4, 16], [0, 0, 16, 1])
+    bds = get_dma_bds([0, 0, 1, 0], [1, 1, 2, 16], [0, 0, 16, 1])
+    assert bds == [([0, 0, 1, 0], [1, 1, 2, 16], [0, 0, 16, 1])]
+    with pytest.raises(ValueError):
+        DTensor(0, [3], [64], int32, Layout("S0"), name="A").get_access_pattern()
+
+
+@pytest.mark.parametrize(
+    "layout, mesh",
+    [("S0", [4]), ("R", [4]), ("S1S0", [2, 4]), ("RS1", [2, 3]), ("S2S0R", [2, 3, 4])],
+)
+def test_placement(layout, mesh):
+    placement = Layout(layout).get_placement(mesh)
+    # the reference: enumerate the PE tiles in row-major order
+    expected = {}
+    for pe in np.ndindex(*mesh):
+        label = "".join(
+            str(pe[-dim - 1]) if op == "S" else "R"
+            for op, dim in Layout(layout).placement
+        )
+        expected.setdefault(label, []).append(pe)
+    assert list(placement.keys()) == list(expected.keys())
+    assert dict(placement) == {label: tuple(pes) for label, pes in expected.items()}
+    for label, pes in expected.items():
+        for pe in pes:
+            assert placement.get_label(pe) == label
+    # the placement is shared by the layouts with the same scheme and mesh
+    assert Layout(layout).get_placement(list(mesh)) is placement
+
+
+def test_parts_of_high_rank_tensors():
+    X = DTensor(0, [2, 2, 2], [4, 4, 4, 4], int32, Layout("S0S1S2R"), name="X")
+    Y = DTensor(0, [2, 2, 2], [4, 4, 4, 4], int32, Layout("S0S1S2R"), name="Y")
+    tile_map, _ = allocate_global_io(
+        {"f": {"_global": [X]}}, {"f": {"_global": [Y]}}, "npu1"
+    )
+    tensor = np.arange(256).reshape(4, 4, 4, 4)
+    for dtensor in (X, Y):
+        labels = []
+        for part in tile_map[dtensor.name]:
+            bds = get_dma_bds(part.offset, part.size, part.stride)
+            np.testing.assert_array_equal(
+                gather(tensor, bds), reference(dtensor, tensor, part.tensor_tiles)
+            )
+            labels += part.tensor_tiles
+        assert sorted(labels) == sorted(dtensor.global_placement.keys())
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,81 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+import numpy as np
+import allo
+from allo.ir.types import int32
+import allo.dataflow as df
+from allo.backend.aie_emulator import FIFOModel, run_cores, format_emulation_report
+
+Ty = int32
+M, N = 16, 16
+
+
+@df.region()
+def top():
+    pipe = df.pipe(dtype=Ty, shape=(), depth=4)
+
+    @df.kernel(mapping=[1])
+    def producer(A: Ty[M, N]):
+        for i, j in allo.grid(M, N):
+            out: Ty = A[i, j]
+            pipe.put(out)
+
+    @df.kernel(mapping=[1])
+    def consumer(B: Ty[M, N]):
+        for i, j in allo.grid(M, N):
+            data = pipe.get()
+            B[i, j] = data + 1
+
+
+@pytest.mark.parametrize("depth, producer_end", [(1, 60), (4, 48)])
+def test_run_cores(depth, producer_end):
+    traces = {
+        "producer_0": [("loop", 4, [("compute", 10), ("put", "pipe")])],
+        "consumer_0": [("loop", 4, [("get", "pipe"), ("compute", 20)])],
+    }
+    fifos = {"pipe": FIFOModel(depth, 0)}
+    start = {"producer_0": 0, "consumer_0": 0}
+    cores = run_cores(traces, start, fifos, lock_cycles=1)
+    assert cores["producer_0"]["end"] == producer_end
+    # the consumer is the bottleneck
+    assert cores["consumer_0"] == {"end": 100, "compute": 80, "stall": 12}
+
+
+def test_deadlock():
+    traces = {"consumer_0": [("get", "pipe")]}
+    with pytest.raises(RuntimeError):
+        run_cores(traces, {"consumer_0": 0}, {"pipe": FIFOModel(2, 0)}, 1)
+
+
+def test_emulate_producer_consumer():
+    A = np.random.randint(0, 64, (M, N)).astype(np.int32)
+    B = np.zeros((M, N), dtype=np.int32)
+    mod = df.build(top, target="aie-emu")
+    mod(A, B)
+    np.testing.assert_allclose(B, A + 1)
+    report = mod.report
+    cores = report["cores"]
+    assert set(cores) == {"producer_0", "consumer_0"}
+    assert cores["consumer_0"]["end"] > cores["producer_0"]["start"]
+    assert report["cycles"] >= max(stats["end"] for stats in cores.values())
+    assert any(name.startswith("shim") for name in report["channels"])
+    lines = format_emulation_report(report)
+    assert lines[0] == f"total: {report['cycles']} cycles"
+    assert len(lines) == 1 + len(cores) + len(report["channels"])
+    # a slower DMA does not speed up the design
+    slow = df.build(top, target="aie-emu", configs={"dma_bytes_per_cycle": 1})
+    assert slow.report["cycles"] > report["cycles"]
+    # the shim transfers only use the configured DMA channels
+    single = df.build(top, target="aie-emu", configs={"shim_channels": 1})
+    shim_lanes = {
+        name.split(".")[1]
+        for name in single.report["channels"]
+        if name.startswith("shim")
+    }
+    assert shim_lanes <= {"mm2s0", "s2mm0"}
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,80 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import pytest
+import numpy as np
+import allo
+from allo.ir.types import int32
+import allo.dataflow as df
+from allo.backend.ai_engine import get_fifo_depths, get_type_bytes
+
+Ty = int32
+M, N = 16, 16
+
+
+@df.region()
+def top():
+    pipe = df.pipe(dtype=Ty, shape=(), depth=4)
+
+    @df.kernel(mapping=[1])
+    def producer(A: Ty[M, N]):
+        for i, j in allo.grid(M, N):
+            out: Ty = A[i, j]
+            pipe.put(out)
+
+    @df.kernel(mapping=[1])
+    def consumer(B: Ty[M, N]):
+        for i, j in allo.grid(M, N):
+            data = pipe.get()
+            B[i, j] = data + 1
+
+
+def test_fifo_depths():
+    assert get_type_bytes([16, 16], "i32") == 1024
+    assert get_type_bytes([], "bf16") == 2
+    fifos = [
+        ("A", 16 * 1024, ["gemm_0_0", "gemm_0_1"], 2),
+        ("B", 16 * 1024, ["gemm_0_0"], 2),
+        ("pipe", 4, ["gemm_0_0", "gemm_0_1"], 4),
+    ]
+    # the default depths
+    assert get_fifo_depths(fifos) == {"A": 2, "B": 2, "pipe": 4}
+    # per-tensor depths
+    depths = get_fifo_depths(fifos, {"fifo_depth": {"A": 1, "pipe": 8}})
+    assert depths == {"A": 1, "B": 2, "pipe": 8}
+    # the automatic depths fit in the local memory
+    local_usage = {"gemm_0_0": 8 * 1024, "gemm_0_1": 0}
+    depths = get_fifo_depths(fifos, {"fifo_depth": "auto"}, local_usage)
+    used = 8 * 1024 + (depths["A"] + depths["B"]) * 16 * 1024 + depths["pipe"] * 4
+    assert used <= 64 * 1024 and depths["A"] + depths["B"] == 3
+    depths = get_fifo_depths(
+        fifos, {"fifo_depth": "auto", "local_memory": 1 << 20}, local_usage
+    )
+    assert depths == {"A": 4, "B": 4, "pipe": 4}
+    # the automatic depths start from the declared depths
+    fifos[2] = ("pipe", 4, ["gemm_0_0", "gemm_0_1"], 8)
+    depths = get_fifo_depths(fifos, {"fifo_depth": "auto", "local_memory": 1 << 20})
+    assert depths == {"A": 4, "B": 4, "pipe": 8}
+    with pytest.raises(ValueError):
+        get_fifo_depths(fifos, {"fifo_depth": 0})
+    assert get_fifo_depths(fifos, {"fifo_acquire": {"A": 1}})["A"] == 2
+    with pytest.raises(ValueError):
+        get_fifo_depths(fifos, {"fifo_acquire": {"pipe": 2}})
+
+
+def test_producer_consumer_depth():
+    A = np.random.randint(0, 64, (M, N)).astype(np.int32)
+    B = np.zeros((M, N), dtype=np.int32)
+    if "MLIR_AIE_INSTALL_DIR" in os.environ:
+        for configs in [{"fifo_depth": "auto"}, {"fifo_depth": {"pipe": 2}}]:
+            mod = df.build(top, target="aie", configs=configs)
+            mod(A, B)
+            np.testing.assert_allclose(A + 1, B, atol=1e-5)
+        print("Passed!")
+    else:
+        print("MLIR_AIE_INSTALL_DIR unset. Skipping AIE backend test.")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
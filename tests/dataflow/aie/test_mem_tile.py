@@ -0,0 +1,67 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+from allo.ir.types import int32
+from allo.memory import DTensor, Layout
+from allo.backend.ai_engine import allocate_global_io, format_io_load
+
+
+def make_dtensor(name, shape, layout, mapping):
+    return DTensor(0, mapping, shape, int32, Layout(layout), name=name)
+
+
+def check_parts(dtensors, tile_map, load):
+    for dtensor in dtensors:
+        labels = [
+            label for part in tile_map[dtensor.name] for label in part.tensor_tiles
+        ]
+        assert sorted(labels) == sorted(dtensor.global_placement.keys())
+        # the parts cover the rows of the tensor tiles without overlapping
+        device_dims, size, _ = dtensor.get_access_pattern()
+        if len(device_dims) > 0:
+            dim = device_dims[0]
+            start = 0
+            for part in tile_map[dtensor.name]:
+                assert part.offset[dim] == start
+                start += part.size[dim]
+            assert start == size[dim]
+    for usage in load["mem"].values():
+        assert usage["send"] <= 6 and usage["recv"] <= 6
+    for usage in load["shim"].values():
+        assert usage["mm2s"] <= 2 and usage["s2mm"] <= 2
+
+
+@pytest.mark.parametrize("device, num_mem_tiles", [("npu1_4col", 4), ("npu1", 5)])
+def test_gemm_balanced(device, num_mem_tiles):
+    A = make_dtensor("A", [64, 64], "S1R", [4, 4])
+    B = make_dtensor("B", [64, 64], "RS0", [4, 4])
+    C = make_dtensor("C", [64, 64], "S1S0", [4, 4])
+    inputs = {"gemm": {"_global": [A, B]}}
+    outputs = {"gemm": {"_global": [C]}}
+    tile_map, load = allocate_global_io(inputs, outputs, device)
+    check_parts([A, B, C], tile_map, load)
+    assert len(load["mem"]) == num_mem_tiles
+    loads = [usage["bytes"] for usage in load["mem"].values()]
+    # each tensor moves 16 KB per iteration
+    assert sum(loads) == 3 * 16384
+    assert max(loads) <= 12288
+    lines = format_io_load(load)
+    assert len(lines) == len(load["mem"]) + len(load["shim"])
+    assert lines[0].startswith("mem tile")
+
+
+def test_non_divisible_parts():
+    # 7 tensor tiles do not fit in one memory tile with 6 channels
+    X = make_dtensor("X", [70], "S0", [7])
+    Y = make_dtensor("Y", [70], "S0", [7])
+    tile_map, load = allocate_global_io(
+        {"f": {"_global": [X]}}, {"f": {"_global": [Y]}}, "npu1"
+    )
+    check_parts([X, Y], tile_map, load)
+    sizes = [len(part.tensor_tiles) for part in tile_map["X"]]
+    assert len(sizes) > 1 and max(sizes) - min(sizes) == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,128 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+from types import SimpleNamespace
+import pytest
+import allo
+from allo.ir.types import int32
+import allo.dataflow as df
+from allo.backend import AIE_MLIRPipeline
+import numpy as np
+from allo.memory import DTensor, Layout
+
+Ty = int32
+M = 1024
+Ly = Layout("S0")
+
+
+@df.region()
+def add():
+    @df.kernel(mapping=[4])
+    def core(A: Ty[M] @ Ly, B: Ty[M] @ Ly):
+        B[:] = allo.add(A, 1)
+
+
+@df.region()
+def mul():
+    @df.kernel(mapping=[4])
+    def core(B: Ty[M] @ Ly, C: Ty[M] @ Ly):
+        C[:] = allo.mul(B, 2)
+
+
+def test_pipeline():
+    A = np.random.randint(0, 100, M).astype(np.int32)
+    if "MLIR_AIE_INSTALL_DIR" in os.environ:
+        # B stays on the device between the two regions
+        mod = df.build_pipeline([add, mul, add], project="pipeline.prj")
+        assert mod.stages[0] is mod.stages[2]
+        B = np.zeros(M).astype(np.int32)
+        C = np.zeros(M).astype(np.int32)
+        mod(A, B, C)
+        np.testing.assert_allclose(C, (A + 1) * 2)
+        np.testing.assert_allclose(B, A + 1)
+        # rebuilding does not duplicate the tensors of the pipeline
+        mod.build()
+        assert [dtensor.name for dtensor in mod.tensors] == ["A", "B", "C"]
+        print("PASSED!")
+    else:
+        print("MLIR_AIE_INSTALL_DIR unset. Skipping AIE backend test.")
+
+
+def test_pipeline_host():
+    if AIE_MLIRPipeline is None:
+        pytest.skip("The aie-mlir backend is not available")
+    from allo.backend.experimental.utils import codegen_pipeline_host
+
+    def stage(project_dir, inputs, outputs):
+        # only the global I/O of a stage is used by the pipeline
+        dtensors = [
+            DTensor(0, [4], [M], Ty, Ly, name=name) for name in inputs + outputs
+        ]
+        return SimpleNamespace(
+            global_inputs=dict(enumerate(dtensors[: len(inputs)])),
+            global_outputs=dict(enumerate(dtensors[len(inputs) :], len(inputs))),
+            project_dir=project_dir,
+        )
+
+    add_stage = stage("p/stage0", ["A"], ["B"])
+    mul_stage = stage("p/stage1", ["B"], ["C"])
+    mod = AIE_MLIRPipeline([add_stage, mul_stage], "p")
+    mod.collect_tensors()
+    assert [dtensor.name for dtensor in mod.tensors] == ["A", "B", "C"]
+    assert mod.stage_args == [[0, 1], [1, 2]]
+    # B is produced and consumed on the device
+    assert mod.is_input == [True, False, False]
+    assert mod.is_output == [False, False, True]
+    stages = [("stage0", [0, 1]), ("stage1", [1, 2])]
+    code = codegen_pipeline_host(stages, mod.tensors, mod.is_input, mod.is_output)
+    assert "input0.data" in code and "input1.data" not in code
+    assert "output2.data" in code and "output1.data" not in code
+    # one xclbin per stage, the first one given on the command line
+    assert code.count("register_xclbin") == 2
+    assert "stage1/build/final.xclbin" in code
+    assert "stage0/build/final.xclbin" not in code
+    assert "kernel1(opcode, bo_instr1, instr_v1.size(), bo_1, bo_2)" in code
+
+    # B is copied back once the last stage that writes it has run
+    mod = AIE_MLIRPipeline([add_stage, mul_stage, add_stage], "p")
+    mod.collect_tensors()
+    assert mod.stage_args == [[0, 1], [1, 2], [0, 1]]
+    assert mod.is_output == [False, True, True]
+    stages.append(("stage0", [0, 1]))
+    code = codegen_pipeline_host(stages, mod.tensors, mod.is_input, mod.is_output)
+    # a region used by several stages is loaded once
+    assert code.count("register_xclbin") == 2
+    assert "run2 = kernel(opcode, bo_instr, instr_v.size(), bo_0, bo_1)" in code
+    assert "output1.data" in code
+    # the stages must agree on the tensor types
+    other = SimpleNamespace(
+        global_inputs={0: DTensor(0, [4], [2 * M], Ty, Ly, name="B")},
+        global_outputs={},
+        project_dir="p/stage2",
+    )
+    with pytest.raises(ValueError):
+        AIE_MLIRPipeline([add_stage, other], "p").collect_tensors()
+
+
+def test_incremental_build():
+    A = np.random.randint(0, 100, M).astype(np.int32)
+    if "MLIR_AIE_INSTALL_DIR" in os.environ:
+        project = "incremental.prj"
+        df.build(add, target="aie-mlir", project=project)
+        xclbin = os.path.join(project, "build", "final.xclbin")
+        mtime = os.path.getmtime(xclbin)
+        # nothing changed, so the design is not recompiled
+        mod = df.build(add, target="aie-mlir", project=project)
+        assert os.path.getmtime(xclbin) == mtime
+        B = np.zeros(M).astype(np.int32)
+        mod(A, B)
+        np.testing.assert_allclose(B, A + 1)
+        print("PASSED!")
+    else:
+        print("MLIR_AIE_INSTALL_DIR unset. Skipping AIE backend test.")
+
+
+if __name__ == "__main__":
+    test_pipeline()
+    test_incremental_build()
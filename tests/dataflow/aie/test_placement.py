@@ -0,0 +1,85 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import math
+import pytest
+from allo.backend.ai_engine import (
+    get_kernel_footprints,
+    get_placement_cost,
+    map_kernels_to_device_mesh,
+)
+
+
+def check_placement(kernel_shapes, device_shape, placement):
+    tiles = [idx for indices in placement.values() for idx in indices]
+    assert len(tiles) == len(set(tiles))
+    for name, shape in kernel_shapes.items():
+        assert len(placement[name]) == len(set(placement[name]))
+        assert len(placement[name]) == math.prod(shape)
+    for row, col in tiles:
+        assert 0 <= row < device_shape[0] and 0 <= col < device_shape[1]
+
+
+def test_footprints():
+    # 2x2x2 can be flattened into 2x4 and 4x2, and 1x8/8x1 do not fit
+    footprints = get_kernel_footprints([2, 2, 2], (5, 4))
+    shapes = {
+        (max(r for r, _ in fp) + 1, max(c for _, c in fp) + 1) for fp in footprints
+    }
+    assert shapes == {(2, 4), (4, 2)}
+    # the natural layout comes first
+    assert get_kernel_footprints([2, 3], (5, 4))[0] == (
+        (0, 0),
+        (0, 1),
+        (0, 2),
+        (1, 0),
+        (1, 1),
+        (1, 2),
+    )
+
+
+def test_fragmented_mesh():
+    # first-fit in dict order used to leave no room for the 3x4 kernel
+    kernel_shapes = {"a": [2, 2], "b": [4], "c": [3, 4]}
+    placement, cost = map_kernels_to_device_mesh(kernel_shapes, (5, 4))
+    check_placement(kernel_shapes, (5, 4), placement)
+    assert cost["total"] == 0
+
+
+def test_stream_distance():
+    # producer -> 4 workers -> consumer
+    kernel_shapes = {"prod": [1], "work": [4], "cons": [1]}
+    streams = [("prod_0", f"work_{i}") for i in range(4)]
+    streams += [(f"work_{i}", "cons_0") for i in range(4)]
+    placement, cost = map_kernels_to_device_mesh(kernel_shapes, (5, 4), streams=streams)
+    check_placement(kernel_shapes, (5, 4), placement)
+    names = {
+        f"{name}_{i}": idx
+        for name, indices in placement.items()
+        for i, idx in enumerate(indices)
+    }
+    assert cost == get_placement_cost(names, streams)
+    # the producer and the consumer sit next to the middle of the workers
+    assert cost["stream_hops"] == 16
+
+
+def test_io_contention():
+    kernel_shapes = {"load": [4], "compute": [4]}
+    streams = [(f"load_{i}", f"compute_{i}") for i in range(4)]
+    io_loads = {f"load_{i}": 2 for i in range(4)}
+    placement, cost = map_kernels_to_device_mesh(
+        kernel_shapes, (5, 4), streams=streams, io_loads=io_loads
+    )
+    check_placement(kernel_shapes, (5, 4), placement)
+    # the loaders are spread over the columns
+    assert len({idx[0] for idx in placement["load"]}) == 4
+    assert cost == {"stream_hops": 4, "io_contention": 2, "total": 6}
+
+
+def test_unplaceable():
+    with pytest.raises(RuntimeError):
+        map_kernels_to_device_mesh({"a": [4, 4], "b": [2, 3]}, (5, 4))
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
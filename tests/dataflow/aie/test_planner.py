@@ -0,0 +1,124 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+import numpy as np
+import allo
+from allo.ir.types import int16, int32
+import allo.dataflow as df
+from allo.memory import Layout
+from allo.backend.aie_planner import plan_sharding, format_sharding_plans
+
+M, K, N = 64, 64, 64
+LyR = Layout("RR")
+
+
+def make_gemm(mapping, layouts):
+    @df.region()
+    def top():
+        @df.kernel(mapping=mapping)
+        def gemm(
+            A: int32[M, K] @ layouts["A"],
+            B: int32[K, N] @ layouts["B"],
+            C: int32[M, N] @ layouts["C"],
+        ):
+            C[:, :] = allo.matmul(A, B)
+
+    return top
+
+
+def test_plan_gemm():
+    shapes = [(M, K), (K, N), (M, N)]
+    plans = plan_sharding("mk,kn->mn", shapes, int16, [4, 4], num_plans=100)
+    lines = format_sharding_plans(plans[:5])
+    assert len(lines) == 5 and lines[0].startswith(f"mapping {plans[0].mapping} (A: ")
+    cycles = [plan.cycles for plan in plans]
+    assert cycles == sorted(cycles)
+    for plan in plans:
+        assert plan.local_bytes <= 64 * 1024
+        assert np.prod(plan.mapping) <= 16
+        layouts = {name: repr(layout) for name, layout in plan.layouts.items()}
+        if plan.mapping == [1]:
+            assert layouts == {"A": "Layout(RR)", "B": "Layout(RR)", "C": "Layout(RR)"}
+    best = plans[0]
+    # the work is spread over more than one tile
+    assert np.prod(best.mapping) > 1
+    local_macs = np.prod(best.local_shapes["C"]) * K
+    assert best.compute_cycles == -(-local_macs // 64)
+    # a 2D sharding on m and n
+    plan = next(plan for plan in plans if plan.mapping == [2, 4])
+    layouts = {name: repr(layout) for name, layout in plan.layouts.items()}
+    assert layouts == {"A": "Layout(S1R)", "B": "Layout(RS0)", "C": "Layout(S1S0)"}
+    assert plan.local_shapes == {"A": (32, 64), "B": (64, 16), "C": (32, 16)}
+    # the replicated tiles are broadcast, so every tensor is moved once
+    assert plan.io_bytes == 3 * M * N * 2
+
+
+def test_invalid_plans():
+    # the local tensors of the single tile do not fit in its data memory
+    shapes = [(128, 128), (128, 128), (128, 128)]
+    plans = plan_sharding("mk,kn->mn", shapes, int16, [4, 4], num_plans=1000)
+    assert len(plans) > 0 and all(plan.mapping != [1] for plan in plans)
+    # the tensors are sharded evenly, and the mappings fit in the mesh
+    shapes = [(12,), (12,), (12,)]
+    plans = plan_sharding("m,m->m", shapes, int32, [4, 4], num_plans=1000)
+    assert sorted(plan.mapping for plan in plans) == [[1], [2], [3], [4]]
+    with pytest.raises(ValueError):
+        plan_sharding("mk,kn->mn", [(M, K), (K + 1, N), (M, N)], int32, [4, 4])
+
+
+def test_plan_region():
+    # the index structure of the matmul is derived from its loops
+    plans = df.plan_sharding(
+        make_gemm([1], {"A": LyR, "B": LyR, "C": LyR}), [4, 4], num_plans=100
+    )
+    plan = next(plan for plan in plans if plan.mapping == [2, 4])
+    layouts = {name: repr(layout) for name, layout in plan.layouts.items()}
+    assert layouts == {"A": "Layout(S1R)", "B": "Layout(RS0)", "C": "Layout(S1S0)"}
+    # the contraction index is not sharded
+    assert all(len(plan.mapping) <= 2 for plan in plans)
+
+    # a transpose
+    @df.region()
+    def transpose():
+        @df.kernel(mapping=[1])
+        def core(A: int32[M, K], B: int32[M, K], C: int32[K, M]):
+            for i, j in allo.grid(M, K):
+                C[j, i] = A[i, j] + B[i, j]
+
+    plans = df.plan_sharding(transpose, [4, 4], num_plans=100)
+    assert any(len(plan.mapping) == 2 for plan in plans)
+    for plan in plans:
+        assert repr(plan.layouts["A"]) == repr(plan.layouts["B"])
+        assert plan.layouts["C"].placement == plan.layouts["A"].placement[::-1]
+
+    # a stencil along the columns, after an elementwise statement
+    @df.region()
+    def stencil():
+        @df.kernel(mapping=[1])
+        def core(A: int32[M, N], B: int32[M, N]):
+            tmp: int32[M, N] = 0
+            for i, j in allo.grid(M, N):
+                tmp[i, j] = A[i, j] * 2
+            for i, j in allo.grid(M, N - 1):
+                B[i, j] = tmp[i, j] + tmp[i, j + 1]
+
+    plans = df.plan_sharding(stencil, [4, 4], num_plans=100)
+    assert len(plans) > 0
+    for plan in plans:
+        assert len(plan.mapping) == 1 and plan.mapping != [1]
+        layouts = {name: repr(layout) for name, layout in plan.layouts.items()}
+        assert layouts == {"A": "Layout(S0R)", "B": "Layout(S0R)"}
+
+
+def test_rank_with_emulator():
+    plans = df.plan_sharding(
+        make_gemm([1], {"A": LyR, "B": LyR, "C": LyR}), [4, 4], num_plans=3
+    )
+    ranked = df.rank_sharding_plans(make_gemm, plans)
+    assert len(ranked) == 3
+    assert [plan.cycles for plan in ranked] == sorted(plan.cycles for plan in ranked)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,116 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+import numpy as np
+import allo
+from allo.ir.types import int8, int32, float32, bfloat16
+from allo.ir.transform import find_func_in_module
+from allo.passes import vectorize_loops
+from allo.backend.ai_engine import get_vector_lanes
+from allo._mlir.passmanager import PassManager as mlir_pass_manager
+
+
+def vectorize(s, name):
+    with s.module.context:
+        mlir_pass_manager.parse(
+            "builtin.module(func.func(convert-linalg-to-affine-loops))"
+        ).run(s.module.operation)
+    func = find_func_in_module(s.module, name)
+    lanes = get_vector_lanes(func)
+    return func, lanes, vectorize_loops(func, lanes) if lanes > 0 else 0
+
+
+@pytest.mark.parametrize("size, in_bounds", [(64, True), (60, False)])
+def test_vectorize_elementwise(size, in_bounds):
+    def kernel(A: int32[size], B: int32[size], C: int32[size]):
+        for i in range(size):
+            C[i] = A[i] + B[i] * 2
+
+    s = allo.customize(kernel)
+    func, lanes, num_loops = vectorize(s, "kernel")
+    assert lanes == 16 and num_loops == 1
+    code = str(func)
+    assert "vector<16xi32>" in code
+    assert ("in_bounds = [true]" in code) == in_bounds
+    # the vectorized code computes the same results
+    mod = s.build(
+        configs={
+            "cpu_pipeline": {
+                "tile_size": None,
+                "scalar_replacement": False,
+                "vector_size": 16,
+            }
+        }
+    )
+    np_A = np.random.randint(0, 100, size).astype(np.int32)
+    np_B = np.random.randint(0, 100, size).astype(np.int32)
+    np_C = np.zeros(size, dtype=np.int32)
+    mod(np_A, np_B, np_C)
+    np.testing.assert_array_equal(np_C, np_A + np_B * 2)
+
+
+def test_vectorize_in_stepped_loop():
+    # the outer loop steps by the lanes but is not vectorized
+    def kernel(A: int32[64, 60], B: int32[64, 60]):
+        for i in range(0, 64, 16):
+            for j in range(60):
+                B[i, j] = A[i, j] + 1
+
+    s = allo.customize(kernel)
+    func, lanes, num_loops = vectorize(s, "kernel")
+    assert lanes == 16 and num_loops == 1
+    code = str(func)
+    assert "vector<16xi32>" in code
+    # the inner trip count is not a multiple of the lanes
+    assert "in_bounds = [true]" not in code
+    assert "allo.scalar_loop" not in code
+    mod = s.build(
+        configs={
+            "cpu_pipeline": {
+                "tile_size": None,
+                "scalar_replacement": False,
+                "vector_size": 16,
+            }
+        }
+    )
+    np_A = np.random.randint(0, 100, (64, 60)).astype(np.int32)
+    np_B = np.zeros((64, 60), dtype=np.int32)
+    mod(np_A, np_B)
+    np.testing.assert_array_equal(np_B[::16], np_A[::16] + 1)
+
+
+def test_vector_lanes():
+    def bf16_scale(A: bfloat16[32, 64], B: bfloat16[32, 64]):
+        for i, j in allo.grid(32, 64):
+            B[i, j] = A[i, j] * A[i, j]
+
+    def i8_to_i32(A: int8[128], B: int32[128]):
+        for i in range(128):
+            B[i] = A[i] + 1
+
+    def divide(A: float32[64], B: float32[64]):
+        for i in range(64):
+            B[i] = A[i] / 3.0
+
+    def reduce(A: int32[64], B: int32[1]):
+        for i in range(64):
+            B[0] += A[i]
+
+    func, lanes, num_loops = vectorize(allo.customize(bf16_scale), "bf16_scale")
+    assert lanes == 32 and num_loops == 1
+    assert "vector<32xbf16>" in str(func)
+    # the widest element type decides the lanes
+    _, lanes, num_loops = vectorize(allo.customize(i8_to_i32), "i8_to_i32")
+    assert lanes == 16 and num_loops == 1
+    # no vector division on the compute tiles
+    _, lanes, num_loops = vectorize(allo.customize(divide), "divide")
+    assert lanes == 0 and num_loops == 0
+    # the loop carries a dependence through B[0]
+    func, lanes, num_loops = vectorize(allo.customize(reduce), "reduce")
+    assert lanes == 16 and num_loops == 0
+    assert "vector" not in str(func)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -7,6 +7,7 @@ import numpy as np
 import allo
 from allo.ir.types import int32, float32
 import allo.backend.hls as hls
+from allo.backend.ip import compile_shared_libs
 
 
 def test_pybind11():
@@ -19,6 +20,24 @@ def test_pybind11():
     print("Passed!")
 
 
+def test_pybind11_cache():
+    mod = allo.IPModule(top="gemm", impl="gemm.cpp", link_hls=False)
+    a = np.random.random((16, 16)).astype(np.float32)
+    b = np.random.random((16, 16)).astype(np.float32)
+    c = np.zeros((16, 16)).astype(np.float32)
+    mod(a, b, c)
+    assert os.path.exists(mod.lib_path)
+    # the same source and flags reuse the extension built on disk
+    mod2 = allo.IPModule(top="gemm", impl="gemm.cpp", link_hls=False)
+    assert mod2.lib_path == mod.lib_path
+    mod3 = allo.IPModule(top="gemm", impl="gemm.cpp", link_hls=False, cflags="-O0")
+    assert mod3.lib_path != mod.lib_path
+    # mismatched outputs are converted and written back
+    c = np.zeros((16, 16), dtype=np.float64)
+    mod2(a, b, c)
+    np.testing.assert_allclose(np.matmul(a, b), c, atol=1e-5)
+
+
 def test_pointer():
     vadd = allo.IPModule(top="vadd", impl="vadd_extern.cpp", link_hls=False)
     np_A = np.random.randint(0, 100, (32,)).astype(np.int32)
@@ -81,6 +100,17 @@ def test_shared_lib():
     print("Passed generating HLS project!")
 
 
+def test_shared_lib_cache():
+    vadd = allo.IPModule(top="vadd", impl="vadd.cpp", link_hls=False)
+    vadd_int = allo.IPModule(top="vadd_int", impl="vadd_int.cpp", link_hls=False)
+    libs = compile_shared_libs([vadd, vadd_int])
+    # the libraries are content-addressed and reused
+    assert compile_shared_libs([vadd, vadd_int]) == libs
+    assert all(os.path.exists(lib) for lib in libs)
+    vadd_o2 = allo.IPModule(top="vadd", impl="vadd.cpp", link_hls=False, cflags="-O2")
+    assert vadd_o2.compile_shared_lib() != libs[0]
+
+
 def test_scalar():
     vadd_int = allo.IPModule(
         top="vadd_int",
@@ -0,0 +1,81 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+import numpy as np
+import allo
+
+
+def test_bucketed_mlp():
+    try:
+        import torch
+        from torch import nn
+    except ImportError:
+        print("PyTorch not found, skipping...")
+        return
+
+    class MLP(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.linear1 = nn.Linear(16, 32)
+            self.linear2 = nn.Linear(32, 10)
+
+        def forward(self, data):
+            out = self.linear1(data)
+            out = self.linear2(out)
+            return out
+
+    model = MLP()
+    model.eval()
+    mod = allo.frontend.from_pytorch_dynamic(
+        model,
+        example_inputs=[torch.rand(1, 8, 16)],
+        dynamic_dims={"seq_len": [(0, 1)]},
+        buckets={"seq_len": [4, 8]},
+    )
+    assert mod.output_dims == {"seq_len": [(0, 1)]}
+    for seq_len in [3, 4, 5, 8, 2]:
+        x = torch.rand(1, seq_len, 16)
+        res = mod(x.numpy())
+        assert res.shape == (1, seq_len, 10)
+        np.testing.assert_allclose(res, model(x).detach().numpy(), atol=1e-4)
+    # each bucket is only compiled once
+    assert mod.num_compiles == 2
+    assert mod.num_hits == 3
+    with pytest.raises(ValueError):
+        mod(np.random.rand(1, 9, 16).astype(np.float32))
+
+
+def test_bucket_lru():
+    try:
+        import torch
+        from torch import nn
+    except ImportError:
+        print("PyTorch not found, skipping...")
+        return
+
+    class Model(nn.Module):
+        def forward(self, x, y):
+            return x + y
+
+    model = Model()
+    mod = allo.frontend.from_pytorch_dynamic(
+        model,
+        example_inputs=[torch.rand(2, 4), torch.rand(2, 4)],
+        dynamic_dims={"batch": [(0, 0), (1, 0)]},
+        buckets={"batch": [1, 2, 4]},
+        max_cache_size=2,
+    )
+    mod.warmup()
+    assert mod.num_compiles == 3
+    assert len(mod.cache) == 2
+    # the smallest bucket has been evicted
+    x, y = np.random.rand(1, 4).astype(np.float32), np.random.rand(1, 4).astype(
+        np.float32
+    )
+    np.testing.assert_allclose(mod(x, y), x + y, atol=1e-5)
+    assert mod.num_compiles == 4
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
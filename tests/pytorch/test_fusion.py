@@ -0,0 +1,109 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import math
+import pytest
+import numpy as np
+import allo
+
+
+def test_fused_linear_act():
+    try:
+        import torch
+        from torch import nn
+        import torch.nn.functional as F
+    except ImportError:
+        print("PyTorch not found, skipping...")
+        return
+
+    class MLP(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.linear1 = nn.Linear(16, 32)
+            self.linear2 = nn.Linear(32, 10)
+            self.act = nn.GELU()
+
+        def forward(self, data):
+            out = F.relu(self.linear1(data))
+            out = self.act(self.linear2(out))
+            return out
+
+    model = MLP()
+    model.eval()
+    example_inputs = [torch.rand(2, 8, 16)]
+    s = allo.frontend.from_pytorch(
+        model,
+        example_inputs=example_inputs,
+        target="mlir",
+        options={"enable_fusion": True},
+    )
+    assert "@linear2d_relu_0" in str(s.module)
+    assert "@linear2d_gelu_0" in str(s.module)
+    mod = s.build()
+    golden = model(*example_inputs).detach().numpy()
+    res = mod(*[x.detach().numpy() for x in example_inputs])
+    np.testing.assert_allclose(res, golden, atol=1e-3)
+
+
+def test_fused_add_layernorm():
+    try:
+        import torch
+        from torch import nn
+    except ImportError:
+        print("PyTorch not found, skipping...")
+        return
+
+    class Residual(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.linear = nn.Linear(16, 16)
+            self.norm = nn.LayerNorm(16)
+
+        def forward(self, x):
+            return self.norm(self.linear(x) + x)
+
+    model = Residual()
+    model.eval()
+    example_inputs = [torch.rand(8, 16)]
+    mod = allo.frontend.from_pytorch(
+        model, example_inputs=example_inputs, options={"enable_fusion": True}
+    )
+    golden = model(*example_inputs).detach().numpy()
+    res = mod(*[x.detach().numpy() for x in example_inputs])
+    np.testing.assert_allclose(res, golden, atol=1e-4)
+
+
+def test_fused_matmul_scale_softmax():
+    try:
+        import torch
+        from torch import nn
+        import torch.nn.functional as F
+    except ImportError:
+        print("PyTorch not found, skipping...")
+        return
+
+    class Attention(nn.Module):
+        def forward(self, q, k, v):
+            scores = torch.matmul(q, k.transpose(-1, -2))
+            scores = scores / math.sqrt(4)
+            probs = F.softmax(scores, dim=-1)
+            return torch.matmul(probs, v)
+
+    model = Attention()
+    model.eval()
+    example_inputs = [torch.rand(1, 2, 8, 4) for _ in range(3)]
+    s = allo.frontend.from_pytorch(
+        model,
+        example_inputs=example_inputs,
+        target="mlir",
+        options={"enable_fusion": True},
+    )
+    assert "@matmul_scale_softmax_0" in str(s.module)
+    mod = s.build()
+    golden = model(*example_inputs).detach().numpy()
+    res = mod(*[x.detach().numpy() for x in example_inputs])
+    np.testing.assert_allclose(res, golden, atol=1e-4)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,87 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+import numpy as np
+import allo
+from allo.frontend.quantize import QuantPolicy
+
+
+def get_mlp():
+    import torch
+    from torch import nn
+
+    class MLP(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.linear1 = nn.Linear(16, 32)
+            self.linear2 = nn.Linear(32, 10)
+            self.linear3 = nn.Linear(10, 8, bias=False)
+
+        def forward(self, data):
+            out = self.linear1(data)
+            out = torch.nn.functional.relu(out)
+            out = self.linear2(out)
+            out = self.linear3(out)
+            return out
+
+    torch.manual_seed(0)
+    model = MLP()
+    model.eval()
+    return model
+
+
+@pytest.mark.parametrize(
+    "quant_config, tol",
+    [
+        ({"*": "int8"}, 5e-2),
+        ({"*": QuantPolicy("int8", symmetric=True)}, 5e-2),
+        ({"*": "bf16"}, 2e-2),
+        ({"*": "fixed"}, 2e-2),
+        ({"linear1": "int8", "linear2": "bf16", "linear3": "fixed"}, 5e-2),
+    ],
+)
+def test_quantized_mlp(quant_config, tol):
+    try:
+        import torch
+    except ImportError:
+        print("PyTorch not found, skipping...")
+        return
+
+    model = get_mlp()
+    example_inputs = [torch.rand(8, 16)]
+    mod = allo.frontend.from_pytorch(
+        model,
+        example_inputs=example_inputs,
+        options={"quant_config": quant_config},
+    )
+    golden = model(*example_inputs).detach().numpy()
+    res = mod(*[x.detach().numpy() for x in example_inputs])
+    rel_err = np.linalg.norm(res - golden) / np.linalg.norm(golden)
+    assert rel_err < tol
+    assert mod.quant_report[0]["relative_error"] == pytest.approx(rel_err, rel=1e-3)
+
+
+def test_quantized_code():
+    try:
+        import torch
+    except ImportError:
+        print("PyTorch not found, skipping...")
+        return
+
+    model = get_mlp()
+    example_inputs = [torch.rand(8, 16)]
+    s = allo.frontend.from_pytorch(
+        model,
+        example_inputs=example_inputs,
+        target="mlir",
+        options={"quant_config": {"linear1": "int8"}},
+    )
+    # int8 weights are stored as i8 globals and accumulated in i32
+    assert "memref<32x16xi8>" in str(s.module)
+    assert "qlinear2d_0" in str(s.module)
+    assert "@linear2d_0" in str(s.module)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
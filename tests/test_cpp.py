@@ -0,0 +1,217 @@
+# Copyright Allo authors. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import pytest
+import numpy as np
+import allo
+from allo.ir.types import int32, float32, float16
+from tests.autoscheduler.polybench import get_polybench
+
+
+def test_cpp_gemm():
+    def gemm(A: float32[32, 32], B: float32[32, 32]) -> float32[32, 32]:
+        C: float32[32, 32] = 0.0
+        for i, j, k in allo.grid(32, 32, 32):
+            C[i, j] += A[i, k] * B[k, j]
+        return C
+
+    s = allo.customize(gemm)
+    mod = s.build(target="cpp", project="gemm_cpp.prj")
+    assert os.path.exists(mod.lib_path)
+    np_A = np.random.random((32, 32)).astype(np.float32)
+    np_B = np.random.random((32, 32)).astype(np.float32)
+    np.testing.assert_allclose(mod(np_A, np_B), np_A @ np_B, rtol=1e-5)
+    # the same IR and flags reuse the compiled library
+    mod2 = s.build(target="cpp", project="gemm_cpp.prj")
+    assert mod2.lib_path == mod.lib_path
+
+
+def test_cpp_scalar_and_inplace():
+    def reduce_sum(A: int32[16], B: int32[16], x: int32) -> int32:
+        total: int32 = 0
+        for i in range(16):
+            B[i] = A[i] + x
+            total += B[i]
+        return total
+
+    s = allo.customize(reduce_sum)
+    mod = s.build(target="cpp")
+    np_A = np.random.randint(0, 10, size=(16,)).astype(np.int32)
+    np_B = np.zeros((16,), dtype=np.int32)
+    assert mod(np_A, np_B, 3) == int(np.sum(np_A + 3))
+    np.testing.assert_array_equal(np_B, np_A + 3)
+
+
+def test_cpp_half_scalar():
+    def scale(A: float16[16], x: float16) -> float16[16]:
+        B: float16[16] = 0.0
+        for i in range(16):
+            B[i] = A[i] * x
+        return B
+
+    s = allo.customize(scale)
+    # the C ABI passes half scalars in floating-point registers
+    with pytest.raises(RuntimeError):
+        s.build(target="cpp")
+
+
+@pytest.mark.parametrize(
+    "configs",
+    [
+        {"opt_level": 3},
+        {"opt_level": 3, "target_cpu": "x86-64", "target_features": "+sse4.2"},
+        {"cpu_pipeline": True},
+        {"cpu_pipeline": {"tile_size": 16, "vector_size": None}},
+        {"opt_level": 3, "cpu_pipeline": {"tile_size": None, "vector_size": 4}},
+    ],
+)
+def test_llvm_configs(configs):
+    sch, inputs, expected = get_polybench("two_mm", size="small")
+    mod = sch.build(configs=configs)
+    out = mod(*inputs)
+    np.testing.assert_allclose(out, expected, rtol=1e-4, atol=1e-4)
+    if "target_cpu" in configs:
+        assert '"target-cpu", "x86-64"' in str(mod.module)
+
+
+@pytest.mark.parametrize("num_threads", [1, 2, 4])
+def test_llvm_parallel(num_threads):
+    def gemm(A: float32[128, 128], B: float32[128, 128]) -> float32[128, 128]:
+        C: float32[128, 128] = 0.0
+        for i, j, k in allo.grid(128, 128, 128):
+            C[i, j] += A[i, k] * B[k, j]
+        return C
+
+    def two_mm(
+        A: float32[64, 32], B: float32[32, 48], C: float32[48, 64]
+    ) -> float32[64, 64]:
+        tmp: float32[64, 48] = 0.0
+        for i, j, k in allo.grid(64, 48, 32, name="mm1"):
+            tmp[i, j] += A[i, k] * B[k, j]
+        D: float32[64, 64] = 0.0
+        for i, j, k in allo.grid(64, 64, 48, name="mm2"):
+            D[i, j] += tmp[i, k] * C[k, j]
+        return D
+
+    def jacobi(A: float32[256, 256]) -> float32[256, 256]:
+        B: float32[256, 256] = 0.0
+        for i, j in allo.grid(254, 254):
+            B[i + 1, j + 1] = 0.2 * (
+                A[i + 1, j + 1]
+                + A[i, j + 1]
+                + A[i + 2, j + 1]
+                + A[i + 1, j]
+                + A[i + 1, j + 2]
+            )
+        return B
+
+    configs = {"num_threads": num_threads}
+    s = allo.customize(gemm)
+    mod = s.build()
+    assert mod.num_parallel_loops == 0
+    assert "omp.wsloop" not in str(mod.intermediate_module)
+    s.parallel("i")
+    mod = s.build(configs=configs)
+    assert mod.num_parallel_loops == 1
+    assert "omp.wsloop" in str(mod.intermediate_module)
+    np_A = np.random.random((128, 128)).astype(np.float32)
+    np_B = np.random.random((128, 128)).astype(np.float32)
+    np.testing.assert_allclose(mod(np_A, np_B), np_A @ np_B, rtol=1e-4)
+    # the loops marked by .parallel() can also run sequentially
+    mod = s.build(configs={"parallel": False})
+    assert mod.num_parallel_loops == 0
+    assert "omp.wsloop" not in str(mod.intermediate_module)
+
+    s = allo.customize(two_mm)
+    loops = s.get_loops()
+    s.parallel(loops.mm1.i)
+    s.parallel(loops.mm2.i)
+    mod = s.build(configs=configs)
+    assert mod.num_parallel_loops == 2
+    assert str(mod.intermediate_module).count("omp.wsloop") == 2
+    np_A = np.random.random((64, 32)).astype(np.float32)
+    np_B = np.random.random((32, 48)).astype(np.float32)
+    np_C = np.random.random((48, 64)).astype(np.float32)
+    np.testing.assert_allclose(mod(np_A, np_B, np_C), np_A @ np_B @ np_C, rtol=1e-4)
+
+    s = allo.customize(jacobi)
+    mod = s.build(configs=configs)
+    assert "omp.wsloop" not in str(mod.intermediate_module)
+    mod = s.build(configs={**configs, "auto_parallel": True})
+    # no loop is marked, but the stencil is found to be parallel
+    assert mod.num_parallel_loops == 0
+    assert "omp.wsloop" in str(mod.intermediate_module)
+    np_A = np.random.random((256, 256)).astype(np.float32)
+    golden = np.zeros_like(np_A)
+    golden[1:-1, 1:-1] = 0.2 * (
+        np_A[1:-1, 1:-1]
+        + np_A[:-2, 1:-1]
+        + np_A[2:, 1:-1]
+        + np_A[1:-1, :-2]
+        + np_A[1:-1, 2:]
+    )
+    np.testing.assert_allclose(mod(np_A), golden, rtol=1e-5)
+
+
+@pytest.mark.parametrize("target", ["llvm", "cpp"])
+def test_llvm_out_params(target):
+    def kernel(A: float32[16, 16], B: float32[16, 16]) -> float32[16, 16]:
+        C: float32[16, 16] = 0.0
+        for i, j in allo.grid(16, 16):
+            C[i, j] = A[i, j] + B[i, j]
+        return C
+
+    def two_outputs(A: int32[8]) -> (int32[8], int32[8]):
+        B: int32[8] = 0
+        C: int32[8] = 0
+        for i in range(8):
+            B[i] = A[i] + 1
+            C[i] = A[i] * 2
+        return B, C
+
+    s = allo.customize(kernel)
+    mod = s.build(target=target)
+    assert mod.out_params
+    np_A = np.random.random((16, 16)).astype(np.float32)
+    np_B = np.random.random((16, 16)).astype(np.float32)
+    np.testing.assert_allclose(mod(np_A, np_B), np_A + np_B, rtol=1e-5)
+    np_C = np.zeros((16, 16), dtype=np.float32)
+    res = mod(np_A, np_B, out=np_C)
+    assert res is np_C
+    np.testing.assert_allclose(np_C, np_A + np_B, rtol=1e-5)
+    with pytest.raises(ValueError):
+        mod(np_A, np_B, out=np.zeros((16, 16), dtype=np.float64))
+    # the pooled outputs are reused across calls
+    mod = s.build(target=target, configs={"reuse_outputs": True})
+    res1 = mod(np_A, np_B)
+    res2 = mod(np_B, np_B)
+    assert res1 is res2
+    np.testing.assert_allclose(res2, np_B + np_B, rtol=1e-5)
+    # the kernel-allocated results are copied and freed
+    mod = s.build(target=target, configs={"out_params": False})
+    assert not mod.out_params
+    for _ in range(3):
+        np.testing.assert_allclose(mod(np_A, np_B), np_A + np_B, rtol=1e-5)
+
+    s = allo.customize(two_outputs)
+    mod = s.build(target=target)
+    np_A = np.arange(8, dtype=np.int32)
+    outs = [np.zeros(8, dtype=np.int32), np.zeros(8, dtype=np.int32)]
+    mod(np_A, out=outs)
+    np.testing.assert_array_equal(outs[0], np_A + 1)
+    np.testing.assert_array_equal(outs[1], np_A * 2)
+
+
+@pytest.mark.parametrize("name", ["two_mm", "three_mm"])
+def test_cpp_polybench(name):
+    sch, inputs, expected = get_polybench(name, size="small")
+    llvm_mod = sch.build()
+    cpp_mod = sch.build(target="cpp")
+    results = [mod(*inputs) for mod in [llvm_mod, cpp_mod]]
+    np.testing.assert_allclose(results[1], results[0], rtol=1e-4, atol=1e-4)
+    np.testing.assert_allclose(results[1], expected, rtol=1e-4, atol=1e-4)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -46,6 +46,31 @@ def test_use_def_chain_array():
     assert s.get_equivalent_variables("kernel:0") == set(["kernel:0", "gemm:0"])
 
 
+def test_use_def_index():
+    def kernel(A: int32[32, 32]) -> int32[32, 32]:
+        B: int32[32, 32] = 0
+        for i, j in allo.grid(32, 32):
+            B[i, j] = A[i, j] + 1
+        return B
+
+    def top(A: int32[32, 32]) -> int32[32, 32]:
+        C = kernel(A)
+        D = kernel(C)
+        return D
+
+    s = allo.customize(top)
+    index = s.get_use_def_index()
+    # cached until the next primitive
+    assert s.get_use_def_index() is index
+    _, idx, op = index.find_buffer("kernel", "B")
+    assert idx == 1 and op.attributes["name"].value == "B"
+    assert index.find_buffer("top", "A")[1] == 0
+    assert [name for name, _ in index.get_callers("kernel")] == ["top", "top"]
+    assert {"top:C", "kernel:0", "top:D"} <= s.get_equivalent_variables("top:C")
+    s.partition(s.A, dim=1)
+    assert s.get_use_def_index() is not index
+
+
 def test_nested_functions():
     M, K, N = 32, 32, 32
 
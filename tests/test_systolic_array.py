@@ -598,6 +598,9 @@ def test_three_level_systolic():
 
     s = allo.customize(gemm)
     buf_A = s.buffer_at(s.A, "i")
+    # the FIFO buffer is visible to the later lookups
+    _, _, fifo = s.get_use_def_index().find_buffer("gemm", "A_fifo")
+    assert fifo.attributes["name"].value == "A_fifo"
     buf_B = s.buffer_at(s.B, "j")
     pe = s.unfold("PE", [0, 1])
     s.partition(s.C, dim=0)
@@ -2,9 +2,11 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import allo
-from allo.ir.types import int32
+from allo.ir.types import int32, float32
 from allo.ir.transform import find_loop_in_bands
 from allo.passes import analyze_arg_load_store_in_func, analyze_arg_load_store
+from allo.ir.utils import get_global_vars, get_source
+import allo.library.nn as nn
 import pytest
 
 
@@ -111,5 +113,31 @@ def test_traceback():
         s = allo.customize(long_kernel)
 
 
+def test_lazy_global_vars():
+    M = 16
+
+    def kernel(A: int32[M]) -> int32[M]:
+        B: int32[M] = 0
+        for i in range(M):
+            B[i] = A[i] + 1
+        return B
+
+    global_vars = get_global_vars(kernel)
+    # only referenced names are captured
+    assert global_vars["M"] == M and global_vars["int32"] is int32
+    assert "pytest" not in global_vars and "find_loop_in_bands" not in global_vars
+    # source code is cached per code object
+    assert get_source(kernel)[0].startswith("def kernel")
+
+    def top(X: float32[M, M]) -> float32[M, M]:
+        return nn.relu2d[float32, M, M](X)
+
+    # globals of the called library functions are also captured
+    global_vars = get_global_vars(top)
+    assert "nn" in global_vars and "dsl" in global_vars
+    s = allo.customize(top)
+    assert "relu2d" in str(s.module)
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
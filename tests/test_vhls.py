@@ -6,7 +6,7 @@ import allo
 from allo.ir.types import bool, int32, float32
 import numpy as np
 import allo.backend.hls as hls
-from allo.passes import generate_input_output_buffers
+from allo.passes import generate_input_output_buffers, generate_tiled_io_buffers
 
 
 @pytest.mark.parametrize("flatten", [True, False])
@@ -269,6 +269,163 @@ def test_wrap_nonvoid(flatten):
     print("Passed!")
 
 
+def test_wrap_packed():
+    M, N = 16, 4
+
+    def matrix_add(A: float32[M, N]) -> float32[M, N]:
+        B: float32[M, N]
+        for i, j in allo.grid(M, N, name="PE"):
+            B[i, j] = A[i, j] + 1
+        return B
+
+    s = allo.customize(matrix_add)
+    generate_input_output_buffers(s.module, "matrix_add", flatten=True, bus_width=512)
+    module = str(s.module)
+    # 64 float32 elements are packed into 4 512-bit words
+    assert "func.func @matrix_add(%arg0: memref<4xi512>) -> memref<4xi512>" in module
+    assert (
+        "func.func @load_buf0(%arg0: memref<4xi512>, %arg1: memref<16x4xf32>)" in module
+    )
+    assert (
+        "func.func @store_res1(%arg0: memref<16x4xf32>, %arg1: memref<4xi512>)"
+        in module
+    )
+
+    s = allo.customize(matrix_add)
+    mod = s.build(target="vitis_hls", configs={"bus_width": 512})
+    assert "ap_uint<512>" in mod.hls_code
+    assert "#pragma HLS unroll" in mod.hls_code
+    # the element type cannot be packed into 24-bit words
+    s = allo.customize(matrix_add)
+    generate_input_output_buffers(s.module, "matrix_add", flatten=True, bus_width=24)
+    assert "memref<64xf32>" in str(s.module)
+
+
+def test_wrap_tiled():
+    def gemm(A: int32[32, 32], B: int32[32, 32]) -> int32[32, 32]:
+        C: int32[32, 32] = 0
+        for i, j, k in allo.grid(32, 32, 32, name="C"):
+            C[i, j] += A[i, k] * B[k, j]
+        return C
+
+    s = allo.customize(gemm)
+    assert generate_tiled_io_buffers(s.module, "gemm", tile_size=8) == 8
+    module = str(s.module)
+    # A and C are tiled by rows, while B is loaded once
+    assert (
+        "func.func @gemm_tile(%arg0: memref<8x32xi32>, %arg1: memref<32x32xi32>, %arg2: memref<8x32xi32>)"
+        in module
+    )
+    assert (
+        "func.func @load_buf1(%arg0: memref<1024xi32>, %arg1: memref<32x32xi32>)"
+        in module
+    )
+    assert (
+        "func.func @load_tile0(%arg0: memref<1024xi32>, %arg1: memref<8x32xi32>, %arg2: index)"
+        in module
+    )
+    assert (
+        "func.func @store_tile2(%arg0: memref<8x32xi32>, %arg1: memref<1024xi32>, %arg2: index)"
+        in module
+    )
+    assert (
+        "func.func @gemm(%arg0: memref<1024xi32>, %arg1: memref<1024xi32>) -> memref<1024xi32>"
+        in module
+    )
+    assert "dataflow" in module
+
+    s = allo.customize(gemm)
+    mod = s.build(target="vitis_hls", configs={"io_tile": True})
+    assert "#pragma HLS dataflow" in mod.hls_code
+
+    def transpose(A: int32[32, 32]) -> int32[32, 32]:
+        B: int32[32, 32] = 0
+        for i, j in allo.grid(32, 32):
+            B[j, i] = A[i, j]
+        return B
+
+    s = allo.customize(transpose)
+    module = str(s.module)
+    assert generate_tiled_io_buffers(s.module, "transpose", tile_size=8) is None
+    assert str(s.module) == module
+
+
+def test_vitis_connectivity():
+    def gemm(A: int32[32, 32], B: int32[32, 64]) -> int32[32, 64]:
+        C: int32[32, 64] = 0
+        for i, j, k in allo.grid(32, 64, 32, name="C"):
+            C[i, j] += A[i, k] * B[k, j]
+        return C
+
+    s = allo.customize(gemm)
+    mod = s.build(
+        target="vitis_hls",
+        mode="sw_emu",
+        project="gemm_connectivity.prj",
+        configs={"device": "u280", "connectivity": "auto"},
+    )
+    # every argument gets its own pseudo-channel
+    assert sorted(mod.vitis.memory_banks.values()) == ["HBM[0]", "HBM[1]", "HBM[2]"]
+    with open("gemm_connectivity.prj/description.json", "r", encoding="utf-8") as f:
+        desc = f.read()
+    for arg, bank in mod.vitis.memory_banks.items():
+        assert f"--connectivity.sp gemm_1.{arg}:{bank}" in desc
+
+    # the largest arguments are spread first
+    traffic = {"v0": 4096, "v1": 8192, "v2": 8192, "v3": 1024}
+    assignment = hls.assign_memory_banks(traffic, ["DDR[0]", "DDR[1]"])
+    assert assignment == {
+        "v1": "DDR[0]",
+        "v2": "DDR[1]",
+        "v0": "DDR[0]",
+        "v3": "DDR[1]",
+    }
+    assignment = hls.assign_memory_banks(
+        traffic, ["DDR[0]", "DDR[1]"], fixed={"v1": "DDR[1]"}
+    )
+    assert assignment["v1"] == "DDR[1]" and assignment["v2"] == "DDR[0]"
+
+
+def test_vitis_multi_cu():
+    def gemm(A: int32[16, 32], B: int32[32, 32]) -> int32[16, 32]:
+        C: int32[16, 32] = 0
+        for i, j, k in allo.grid(16, 32, 32, name="C"):
+            C[i, j] += A[i, k] * B[k, j]
+        return C
+
+    s = allo.customize(gemm)
+    # A and C are split by rows, while B is broadcast to both compute units
+    mod = s.build(
+        target="vitis_hls",
+        mode="sw_emu",
+        project="gemm_multi_cu.prj",
+        configs={
+            "device": "u280",
+            "num_cu": 2,
+            "cu_split": [0, 2],
+            "connectivity": "auto",
+        },
+    )
+    # each compute unit has its own pseudo-channels
+    banks = [bank for cu_banks in mod.vitis.memory_banks.values() for bank in cu_banks]
+    assert len(set(banks)) == 6
+    with open("gemm_multi_cu.prj/description.json", "r", encoding="utf-8") as f:
+        desc = f.read()
+    assert "--connectivity.nk gemm:2" in desc
+    for arg, cu_banks in mod.vitis.memory_banks.items():
+        for cu, bank in enumerate(cu_banks):
+            assert f"--connectivity.sp gemm_{cu + 1}.{arg}:{bank}" in desc
+    assert "CL_QUEUE_OUT_OF_ORDER_EXEC_MODE_ENABLE" in mod.host_code
+    assert "data_in0.begin() + c * 512" in mod.host_code
+    assert "data_in1.begin() + 0" in mod.host_code
+    if hls.is_available("vitis_hls"):
+        np_A = np.random.randint(0, 10, size=(32, 32)).astype(np.int32)
+        np_B = np.random.randint(0, 10, size=(32, 32)).astype(np.int32)
+        np_C = np.zeros((32, 32), dtype=np.int32)
+        mod(np_A, np_B, np_C)
+        np.testing.assert_allclose(np_C, np_A @ np_B, atol=1e-6)
+
+
 def test_ihls():
     def top(A: int32[1]) -> int32[1]:
         A[0] = A[0] + 1